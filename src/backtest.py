@@ -0,0 +1,78 @@
+import argparse, os, sys, time, yaml
+from datetime import datetime
+from modules.core import app_state, get_config_key, ENERGY_CONFIG_KEY, OperationMode, Triggers
+from modules.energy import EnergyStore
+from modules.schedule import Battery, BacktestResult, load_history, get_template_modes, run_backtest
+
+_DATA_DIR_CONFIG_KEY = 'data_dir'
+_SECRET_CONFIG_KEY = 'secret'
+_DATABASE_FILE_CONFIG_KEY = 'database_file'
+
+_DATA_DIR_ENV_NAME = 'HBRE_DATA_DIR'
+_SECRET_ENV_NAME = 'HBRE_SECRET'
+
+_MODE_LETTERS = {'i': OperationMode.IDLE, 'c': OperationMode.CHARGE, 'd': OperationMode.DISCHARGE, 'p': OperationMode.PROTECT}
+
+def print_result(result: BacktestResult):
+    print(f'Range: {Triggers.get_slot_timestamp(result.start):%Y-%m-%d %H:%M} - {Triggers.get_slot_timestamp(result.end):%Y-%m-%d %H:%M}')
+    print(f'Quarters: charge {result.charge_quarters}, discharge {result.discharge_quarters}, '
+          f'discharge below minimum margin {result.below_margin_quarters}, without price {result.unpriced_quarters}')
+    print('           | charger [Wh] | inverter [Wh] | solar [Wh] |   cost [€] | revenue [€] | profit [€]')
+    for name, totals in (('simulated', result.simulated), ('recorded', result.recorded)):
+        print(f'{name:10} | {totals.charger_energy:12.0f} | {totals.inverter_energy:13.0f} | {totals.solar_energy:10.0f} | '
+              f'{totals.cost:10.4f} | {totals.revenue:11.4f} | {totals.profit:10.4f}')
+    print(f'Stored energy at the end: {result.energy:.0f} Wh; average charged price: {result.avg_charged_price * 100:.2f} ct/kWh')
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays the schedule template against the recorded prices and energy statistics.')
+    parser.add_argument('-c', '--config', type=str, required=True, help="Path to config file.")
+    parser.add_argument('--start', type=str, help='First quarter, ISO format, e.g. 2024-06-01T00:00; default: first record.')
+    parser.add_argument('--end', type=str, help='End of the range (exclusive), ISO format; default: after the last record.')
+    parser.add_argument('--template', type=str, help='Template to test instead of the saved one, one letter per quarter: '
+                        'i(dle), c(harge), d(ischarge) or p(rotect); padded with idle to a full day like in the app.')
+    parser.add_argument('--capacity', type=int, help='Battery capacity in Wh; default: battery -> capacity.')
+    parser.add_argument('--charge-power', type=int, help='Charge power in W; default: battery -> charge_power.')
+    parser.add_argument('--discharge-power', type=int, help='Discharge power in W; default: battery -> discharge_power.')
+    parser.add_argument('--respect-margin', action='store_true', help='Skip discharging if the margin is below the minimum margin.')
+    args = parser.parse_args()
+
+    with open(args.config, "r") as stream:
+        config = yaml.safe_load(stream)
+
+    secret = get_config_key(config, str, _SECRET_ENV_NAME, _SECRET_CONFIG_KEY)
+    data_path = get_config_key(config, str, _DATA_DIR_ENV_NAME, _DATA_DIR_CONFIG_KEY)
+    app_state.load(secret, config, os.path.join(data_path, 'homebattery_remote_instance_data.json'))
+
+    battery = Battery.from_config(config) or Battery(0, 0, 0)
+    battery = Battery(
+        args.capacity if args.capacity is not None else battery.capacity,
+        args.charge_power if args.charge_power is not None else battery.charge_power,
+        args.discharge_power if args.discharge_power is not None else battery.discharge_power)
+    if battery.capacity <= 0:
+        sys.exit('Battery capacity is unknown, set battery -> capacity in the config file or use --capacity.')
+
+    if args.template:
+        template = tuple(_MODE_LETTERS[x] for x in args.template.lower() if x in _MODE_LETTERS)
+    else:
+        template = app_state.data.template.value
+
+    store = EnergyStore(get_config_key(config, str, None, ENERGY_CONFIG_KEY, _DATABASE_FILE_CONFIG_KEY))
+    if (bounds := store.get_bounds()) is None:
+        store.close()
+        sys.exit('The energy database is empty.')
+    start = Triggers.get_slot(datetime.fromisoformat(args.start)) if args.start else bounds[0]
+    end = Triggers.get_slot(datetime.fromisoformat(args.end)) if args.end else bounds[1] + 1
+    history = load_history(store, start, end)
+    store.close()
+
+    start_time = time.perf_counter()
+    result = run_backtest(history, get_template_modes(template, start, end), battery,
+        app_state.data.charger_efficiency.value, app_state.data.inverter_efficiency.value,
+        app_state.data.minimum_margin.value, args.respect_margin)
+    duration = time.perf_counter() - start_time
+
+    print_result(result)
+    print(f'{end - start} quarters evaluated in {duration * 1000:.1f} ms.')
+
+if __name__ == "__main__":
+    main()
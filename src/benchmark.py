@@ -0,0 +1,233 @@
+import argparse, timeit
+
+def benchmark_dispatch(args):
+    from modules.uplink.singlecontroller import SUBSCRIBED_TOPICS
+    from modules.uplink.topictrie import TopicTrie, topic_matches
+
+    print('controllers | linear filter scan [us/msg] | topic trie [us/msg]')
+    for fleet_size in args.fleet_sizes:
+        filters = [f'homebattery/controller{i}/{suffix}' for i in range(fleet_size) for suffix, _ in SUBSCRIBED_TOPICS]
+        trie: TopicTrie[str] = TopicTrie()
+        for filter in filters:
+            trie.add(filter, filter)
+        # worst case for the linear scan: a message of the last controller
+        topic = filters[-1]
+
+        def linear():
+            return [x for x in filters if topic_matches(x, topic)]
+
+        def indexed():
+            return trie.match(topic)
+
+        assert linear() == indexed()
+        linear_time = min(timeit.repeat(linear, number=args.iterations, repeat=3)) / args.iterations
+        indexed_time = min(timeit.repeat(indexed, number=args.iterations, repeat=3)) / args.iterations
+        print(f'{fleet_size:11} | {linear_time * 1e6:27.2f} | {indexed_time * 1e6:19.2f}')
+
+def benchmark_schedule_view(args):
+    import random
+    from decimal import Decimal
+    from modules.core import OperationMode, Schedule, Triggers, SCHEDULE_LENGTH
+    from modules.core.fixedpoint import PRICE_SCALE, div_half_even, to_fixed
+    from modules.gui.models.schedulemodel import ScheduleRow
+    from modules.gui.models.scheduleview import render_schedule_rows
+    from modules.price import PriceSnapshot, PriceStats, Prices
+
+    start = Triggers.get_current_slot()
+    modes = tuple(OperationMode)
+    schedule = Schedule.empty(SCHEDULE_LENGTH).expanded(start, [random.choice(modes) for _ in range(96)])
+    prices = tuple(Prices(charge=div_half_even(x, 900_000) * 1_000_000, discharge=x)
+                   for x in (to_fixed(round(Decimal(random.uniform(0.1, 0.4)), 4), PRICE_SCALE) for _ in range(SCHEDULE_LENGTH)))
+    charge = tuple(x.charge for x in prices)
+    discharge = tuple(x.discharge for x in prices)
+    snapshot = PriceSnapshot(start, prices, charge, discharge, PriceStats.from_values(list(charge)), PriceStats.from_values(list(discharge)))
+    avg_charged_price = Decimal('0.2')
+    min_margin = Decimal('0.05')
+
+    print('clients | render per client [ms/change] | shared render [ms/change]')
+    for client_count in args.client_counts:
+        clients = [[ScheduleRow() for _ in range(SCHEDULE_LENGTH)] for _ in range(client_count)]
+
+        def per_client():
+            for client in clients:
+                for row, view_row in zip(client, render_schedule_rows(schedule, snapshot, avg_charged_price, min_margin)):
+                    row.show(view_row, view_row.mode)
+
+        def shared():
+            view_rows = render_schedule_rows(schedule, snapshot, avg_charged_price, min_margin)
+            for client in clients:
+                for row, view_row in zip(client, view_rows):
+                    row.show(view_row, view_row.mode)
+
+        iterations = max(1, args.iterations // 100)
+        per_client_time = min(timeit.repeat(per_client, number=iterations, repeat=3)) / iterations
+        shared_time = min(timeit.repeat(shared, number=iterations, repeat=3)) / iterations
+        print(f'{client_count:7} | {per_client_time * 1e3:29.2f} | {shared_time * 1e3:25.2f}')
+
+def benchmark_logging(args):
+    import logging, os, queue, tempfile
+    from logging.handlers import QueueListener
+    from types import SimpleNamespace
+    from modules.core.logging import JsonFormatter, LogQueueHandler, ModuleFilter
+    from modules.uplink.singlecontroller import SingleController
+
+    class FakeMqtt:
+        use_wildcard_subscriptions = True
+        def __init__(self):
+            self.routes = {}
+        def add_route(self, topic, callback):
+            self.routes[topic] = callback
+
+    mqtt = FakeMqtt()
+    controller = SingleController({'homebattery': {'bench': {'root': 'homebattery/bench'}}}, mqtt, 'bench')
+    controller.subscribe_battery(lambda *_: None)
+    controller.subscribe_charger(lambda *_: None)
+    battery_message = SimpleNamespace(payload=b'{"capacity": 123.4}')
+    charger_message = SimpleNamespace(payload=b'{"energy": 42}')
+    on_battery = mqtt.routes['homebattery/bench/bat/sum']
+    on_charger = mqtt.routes['homebattery/bench/cha/sum']
+
+    def handle():
+        on_battery(battery_message)
+        on_charger(charger_message)
+
+    logger = logging.getLogger()
+    with tempfile.TemporaryDirectory() as directory:
+        print('level | output                     | handler time [us/msg]')
+        for level in (logging.INFO, logging.DEBUG):
+            for name, use_queue, formatter in (
+                    ('file, synchronous', False, logging.Formatter('%(asctime)s %(levelname)s: %(message)s')),
+                    ('file, queue', True, logging.Formatter('%(asctime)s %(levelname)s: %(message)s')),
+                    ('file, queue, json lines', True, JsonFormatter())):
+                file_handler = logging.FileHandler(os.path.join(directory, 'bench.log'))
+                file_handler.setFormatter(formatter)
+                listener = None
+                if use_queue:
+                    log_queue = queue.SimpleQueue()
+                    handler = LogQueueHandler(log_queue)
+                    listener = QueueListener(log_queue, file_handler)
+                    listener.start()
+                else:
+                    handler = file_handler
+                handler.addFilter(ModuleFilter())
+                logger.setLevel(level)
+                logger.addHandler(handler)
+                try:
+                    # two messages per call
+                    duration = min(timeit.repeat(handle, number=args.iterations, repeat=3)) / (2 * args.iterations)
+                finally:
+                    logger.removeHandler(handler)
+                    if listener:
+                        listener.stop()
+                    file_handler.close()
+                print(f'{logging.getLevelName(level):5} | {name:26} | {duration * 1e6:21.2f}')
+
+def benchmark_fixedpoint(args):
+    import random
+    from decimal import Decimal
+    from modules.core.fixedpoint import CAPACITY_SCALE, PRICE_SCALE, div_half_even, fixed_formatter, to_fixed
+
+    raw_prices = [round(Decimal(random.uniform(-0.1, 0.5)), 4) for _ in range(192)]
+    prices = [to_fixed(x, PRICE_SCALE) for x in raw_prices]
+    efficiency_factor = Decimal('0.9') * Decimal('0.95')
+    efficiency_units = 900 * 950
+    avg_price = Decimal('0.2345678901')
+    avg_price_units = to_fixed(avg_price, PRICE_SCALE)
+    margin = Decimal('0.05')
+    margin_units = to_fixed(margin, PRICE_SCALE)
+    capacity = Decimal('123.4')
+    delta = Decimal('1.3')
+    capacity_units = to_fixed(capacity, CAPACITY_SCALE)
+    delta_units = to_fixed(delta, CAPACITY_SCALE)
+    charger_energy, total_energy = 1234, 1567
+
+    def decimal_charge_prices():
+        return [round(x / efficiency_factor, 4) for x in raw_prices]
+
+    def fixed_charge_prices():
+        return [div_half_even(x, efficiency_units) * 1_000_000 for x in prices]
+
+    format_cents = fixed_formatter(PRICE_SCALE // 100, 2)
+
+    def decimal_rows():
+        return [(f'{(x * Decimal(100)):.2f}', f'{((x - avg_price) * 100):.2f}' if (x - avg_price) >= margin else '') for x in raw_prices]
+
+    def fixed_rows():
+        return [(format_cents(x), format_cents(x - avg_price_units)
+                 if (x - avg_price_units) >= margin_units else '') for x in prices]
+
+    def decimal_avg_price():
+        effective_price = raw_prices[0] * Decimal(round(charger_energy / total_energy, 10))
+        return round((capacity * avg_price + delta * effective_price) / (capacity + delta), 10)
+
+    def fixed_avg_price():
+        effective_price = prices[0] * div_half_even(charger_energy * 10 ** 10, total_energy)
+        worth = capacity_units * avg_price_units * 10 ** 10 + delta_units * effective_price
+        return div_half_even(worth, (capacity_units + delta_units) * 10 ** 10)
+
+    assert decimal_charge_prices() == [Decimal(x) / PRICE_SCALE for x in fixed_charge_prices()]
+    assert decimal_rows() == fixed_rows()
+    assert decimal_avg_price() == Decimal(fixed_avg_price()) / PRICE_SCALE
+
+    print('operation              | decimal [us] | fixed point [us] | speedup')
+    for name, decimal_function, fixed_function in (
+            ('192 charge prices', decimal_charge_prices, fixed_charge_prices),
+            ('192 formatted rows', decimal_rows, fixed_rows),
+            ('avg charged price', decimal_avg_price, fixed_avg_price)):
+        decimal_time = min(timeit.repeat(decimal_function, number=args.iterations, repeat=3)) / args.iterations
+        fixed_time = min(timeit.repeat(fixed_function, number=args.iterations, repeat=3)) / args.iterations
+        print(f'{name:22} | {decimal_time * 1e6:12.2f} | {fixed_time * 1e6:16.2f} | {decimal_time / fixed_time:6.1f}x')
+
+def benchmark_optimizer(args):
+    import math, numpy as np
+    from modules.core import SCHEDULE_LENGTH
+    from modules.schedule import Battery
+    from modules.schedule.optimizer import optimize_modes, _LEVELS_PER_STEP, _MAX_LEVELS
+
+    prices = np.array([0.25 + 0.1 * math.sin(x / (24 * 4) * 2 * math.pi) for x in range(SCHEDULE_LENGTH)])
+    forced = [None] * SCHEDULE_LENGTH
+
+    # the cost depends on the number of energy levels, which grows with the capacity per charge or discharge quarter
+    print('capacity [Wh] | power [W] | levels | optimization [ms]')
+    for capacity in args.capacities:
+        for power in args.powers:
+            battery = Battery(capacity, power, power)
+            step = min(battery.charge_energy * 0.9, battery.discharge_energy / 0.9) / _LEVELS_PER_STEP
+            levels = min(_MAX_LEVELS, math.ceil(capacity / step))
+
+            def optimize():
+                return optimize_modes(prices, forced, capacity / 2, battery, 0.9, 0.9, 0.05)
+
+            iterations = max(1, args.iterations // 100)
+            duration = min(timeit.repeat(optimize, number=iterations, repeat=3)) / iterations
+            print(f'{capacity:13} | {power:9} | {levels:6} | {duration * 1e3:17.2f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro benchmarks for homebatteryremote.')
+    parser.add_argument('-n', '--iterations', type=int, default=1000, help="Iterations per measurement.")
+    subparsers = parser.add_subparsers(required=True)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help='MQTT message dispatch cost against fleet size.')
+    dispatch_parser.add_argument('fleet_sizes', type=int, nargs='*', default=[1, 10, 100, 500, 1000])
+    dispatch_parser.set_defaults(func=benchmark_dispatch)
+
+    schedule_view_parser = subparsers.add_parser('schedule_view', help='Schedule page refresh cost against number of connected clients.')
+    schedule_view_parser.add_argument('client_counts', type=int, nargs='*', default=[1, 2, 5, 10, 20])
+    schedule_view_parser.set_defaults(func=benchmark_schedule_view)
+
+    logging_parser = subparsers.add_parser('logging', help='Cost of logging in the MQTT message handlers per log level and output.')
+    logging_parser.set_defaults(func=benchmark_logging)
+
+    optimizer_parser = subparsers.add_parser('optimizer', help='Schedule optimization cost against battery size and power.')
+    optimizer_parser.add_argument('capacities', type=int, nargs='*', default=[1000, 5000, 20000, 100000])
+    optimizer_parser.add_argument('--powers', type=int, nargs='+', default=[1000, 5000, 20000], help='Charge and discharge powers [W].')
+    optimizer_parser.set_defaults(func=benchmark_optimizer)
+
+    fixedpoint_parser = subparsers.add_parser('fixedpoint', help='Decimal against fixed point arithmetic for prices.')
+    fixedpoint_parser.set_defaults(func=benchmark_fixedpoint)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
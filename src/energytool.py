@@ -0,0 +1,71 @@
+import argparse, sys
+from datetime import datetime
+from modules.core import Triggers
+from modules.energy import EnergyStore
+
+def export_csv(args):
+    store = EnergyStore(args.database)
+    start = Triggers.get_slot(datetime.fromisoformat(args.start)) if args.start else 0
+    end = Triggers.get_slot(datetime.fromisoformat(args.end)) if args.end else sys.maxsize
+    if args.output:
+        with open(args.output, 'w', newline='') as stream:
+            count = store.export_csv(stream, start, end)
+        print(f'Exported {count} records to {args.output}.')
+    else:
+        store.export_csv(sys.stdout, start, end)
+    store.close()
+
+def show_totals(args):
+    store = EnergyStore(args.database)
+    if args.start:
+        start = Triggers.get_slot(datetime.fromisoformat(args.start))
+    elif (bounds := store.get_bounds()) is not None:
+        start = bounds[0]
+    else:
+        store.close()
+        sys.exit('The energy database is empty.')
+    end = Triggers.get_slot(datetime.fromisoformat(args.end)) if args.end else Triggers.get_current_slot() + 1
+    rows = store.get_rollups(args.by, start, end) if args.by else [(start, store.get_totals(start, end))]
+    store.close()
+    print('start            | charger [Wh] | inverter [Wh] | solar [Wh] |     cost [€] |  revenue [€] | quarters')
+    for slot, totals in rows:
+        print(f'{Triggers.get_slot_timestamp(slot):%Y-%m-%d %H:%M} | {totals.charger_energy:12} | {totals.inverter_energy:13} | '
+              f'{totals.solar_energy:10} | {totals.cost:12.4f} | {totals.revenue:12.4f} | {totals.quarters:8}')
+
+def import_csv(args):
+    store = EnergyStore(args.database)
+    count = store.import_csv(args.csv)
+    store.close()
+    if count is None:
+        print('A csv file was already imported into this database.')
+    else:
+        print(f'Imported {count} records from {args.csv}.')
+
+def main():
+    parser = argparse.ArgumentParser(description='Export and import of homebatteryremote energy statistics.')
+    subparsers = parser.add_subparsers(required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export energy records as csv.')
+    export_parser.add_argument('database', type=str, help='Path to the energy database.')
+    export_parser.add_argument('-o', '--output', type=str, help='Path to csv file; default: stdout.')
+    export_parser.add_argument('--start', type=str, help='First quarter to export, ISO format, e.g. 2024-06-01T00:00.')
+    export_parser.add_argument('--end', type=str, help='End of the export (exclusive), ISO format.')
+    export_parser.set_defaults(func=export_csv)
+
+    totals_parser = subparsers.add_parser('totals', help='Show energy, cost and revenue totals.')
+    totals_parser.add_argument('database', type=str, help='Path to the energy database.')
+    totals_parser.add_argument('--start', type=str, help='First quarter, ISO format, e.g. 2024-06-01T00:00; default: first record.')
+    totals_parser.add_argument('--end', type=str, help='End of the range (exclusive), ISO format; default: now.')
+    totals_parser.add_argument('--by', choices=('hour', 'day', 'month'), help='Show one line per hour, day or month.')
+    totals_parser.set_defaults(func=show_totals)
+
+    import_parser = subparsers.add_parser('import', help='One time import of a csv file written by former versions.')
+    import_parser.add_argument('database', type=str, help='Path to the energy database.')
+    import_parser.add_argument('csv', type=str, help='Path to the csv file.')
+    import_parser.set_defaults(func=import_csv)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
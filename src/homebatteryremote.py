@@ -2,7 +2,7 @@ import argparse, yaml, logging, os
 from modules.core import setup_log, app_state, get_config_key, triggers, password_hasher
 from modules.energy import EnergyTracker, CapacityTracker
 from modules.price import PriceSource
-from modules.schedule import Scheduler
+from modules.schedule import Battery, Scheduler, ScheduleOptimizer
 from modules.uplink import Mqtt, VirtualController
 
 __version__ = "1.0.0"
@@ -33,8 +33,9 @@ def main():
 
     mqtt = Mqtt(config)
     virtual_controller = VirtualController(config, mqtt)
-    prices = PriceSource()
+    prices = PriceSource(config, os.path.join(data_path, 'homebattery_remote_price_cache.json'))
     scheduler = Scheduler(virtual_controller)
+    optimizer = ScheduleOptimizer(config, prices)
     capacity_tracker = CapacityTracker(virtual_controller, prices)
     energy_tracker = EnergyTracker(config, virtual_controller, prices)
 
@@ -43,17 +44,26 @@ def main():
     os.environ['NICEGUI_STORAGE_PATH'] = os.path.join(data_path, 'sessions')
     from modules.gui import singletons, Gui
 
-    singletons.set(virtual_controller, prices)
+    singletons.set(virtual_controller, prices, energy_tracker, Battery.from_config(config), optimizer)
     gui = Gui(config)
 
     def start():
+        app_state.start()
         mqtt.start()
         scheduler.start()
+        optimizer.start()
         prices.start()
+        energy_tracker.start()
         triggers.start()
+
+    async def stop():
+        await prices.stop()
+        app_state.flush()
+
     gui.run(
         storage_secret=password_hasher.hash(password=secret, salt='8J3pZzuzph6nibo2'.encode()).split('$')[-1],
-        startup_callback=start)
+        startup_callback=start,
+        shutdown_callback=stop)
 
 if __name__ == "__main__":
     main()
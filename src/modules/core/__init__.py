@@ -1,6 +1,8 @@
-from .appstate import app_state, password_hasher, AppStateValue, ENERGY_CONFIG_KEY, WEB_CONFIG_KEY, SCHEDULE_LENGTH, SCHEDULE_TEMPLATE_LENGTH
+from .appstate import app_state, AppStateValue, KeyedAppStateValue, KeyedChange, ENERGY_CONFIG_KEY, WEB_CONFIG_KEY, SCHEDULE_LENGTH, SCHEDULE_TEMPLATE_LENGTH
 from .config import get_config_key, get_optional_config_key
 from .eventbox import EventBox, EventPayload
 from .logging import setup_log
-from .triggers import triggers, Triggers
+from .passwords import password_hasher, password_service, PasswordServiceBusyError
+from .schedule import Schedule
+from .triggers import triggers, Triggers, MissedRunPolicy
 from .types import OperationMode
\ No newline at end of file
@@ -1,23 +1,24 @@
-import json, os, base64, logging
-from argon2 import PasswordHasher
-from argon2 import Type as ArgonType
-from collections.abc import Iterable
+import json, os, base64
+from collections.abc import Iterable, Mapping
+from contextlib import contextmanager
 from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Random import get_random_bytes
 from dataclasses import dataclass, fields
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
-from io import StringIO
-from shutil import copyfileobj
+from types import MappingProxyType
 from typing import Generic, TypeVar, Callable, Any
 
 from .eventbox import EventBox
 from .types import OperationMode
 from .config import get_optional_config_key, get_config_key
+from .persistence import DeferredWriter
+from .schedule import Schedule
 from .triggers import Triggers
 
 _INSTANCE_NAME_CONFIG_KEY = 'name'
+_SAVE_DELAY_CONFIG_KEY = 'save_delay'
 
 ENERGY_CONFIG_KEY = 'energy'
 _CHARGER_EFFICIENCY_CONFIG_KEY = 'charger_efficiency_factor'
@@ -43,18 +44,27 @@ _TIBBER_TOKEN_ENV_NAME = 'HBRE_TIBBER_TOKEN'
 _AVG_CHARGED_PRICE_DATA_KEY = 'avg_charged_price'
 _CONFIG_DATA_KEY = 'config'
 _MANUAL_MODE_DATA_KEY = 'manual_mode'
+_PINNED_SLOTS_DATA_KEY = 'pinned_slots'
 _SCHEDULE_TEMPLATE_DATA_KEY = 'schedule_template'
 _SCHEDULE_DATA_KEY = 'schedule'
 
 SCHEDULE_TEMPLATE_LENGTH = 24 * 4
 SCHEDULE_LENGTH = 48 * 4
 
-password_hasher = PasswordHasher(time_cost=3, memory_cost=65536, parallelism=4, hash_len=32, salt_len=16, encoding='utf-8', type=ArgonType.ID)
-
 T = TypeVar('T')
+K = TypeVar('K')
+V = TypeVar('V')
+
+class _Transaction:
+    def __init__(self):
+        self.depth = 0
+        # changed values (and keys for keyed values) and their value before the transaction
+        self.changes: dict[tuple[Any, Any], Any] = {}
+        self.is_save_requested = False
 
 class AppStateValue(Generic[T]):
-    def __init__(self, file_data: dict, default: T, keys: tuple[str, ...], importer: Callable[[Any], T], exporter: Callable[[T], Any]):
+    def __init__(self, transaction: _Transaction, file_data: dict, default: T, keys: tuple[str, ...], importer: Callable[[Any], T], exporter: Callable[[T], Any]):
+        self.__transaction = transaction
         self.__file_data = file_data
         self.__keys: tuple[str, ...] = keys
         self.value = default
@@ -99,10 +109,19 @@ class AppStateValue(Generic[T]):
         if self.is_readonly:
             return
         has_value_changed = self.value != value
+        old_value = self.value
         self.value = value
-        if has_value_changed:
+        if not has_value_changed:
+            return
+        if self.__transaction.depth:
+            self.__transaction.changes.setdefault((self, None), old_value)
+        else:
             self.on_change.fire(self, value)
 
+    def notify(self, _, old_value: T):
+        if self.value != old_value:
+            self.on_change.fire(self, self.value)
+
     def __get_leaf_dict(self):
         dict = self.__file_data
         for key in self.__keys[:-1]:
@@ -112,22 +131,54 @@ class AppStateValue(Generic[T]):
             dict = next_dict
         return dict
 
+@dataclass(frozen=True)
+class KeyedChange(Generic[K, V]):
+    key: K
+    old: V | None
+    new: V | None
+
+class KeyedAppStateValue(Generic[K, V]):
+    # Runtime only state with one entry per key, e.g. per controller; changes are reported per key.
+    def __init__(self, transaction: _Transaction):
+        self.__transaction = transaction
+        self.__entries: dict[K, V] = {}
+        self.value: Mapping[K, V] = MappingProxyType(self.__entries)
+        self.on_change: EventBox[KeyedChange[K, V]] = EventBox()
+
+    def get(self, key: K, default: V | None = None):
+        return self.__entries.get(key, default)
+
+    def set_item(self, key: K, value: V):
+        old_value = self.__entries.get(key)
+        if key in self.__entries and old_value == value:
+            return
+        self.__entries[key] = value
+        if self.__transaction.depth:
+            self.__transaction.changes.setdefault((self, key), old_value)
+        else:
+            self.on_change.fire(self, KeyedChange(key, old_value, value))
+
+    def notify(self, key: K, old_value: V | None):
+        if (value := self.__entries.get(key)) != old_value:
+            self.on_change.fire(self, KeyedChange(key, old_value, value))
+
 @dataclass
 class AppStateMembers:
-    actual_mode: AppStateValue[dict[str, OperationMode | None]]
+    actual_mode: KeyedAppStateValue[str, OperationMode | None]
     admin_pass: AppStateValue[str]
     admin_user: AppStateValue[str]
     avg_charged_price: AppStateValue[Decimal]
     charger_efficiency: AppStateValue[Decimal]
     instance_name: AppStateValue[str]
     inverter_efficiency: AppStateValue[Decimal]
-    locks: AppStateValue[dict[str, tuple[str, ...]]]
+    locks: KeyedAppStateValue[str, tuple[str, ...]]
     manual_mode: AppStateValue[OperationMode | None]
     minimum_margin: AppStateValue[Decimal]
+    pinned_slots: AppStateValue[frozenset[int]]
     prices_revision: AppStateValue[datetime]
     remaining_capacity: AppStateValue[Decimal | None]
     requested_mode: AppStateValue[OperationMode]
-    schedule: AppStateValue[dict[datetime, OperationMode]]
+    schedule: AppStateValue[Schedule]
     template: AppStateValue[tuple[OperationMode, ...]]
     tibber_token: AppStateValue[str | None]
     user_pass: AppStateValue[str]
@@ -138,35 +189,46 @@ class AppState:
         self.__secret = ''
         self.__file = None
         self.__file_data = {}
+        self.__writer = DeferredWriter('app state', self.__serialize)
+        self.__transaction = _Transaction()
 
         self.__data = AppStateMembers(
-            actual_mode=AppStateValue(self.__file_data, {}, tuple(), None, None),
-            admin_pass=AppStateValue(self.__file_data, '', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _ADMIN_PASS_CONFIG_KEY), str, str),
-            admin_user=AppStateValue(self.__file_data, 'admin', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _ADMIN_USER_CONFIG_KEY), str, str),
-            avg_charged_price=AppStateValue(self.__file_data, Decimal(0), (_AVG_CHARGED_PRICE_DATA_KEY,), lambda x: round(Decimal(x), 10), str),
-            charger_efficiency=AppStateValue(self.__file_data, Decimal(1), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _CHARGER_EFFICIENCY_CONFIG_KEY), lambda x: round(Decimal(x), 3), str),
-            instance_name=AppStateValue(None, {}, tuple(), None, None),
-            inverter_efficiency=AppStateValue(self.__file_data, Decimal(1), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _INVERTER_EFFICIENCY_CONFIG_KEY), lambda x: round(Decimal(x), 3), str),
-            locks=AppStateValue(None, {}, tuple(), None, None),
-            manual_mode=AppStateValue(self.__file_data, None, (_MANUAL_MODE_DATA_KEY,), self.__import_manual_mode, self.__export_manual_mode),
-            minimum_margin=AppStateValue(self.__file_data, Decimal(0), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _MINIMUM_MARGIN_CONFIG_KEY), lambda x: round(Decimal(x), 4), str),
-            prices_revision=AppStateValue(None, datetime.min, tuple(), None, None),
-            remaining_capacity=AppStateValue(None, Decimal(-1), tuple(), None, None),
-            requested_mode=AppStateValue(None, OperationMode.IDLE, tuple(), None, None),
-            schedule=AppStateValue(self.__file_data, {}, (_SCHEDULE_DATA_KEY,), self.__import_schedule, self.__export_schedule),
-            template=AppStateValue(self.__file_data, [], (_SCHEDULE_TEMPLATE_DATA_KEY,), self.__import_template, self.__export_template),
-            tibber_token=AppStateValue(self.__file_data, None, (_CONFIG_DATA_KEY, _TIBBER_CONFIG_KEY, _TIBBER_TOKEN_CONFIG_KEY), self.__decrypt, self.__encrypt),
-            user_pass=AppStateValue(self.__file_data, '', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _USER_PASS_CONFIG_KEY), str, str),
-            user_user=AppStateValue(self.__file_data, 'user', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _USER_USER_CONFIG_KEY), str, str)
+            actual_mode=KeyedAppStateValue(self.__transaction),
+            admin_pass=AppStateValue(self.__transaction, self.__file_data, '', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _ADMIN_PASS_CONFIG_KEY), str, str),
+            admin_user=AppStateValue(self.__transaction, self.__file_data, 'admin', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _ADMIN_USER_CONFIG_KEY), str, str),
+            avg_charged_price=AppStateValue(self.__transaction, self.__file_data, Decimal(0), (_AVG_CHARGED_PRICE_DATA_KEY,), lambda x: round(Decimal(x), 10), str),
+            charger_efficiency=AppStateValue(self.__transaction, self.__file_data, Decimal(1), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _CHARGER_EFFICIENCY_CONFIG_KEY), lambda x: round(Decimal(x), 3), str),
+            instance_name=AppStateValue(self.__transaction, None, {}, tuple(), None, None),
+            inverter_efficiency=AppStateValue(self.__transaction, self.__file_data, Decimal(1), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _INVERTER_EFFICIENCY_CONFIG_KEY), lambda x: round(Decimal(x), 3), str),
+            locks=KeyedAppStateValue(self.__transaction),
+            manual_mode=AppStateValue(self.__transaction, self.__file_data, None, (_MANUAL_MODE_DATA_KEY,), self.__import_manual_mode, self.__export_manual_mode),
+            minimum_margin=AppStateValue(self.__transaction, self.__file_data, Decimal(0), (_CONFIG_DATA_KEY, ENERGY_CONFIG_KEY, _MINIMUM_MARGIN_CONFIG_KEY), lambda x: round(Decimal(x), 4), str),
+            pinned_slots=AppStateValue(self.__transaction, self.__file_data, frozenset(), (_PINNED_SLOTS_DATA_KEY,), self.__import_pinned_slots, self.__export_pinned_slots),
+            prices_revision=AppStateValue(self.__transaction, None, datetime.min, tuple(), None, None),
+            remaining_capacity=AppStateValue(self.__transaction, None, Decimal(-1), tuple(), None, None),
+            requested_mode=AppStateValue(self.__transaction, None, OperationMode.IDLE, tuple(), None, None),
+            schedule=AppStateValue(self.__transaction, self.__file_data, Schedule.empty(SCHEDULE_LENGTH), (_SCHEDULE_DATA_KEY,), self.__import_schedule, self.__export_schedule),
+            template=AppStateValue(self.__transaction, self.__file_data, [], (_SCHEDULE_TEMPLATE_DATA_KEY,), self.__import_template, self.__export_template),
+            tibber_token=AppStateValue(self.__transaction, self.__file_data, None, (_CONFIG_DATA_KEY, _TIBBER_CONFIG_KEY, _TIBBER_TOKEN_CONFIG_KEY), self.__decrypt, self.__encrypt),
+            user_pass=AppStateValue(self.__transaction, self.__file_data, '', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _USER_PASS_CONFIG_KEY), str, str),
+            user_user=AppStateValue(self.__transaction, self.__file_data, 'user', (_CONFIG_DATA_KEY, WEB_CONFIG_KEY, _USER_USER_CONFIG_KEY), str, str)
         )
 
     @property
     def data(self):
         return self.__data
+
+    @property
+    def writer(self):
+        return self.__writer
+
+    def get_subscriber_counts(self):
+        return {x.name: getattr(self.__data, x.name).on_change.subscriber_count for x in fields(self.__data)}
     
     def load(self, secret: str, config: dict, file: str):
         self.__secret = secret
         self.__file = file
+        self.__writer.configure(file, get_optional_config_key(config, float, 5.0, None, _SAVE_DELAY_CONFIG_KEY))
         self.__file_data.clear()
         if os.path.exists(self.__file):
             with open(self.__file, 'r') as stream:
@@ -184,38 +246,55 @@ class AppState:
         self.__data.user_user.add_from_config(get_optional_config_key(config, str, None, _USER_USER_ENV_NAME, WEB_CONFIG_KEY, _USER_USER_CONFIG_KEY))
 
         for field in fields(AppStateMembers):
-            getattr(self.__data, field.name).add_from_file()
+            # keyed values are runtime only
+            if isinstance(value := getattr(self.__data, field.name), AppStateValue):
+                value.add_from_file()
 
         self.__expand_template()
         # the scheduler is responsible of expanding the schedule, so do nothing here
 
+    def start(self):
+        self.__writer.start()
+
     def save(self):
         assert self.__file is not None
-        with StringIO() as mem_stream:
-            try:
-                json.dump(self.__file_data, mem_stream, indent=4, sort_keys=True)
-            except Exception as e:
-                logging.error('Can not serialize app state: {e}')
-                return
-            try:
-                with open(self.__file, 'w') as stream:
-                    mem_stream.seek(0)
-                    copyfileobj(mem_stream, stream)
-            except Exception as e:
-                logging.error(f'Can not write app state to file: {e}')
+        if self.__transaction.depth:
+            self.__transaction.is_save_requested = True
+            return
+        self.__writer.request()
+
+    @contextmanager
+    def transaction(self):
+        # Changes within the transaction fire their on_change events once when the outermost transaction ends,
+        # calls of save are merged into a single one.
+        self.__transaction.depth += 1
+        try:
+            yield
+        finally:
+            self.__transaction.depth -= 1
+            if not self.__transaction.depth:
+                self.__commit()
+
+    def flush(self):
+        self.__writer.flush()
+
+    def __commit(self):
+        transaction = self.__transaction
+        changes = transaction.changes
+        transaction.changes = {}
+        is_save_requested = transaction.is_save_requested
+        transaction.is_save_requested = False
+        for (value, key), old_value in changes.items():
+            value.notify(key, old_value)
+        if is_save_requested:
+            self.save()
+
+    def __serialize(self):
+        return json.dumps(self.__file_data, indent=4, sort_keys=True)
 
     def expand_schedule(self):
-        cutoff = Triggers.get_current_quarter_hour()
-        schedule: dict[datetime, OperationMode] = {x: y for x, y in self.__data.schedule.value.items() if x >= cutoff}
-        template: list[OperationMode] = self.__data.template.value
-
-        timestamp = cutoff
-        for _ in range(SCHEDULE_LENGTH):
-            if timestamp not in schedule:
-                schedule[timestamp] = template[self.__get_schedule_template_index(timestamp)]
-            timestamp += timedelta(minutes=15)
-
-        self.__data.schedule.set(schedule)
+        schedule: Schedule = self.__data.schedule.value
+        self.__data.schedule.set(schedule.expanded(Triggers.get_current_slot(), self.__data.template.value))
 
     def __expand_template(self):
         template = list(self.__data.template.value)
@@ -249,7 +328,11 @@ class AppState:
         return None if (data is None) else data.value
 
     @staticmethod
-    def __export_schedule(data: dict[datetime, OperationMode]):
+    def __export_pinned_slots(data: frozenset[int]):
+        return list(Triggers.get_slot_timestamp(x).isoformat() for x in sorted(data))
+
+    @staticmethod
+    def __export_schedule(data: Schedule):
         return {x.isoformat(): y.value for x, y in data.items()}
 
     @staticmethod
@@ -260,17 +343,16 @@ class AppState:
     def __import_manual_mode(data: str):
         return None if (not data) else OperationMode.get(data)
 
+    @staticmethod
+    def __import_pinned_slots(data: list):
+        return frozenset(Triggers.get_slot(datetime.fromisoformat(x)) for x in data)
+
     @staticmethod
     def __import_schedule(data: dict):
-        return {datetime.fromisoformat(x): OperationMode.get(y) for x, y in data.items()}
+        return Schedule.from_items(((datetime.fromisoformat(x), OperationMode.get(y)) for x, y in data.items()), SCHEDULE_LENGTH)
 
     @staticmethod
     def __import_template(data: list):
         return tuple(OperationMode.get(x) for x in data)
 
-    @staticmethod
-    def __get_schedule_template_index(timestamp: datetime):
-        minutes_since_midnight = int((timestamp - timestamp.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()) // 60
-        return minutes_since_midnight // 15
-
 app_state = AppState()
\ No newline at end of file
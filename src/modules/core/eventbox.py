@@ -1,3 +1,4 @@
+import inspect, itertools, weakref
 from dataclasses import dataclass
 from typing import Any, Generic, TypeVar, Callable
 
@@ -11,7 +12,11 @@ class EventPayload(Generic[T]):
 @dataclass
 class _EventSubscription(Generic[T]):
     id: int | str | None
-    callback: Callable[[EventPayload[T]], None]
+    # bound methods are held weakly, so subscribers which were never unsubscribed do not live forever
+    callback: Callable[[EventPayload[T]], None] | weakref.WeakMethod
+
+    def resolve(self) -> Callable[[EventPayload[T]], None] | None:
+        return self.callback() if isinstance(self.callback, weakref.WeakMethod) else self.callback
 
 class EventBox(Generic[T]):
     PRE = 1
@@ -19,19 +24,44 @@ class EventBox(Generic[T]):
     POST = 3
 
     def __init__(self):
-        self.__callbacks: tuple[list[_EventSubscription[T]], ...] = ([], [], [])
+        self.__callbacks: tuple[dict[int, _EventSubscription[T]], ...] = ({}, {}, {})
+        self.__keys_by_id: dict[int | str, list[int]] = {}
+        self.__next_key = itertools.count()
+
+    @property
+    def subscriber_count(self):
+        return sum(len(x) for x in self.__callbacks)
 
     def subscribe(self, callback: Callable[[EventPayload[T]], None], id: int | str | None = None, prio=NORMAL):
-        self.__callbacks[prio].append(_EventSubscription(id, callback))
+        key = next(self.__next_key)
+        if inspect.ismethod(callback):
+            self_ref = weakref.ref(self)
+            stored = weakref.WeakMethod(callback, lambda _: (box := self_ref()) and box.__remove(key))
+        else:
+            stored = callback
+        self.__callbacks[prio - 1][key] = _EventSubscription(id, stored)
+        if id is not None:
+            self.__keys_by_id.setdefault(id, []).append(key)
 
     def unsubscribe_by_id(self, id: str | int):
-        for prio in self.__callbacks:
-            for i in range(len(prio) - 1, -1, -1):
-                if prio[i].id == id:
-                    del prio[i]
+        for key in self.__keys_by_id.pop(id, ()):
+            for prio in self.__callbacks:
+                if prio.pop(key, None) is not None:
+                    break
 
     def fire(self, sender: Any, data: T):
         payload = EventPayload(sender, data)
         for prio in self.__callbacks:
-            for subscription in prio:
-                subscription.callback(payload)
+            # subscribers may unsubscribe while the event is fired
+            for subscription in tuple(prio.values()):
+                if (callback := subscription.resolve()) is not None:
+                    callback(payload)
+
+    def __remove(self, key: int):
+        for prio in self.__callbacks:
+            if (subscription := prio.pop(key, None)) is not None:
+                if subscription.id is not None and (keys := self.__keys_by_id.get(subscription.id)):
+                    keys.remove(key)
+                    if not keys:
+                        del self.__keys_by_id[subscription.id]
+                return
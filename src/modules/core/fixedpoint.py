@@ -0,0 +1,67 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from functools import partial
+
+# Fixed point numbers are plain ints in units of 1 / scale. Arithmetic on them is exact, only divisions round, and they
+# round half to even like Decimal does by default. Conversion from and to Decimal happens at the edges: parsing, app
+# state, persistence and display.
+
+PRICE_SCALE = 10 ** 10 # €/kWh and €; the average charged price is kept with 10 decimal places
+EFFICIENCY_SCALE = 10 ** 3
+CAPACITY_SCALE = 10 ** 6 # Ah
+MONEY_SCALE = 10 ** 8 # € in the energy database, the precision of the former csv files
+
+def to_fixed(value: Decimal | int, scale: int) -> int:
+    if isinstance(value, int):
+        return value * scale
+    return int((value * scale).to_integral_value(ROUND_HALF_EVEN))
+
+def to_decimal(units: int, scale: int):
+    return Decimal(units) / scale
+
+def div_half_even(numerator: int, denominator: int) -> int:
+    # denominator > 0; divmod rounds towards negative infinity, so the remainder is never negative
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient & 1):
+        quotient += 1
+    return quotient
+
+def rescale(units: int, scale: int, new_scale: int) -> int:
+    if new_scale >= scale:
+        return units * (new_scale // scale)
+    return div_half_even(units, scale // new_scale)
+
+def round_fixed(units: int, scale: int, decimals: int) -> int:
+    # like round(value, decimals), the result keeps the scale
+    step = scale // (10 ** decimals)
+    return div_half_even(units, step) * step if step > 1 else units
+
+def format_fixed(units: int, scale: int, decimals: int):
+    # like f'{value:.<decimals>f}' for a Decimal value
+    power = 10 ** decimals
+    if scale > power:
+        step = scale // power
+        digits, remainder = divmod(units, step)
+        if remainder and (2 * remainder > step or (2 * remainder == step and digits & 1)):
+            digits += 1
+    else:
+        digits = units * (power // scale)
+    text = str(abs(digits)).rjust(decimals + 1, '0')
+    sign = '-' if units < 0 else ''
+    return f'{sign}{text[:-decimals]}.{text[-decimals:]}' if decimals else f'{sign}{text}'
+
+def fixed_formatter(scale: int, decimals: int):
+    # format_fixed for a fixed scale and number of decimals, as fast as formatting a Decimal; for displaying many values
+    power = 10 ** decimals
+    if scale < power:
+        return partial(format_fixed, scale=scale, decimals=decimals)
+    step = scale // power
+    spec = f'%.{decimals}f'
+
+    def format_units(units: int):
+        # The float is off by far less than a unit and is formatted with correct rounding, so this is exact unless the
+        # value is exactly halfway between two results, where the float may be rounded the other way.
+        if -2 ** 50 < units < 2 ** 50 and 2 * (units % step) != step:
+            return spec % (units / scale)
+        return format_fixed(units, scale, decimals)
+    return format_units
@@ -1,32 +1,71 @@
-import logging, sys
-from logging.handlers import TimedRotatingFileHandler
+import atexit, json, logging, queue, sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from .config import get_optional_config_key
 
 _LOG_CONFIG_KEY = 'log'
 _LEVEL_CONFIG_KEY = 'level'
 _PATH_CONFIG_KEY = 'path'
 _DAYS_CONFIG_KEY = 'days'
+_FORMAT_CONFIG_KEY = 'format'
+
+_TEXT_FORMAT = 'text'
+_JSON_FORMAT = 'json'
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line
+    def format(self, record: logging.LogRecord):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord):
+        # Messages without arguments and exceptions can be passed as they are, saving a format call and a copy
+        # of the record in the thread of the caller.
+        if record.args or record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+class ModuleFilter(logging.Filter):
+    def filter(self, record):
+        return record.name == 'root'
 
 def setup_log(config: dict):
     log_level = get_optional_config_key(config, lambda x: getattr(logging, str(x).upper()), 'info', None, _LOG_CONFIG_KEY, _LEVEL_CONFIG_KEY)
     log_path = get_optional_config_key(config, str, None, None, _LOG_CONFIG_KEY, _PATH_CONFIG_KEY)
     log_backup_count = get_optional_config_key(config, int, 0, None, _LOG_CONFIG_KEY, _DAYS_CONFIG_KEY)
+    log_format = get_optional_config_key(config, str, _TEXT_FORMAT, None, _LOG_CONFIG_KEY, _FORMAT_CONFIG_KEY).lower()
 
-    logger = logging.getLogger()
-    logger.setLevel(log_level)
-    formatter = logging.Formatter(fmt='%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%dT%H:%M:%S')
+    if log_format == _JSON_FORMAT:
+        formatter = JsonFormatter()
+    elif log_format == _TEXT_FORMAT:
+        formatter = logging.Formatter(fmt='%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%dT%H:%M:%S')
+    else:
+        raise ValueError(f'Unknown log format: {log_format}.')
 
-    class ModuleFilter(logging.Filter):
-        def filter(self, record):
-            return record.name == 'root'
-        
+    handlers: list[logging.Handler] = []
     stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(formatter)
-    stdout_handler.addFilter(ModuleFilter())
-    logger.addHandler(stdout_handler)
-
+    handlers.append(stdout_handler)
     if log_path:
-        file_handler = TimedRotatingFileHandler(log_path, when="midnight", interval=1, backupCount=log_backup_count)
-        file_handler.setFormatter(formatter)
-        file_handler.addFilter(ModuleFilter())
-        logger.addHandler(file_handler)
\ No newline at end of file
+        handlers.append(TimedRotatingFileHandler(log_path, when="midnight", interval=1, backupCount=log_backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # the actual output happens in a background thread, callers (including the MQTT thread) only enqueue the record
+    log_queue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(ModuleFilter())
+    listener = QueueListener(log_queue, *handlers)
+
+    logger = logging.getLogger()
+    logger.setLevel(log_level)
+    logger.addHandler(queue_handler)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
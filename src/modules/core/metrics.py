@@ -0,0 +1,37 @@
+import bisect
+
+class DurationStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return (self.total / self.count) if self.count else 0.0
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        if duration > self.max:
+            self.max = duration
+
+    def __str__(self):
+        return f'count={self.count} mean={self.mean * 1000:.1f} ms max={self.max * 1000:.1f} ms'
+
+class Histogram:
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds # upper bounds of the buckets; the last bucket has no upper bound
+        self.buckets = [0] * (len(bounds) + 1)
+        self.stats = DurationStats()
+
+    def add(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.stats.add(value)
+
+    def __str__(self):
+        labels = [f'<={x * 1000:g}ms' for x in self.bounds] + [f'>{self.bounds[-1] * 1000:g}ms']
+        buckets = ' '.join(f'{x}:{y}' for x, y in zip(labels, self.buckets) if y)
+        return f'{self.stats} [{buckets}]'
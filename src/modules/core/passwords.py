@@ -0,0 +1,46 @@
+import asyncio, logging, time
+from argon2 import PasswordHasher
+from argon2 import Type as ArgonType
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from .metrics import DurationStats
+
+# argon2 hashing needs ~64 MiB RAM and four lanes per call, so only a few may run at once
+_WORKERS = 2
+_MAX_PENDING = 8
+
+password_hasher = PasswordHasher(time_cost=3, memory_cost=65536, parallelism=4, hash_len=32, salt_len=16, encoding='utf-8', type=ArgonType.ID)
+
+class PasswordServiceBusyError(Exception):
+    pass
+
+class PasswordService:
+    def __init__(self, hasher: PasswordHasher, workers: int, max_pending: int):
+        self.__hasher = hasher
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='argon2')
+        self.__max_pending = max_pending
+        self.__pending = 0
+        self.hash_stats = DurationStats()
+        self.verify_stats = DurationStats()
+
+    async def hash(self, password: str) -> str:
+        return await self.__run('hash', self.hash_stats, self.__hasher.hash, password)
+
+    async def verify(self, hash: str, password: str) -> bool:
+        # raises VerifyMismatchError just like PasswordHasher.verify
+        return await self.__run('verify', self.verify_stats, self.__hasher.verify, hash, password)
+
+    async def __run(self, name: str, stats: DurationStats, func: Callable, *args):
+        if self.__pending >= self.__max_pending:
+            raise PasswordServiceBusyError('Too many pending password operations.')
+        self.__pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+        finally:
+            self.__pending -= 1
+            stats.add(time.perf_counter() - start)
+            logging.debug(f'Password {name}: {stats}.')
+
+password_service = PasswordService(password_hasher, _WORKERS, _MAX_PENDING)
@@ -0,0 +1,133 @@
+import asyncio, logging, os, tempfile, threading, time
+from typing import Callable
+
+from .metrics import DurationStats
+
+def write_atomic(path: str, content: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as stream:
+            stream.write(content)
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(temp_path, path)
+    except:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        # not supported on every platform, the rename itself is already atomic
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+class DeferredWriter:
+    def __init__(self, name: str, serializer: Callable[[], str]):
+        self.__name = name
+        self.__serializer = serializer
+        self.__file: str | None = None
+        self.__delay = 0.0
+        self.__loop: asyncio.AbstractEventLoop | None = None
+
+        self.__lock = threading.Lock()
+        self.__is_dirty = False
+        self.__is_scheduled = False
+        self.__task: asyncio.Task | None = None
+
+        self.__write_lock = threading.Lock()
+        self.__generation = 0
+        self.__written_generation = 0
+
+        self.requests = 0
+        self.serialize_stats = DurationStats()
+        self.write_stats = DurationStats()
+
+    def configure(self, file: str, delay: float):
+        self.__file = file
+        self.__delay = max(0.0, delay)
+
+    def start(self):
+        self.__loop = asyncio.get_running_loop()
+
+    def request(self):
+        assert self.__file is not None
+        with self.__lock:
+            self.requests += 1
+            self.__is_dirty = True
+            if self.__loop is None or self.__is_scheduled:
+                schedule = False
+            else:
+                self.__is_scheduled = True
+                schedule = True
+        if self.__loop is None:
+            self.flush()
+        elif schedule:
+            # save requests might come from foreign threads
+            self.__loop.call_soon_threadsafe(self.__loop.call_later, self.__delay, self.__on_timer)
+
+    def flush(self):
+        with self.__lock:
+            if not self.__is_dirty:
+                return
+            self.__is_dirty = False
+        if (content := self.__serialize()) is None:
+            return
+        self.__write(*content)
+
+    def __on_timer(self):
+        self.__task = asyncio.create_task(self.__write_async())
+
+    async def __write_async(self):
+        with self.__lock:
+            self.__is_scheduled = False
+            if not self.__is_dirty:
+                return
+            self.__is_dirty = False
+        if (content := self.__serialize()) is None:
+            return
+        assert self.__loop is not None
+        await self.__loop.run_in_executor(None, self.__write, *content)
+
+    def __mark_dirty(self):
+        # the next save request or flush will retry
+        with self.__lock:
+            self.__is_dirty = True
+
+    def __serialize(self):
+        start = time.perf_counter()
+        try:
+            content = self.__serializer()
+        except Exception as e:
+            logging.error(f'Can not serialize {self.__name}: {e}')
+            self.__mark_dirty()
+            return None
+        self.serialize_stats.add(time.perf_counter() - start)
+        with self.__lock:
+            self.__generation += 1
+            return content, self.__generation
+
+    def __write(self, content: str, generation: int):
+        assert self.__file is not None
+        with self.__write_lock:
+            if generation <= self.__written_generation:
+                # a newer snapshot already made it to disk
+                return
+            start = time.perf_counter()
+            try:
+                write_atomic(self.__file, content)
+            except Exception as e:
+                logging.error(f'Can not write {self.__name} to file: {e}')
+                self.__mark_dirty()
+                return
+            self.__written_generation = generation
+            self.write_stats.add(time.perf_counter() - start)
+        logging.debug(f'Saved {self.__name}: requests={self.requests} writes: {self.write_stats}.')
@@ -0,0 +1,125 @@
+import itertools
+from collections.abc import Iterable, Sequence
+from datetime import datetime
+
+from .triggers import Triggers
+from .types import OperationMode
+
+_UNSET = 0xFF
+_MODES = tuple(OperationMode)
+_CODES = {x: i for i, x in enumerate(_MODES)}
+_REVISIONS = itertools.count()
+
+class Schedule:
+    # Ring buffer of mode codes. The mode of slot n is stored at index n % length, so moving the
+    # window forward only touches the slots entering the window.
+    def __init__(self, start: int, codes: bytes, changed_slots: tuple[int, ...] = tuple(), base: 'Schedule | None' = None):
+        self.__start = start
+        self.__codes = codes
+        self.__changed_slots = changed_slots
+        self.__revision = next(_REVISIONS)
+        self.__base_revision = base.__revision if (base is not None) else None
+
+    @classmethod
+    def empty(cls, length: int):
+        return cls(0, bytes((_UNSET,)) * length)
+
+    @classmethod
+    def from_items(cls, items: Iterable[tuple[datetime, OperationMode]], length: int):
+        slots = {Triggers.get_slot(x): y for x, y in items}
+        if not slots:
+            return cls.empty(length)
+        start = min(slots)
+        codes = bytearray((_UNSET,)) * length
+        for slot, mode in slots.items():
+            if slot < start + length:
+                codes[slot % length] = _CODES[mode]
+        return cls(start, bytes(codes))
+
+    @property
+    def start(self):
+        return self.__start
+
+    @property
+    def end(self):
+        return self.__start + len(self.__codes)
+
+    @property
+    def changed_slots(self):
+        # slots that differ from the schedule this one was derived from
+        return self.__changed_slots
+
+    def get_changed_slots(self, previous: 'Schedule | None'):
+        # None if the change against previous is not known, since this schedule was not derived from it directly
+        if previous is None or self.__base_revision != previous.__revision:
+            return None
+        return self.__changed_slots
+
+    def get(self, timestamp: datetime, default: OperationMode | None = None):
+        return self.get_slot(Triggers.get_slot(timestamp), default)
+
+    def get_slot(self, slot: int, default: OperationMode | None = None):
+        if not (self.__start <= slot < self.__start + len(self.__codes)):
+            return default
+        code = self.__codes[slot % len(self.__codes)]
+        return default if (code == _UNSET) else _MODES[code]
+
+    def items(self):
+        length = len(self.__codes)
+        for slot in range(self.__start, self.__start + length):
+            if (code := self.__codes[slot % length]) != _UNSET:
+                yield Triggers.get_slot_timestamp(slot), _MODES[code]
+
+    def expanded(self, start: int, template: Sequence[OperationMode]):
+        length = len(self.__codes)
+        end = start + length
+        codes = bytearray(self.__codes)
+        changed: list[int] = []
+
+        def fill(slot: int):
+            code = _CODES[template[slot % len(template)]]
+            codes[slot % length] = code
+            changed.append(slot)
+
+        kept_start = max(start, self.__start)
+        kept_end = min(end, self.end)
+        if kept_start >= kept_end:
+            for slot in range(start, end):
+                fill(slot)
+        else:
+            for slot in range(start, kept_start):
+                fill(slot)
+            for slot in range(kept_end, end):
+                fill(slot)
+            if _UNSET in codes:
+                # only happens for schedules with gaps, e.g. loaded from file
+                for slot in range(kept_start, kept_end):
+                    if codes[slot % length] == _UNSET:
+                        fill(slot)
+
+        return Schedule(start, bytes(codes), tuple(sorted(changed)), self)
+
+    def updated(self, items: Iterable[tuple[datetime, OperationMode]]):
+        length = len(self.__codes)
+        codes = bytearray(self.__codes)
+        changed: list[int] = []
+        for timestamp, mode in items:
+            slot = Triggers.get_slot(timestamp)
+            if not (self.__start <= slot < self.__start + length):
+                continue
+            code = _CODES[mode]
+            if codes[slot % length] != code:
+                codes[slot % length] = code
+                changed.append(slot)
+        return Schedule(self.__start, bytes(codes), tuple(sorted(changed)), self)
+
+    def __len__(self):
+        return len(self.__codes) - self.__codes.count(_UNSET)
+
+    def __eq__(self, other):
+        if not isinstance(other, Schedule):
+            return NotImplemented
+        return self.__start == other.__start and self.__codes == other.__codes
+
+    def __hash__(self):
+        return hash((self.__start, self.__codes))
@@ -1,46 +1,98 @@
-import asyncio, croniter, datetime, traceback, logging
+import asyncio, croniter, datetime, heapq, inspect, itertools, traceback, logging
+from enum import Enum
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_SLOTS_PER_DAY = 24 * 4
+
+_MAX_SLEEP_TIME = 60.0
+_MISSED_RUN_TOLERANCE = 10.0
+
+class MissedRunPolicy(Enum):
+    CATCH_UP = 'catch_up' # run once for every missed point in time
+    SKIP = 'skip' # do not run for missed points in time
+    COALESCE = 'coalesce' # run once for all missed points in time
 
 class Triggers:
     class __bundle:
-        def __init__(self, name, func, interval):
+        def __init__(self, name, func, interval, policy: MissedRunPolicy, use_executor: bool):
             self.cron = interval
             self.name = name
             self.func = func
+            self.policy = policy
+            self.use_executor = use_executor
             self.iter = croniter.croniter(interval, datetime.datetime.now())
-            self.next = self.iter.get_next(datetime.datetime)
+            self.next: datetime.datetime = self.iter.get_next(datetime.datetime)
+            self.backlog = 0
+            self.task: asyncio.Task | None = None
 
     def __init__(self):
-        self.__jobs = []
+        self.__jobs = [] # heap of (next run, sequence number, job)
+        self.__sequence = itertools.count()
+        self.__wakeup: asyncio.Event | None = None
 
-    def add(self, name, interval, callback):
-        self.__jobs.append(self.__bundle(name, callback, interval))
+    def add(self, name, interval, callback, policy=MissedRunPolicy.COALESCE, use_executor=False):
+        self.__push(self.__bundle(name, callback, interval, policy, use_executor))
+        if self.__wakeup is not None:
+            self.__wakeup.set()
 
     def start(self):
+        self.__wakeup = asyncio.Event()
         asyncio.create_task(self.__run())
 
     async def __run(self):
+        assert self.__wakeup is not None
         while True:
-            sleep_time = await self.__tick()
-            await asyncio.sleep(sleep_time)
-    
-    async def __tick(self):
-        time = datetime.datetime.now()
-        for job in self.__jobs:
-            diff = (job.next - time).total_seconds()
-            if diff < 0:
-                await self.__try_run(job)
-                job.next = job.iter.get_next(datetime.datetime)
-
-        next_run = 5
-        for job in self.__jobs:
-            diff = max(0, (job.next - time).total_seconds())
-            if diff < next_run:
-                next_run = diff
-        return round(next_run) + 1
+            now = datetime.datetime.now()
+            while self.__jobs and self.__jobs[0][0] <= now:
+                _, _, job = heapq.heappop(self.__jobs)
+                self.__handle_due_job(job, now)
+                self.__push(job)
+
+            # the sleep is limited, since the loop clock does not follow wall clock changes or system suspend
+            sleep_time = _MAX_SLEEP_TIME
+            if self.__jobs:
+                sleep_time = min(sleep_time, max(0.0, (self.__jobs[0][0] - datetime.datetime.now()).total_seconds()))
+            self.__wakeup.clear()
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), sleep_time)
+            except asyncio.TimeoutError:
+                pass
+
+    def __push(self, job):
+        heapq.heappush(self.__jobs, (job.next, next(self.__sequence), job))
+
+    def __handle_due_job(self, job, now: datetime.datetime):
+        delay = (now - job.next).total_seconds()
+        if job.policy == MissedRunPolicy.CATCH_UP:
+            self.__enqueue_run(job)
+            job.next = job.iter.get_next(datetime.datetime)
+            return
+
+        if job.policy == MissedRunPolicy.COALESCE or delay <= _MISSED_RUN_TOLERANCE:
+            self.__enqueue_run(job)
+        else:
+            logging.warning(f'Trigger {job.name} skipped, since it is {delay:.1f} s late.')
+        # restart the iterator to get the next point in time after now in O(1)
+        job.iter = croniter.croniter(job.cron, now)
+        job.next = job.iter.get_next(datetime.datetime)
+
+    def __enqueue_run(self, job):
+        job.backlog += 1
+        if job.task is None or job.task.done():
+            job.task = asyncio.create_task(self.__process_backlog(job))
+
+    async def __process_backlog(self, job):
+        while job.backlog:
+            job.backlog -= 1
+            await self.__try_run(job)
 
     async def __try_run(self, job):
         try:
-            job.func()
+            if job.use_executor:
+                await asyncio.get_running_loop().run_in_executor(None, job.func)
+            elif inspect.isawaitable(result := job.func()):
+                await result
         except Exception as e:
             trace = traceback.format_exc()
             message = f'Trigger {job.name} failed:\n{repr(e)}\n{trace}'
@@ -55,4 +107,17 @@ class Triggers:
         last_quarter = (timestamp.minute // 15) * 15
         return timestamp.replace(minute=last_quarter, second=0, microsecond=0)
 
+    @staticmethod
+    def get_current_slot():
+        return Triggers.get_slot(datetime.datetime.now())
+
+    @staticmethod
+    def get_slot(timestamp: datetime.datetime):
+        # number of quarter hours since 1970-01-01 00:00 wall clock time
+        return (timestamp.toordinal() - _EPOCH_ORDINAL) * _SLOTS_PER_DAY + timestamp.hour * 4 + timestamp.minute // 15
+
+    @staticmethod
+    def get_slot_timestamp(slot: int):
+        return _EPOCH + datetime.timedelta(minutes=15 * slot)
+
 triggers = Triggers()
@@ -1,2 +1,3 @@
 from .capacitytracker import CapacityTracker
-from .energytracker import EnergyTracker
\ No newline at end of file
+from .energytracker import EnergyTracker
+from .energystore import EnergyRecord, EnergyStore
@@ -1,9 +1,12 @@
 import logging
 from decimal import Decimal
 from ..core import app_state, EventPayload
-from ..uplink.virtualcontroller import VirtualController
+from ..core.fixedpoint import CAPACITY_SCALE, EFFICIENCY_SCALE, PRICE_SCALE, div_half_even, to_decimal, to_fixed
+from ..uplink.virtualcontroller import VirtualController, Aggregate
 from ..price import PriceSource
 
+_SHARE_SCALE = 10 ** 10
+
 class CapacityTracker:
     def __init__(self, uplink: VirtualController, prices: PriceSource):
         self.__prices = prices
@@ -15,8 +18,12 @@ class CapacityTracker:
         uplink.on_charger_energy.subscribe(self.__on_charger_energy)
         uplink.on_solar_energy.subscribe(self.__on_solar_energy)
 
-    def __on_battery_capacity(self, args: EventPayload[Decimal]):
-        capacity = args.data
+    def __on_battery_capacity(self, args: EventPayload[Aggregate[Decimal]]):
+        if args.data.missing:
+            # a partial sum of capacities can not be compared to the previous total
+            logging.warning('Omit battery capacity update: capacity data incomplete.')
+            return
+        capacity = args.data.value
         old_capacity = app_state.data.remaining_capacity.value
 
         if old_capacity < 0:
@@ -29,15 +36,16 @@ class CapacityTracker:
         app_state.data.remaining_capacity.set(capacity)
         delta = capacity - old_capacity
 
-        charger_eta = app_state.data.charger_efficiency.value
+        charger_eta = to_fixed(app_state.data.charger_efficiency.value, EFFICIENCY_SCALE)
         solar_energy = self.__solar_energy
-        charger_energy = round(self.__charger_energy * charger_eta)
+        charger_energy = div_half_even(self.__charger_energy * charger_eta, EFFICIENCY_SCALE)
         self.__solar_energy = None
         self.__charger_energy = None
 
         if delta == 0:
             return
-        logging.debug(f'New total capacity: {capacity:.1f} Ah; change: {delta:.1f} Ah')
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'New total capacity: {capacity:.1f} Ah; change: {delta:.1f} Ah')
         if delta < 0:
             return
 
@@ -51,17 +59,25 @@ class CapacityTracker:
             logging.warning('Omit average charged price calculation: unknown energy source.')
             return
 
-        effective_price = price * Decimal(round(charger_energy / total_energy, 10))
-        logging.debug(f'Charge price: {price:.4f} €/kWh; effective charge price with solar: {effective_price:.4f} €/kWh.')
+        # share of the charger energy with 10 decimal places; the effective price has the scale PRICE_SCALE * _SHARE_SCALE
+        charger_share = div_half_even(charger_energy * _SHARE_SCALE, total_energy)
+        effective_price = price * charger_share
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'Charge price: {to_decimal(price, PRICE_SCALE):.4f} €/kWh; '
+                          f'effective charge price with solar: {to_decimal(effective_price, PRICE_SCALE * _SHARE_SCALE):.4f} €/kWh.')
 
-        worth = (old_capacity * app_state.data.avg_charged_price.value) + (delta * effective_price)
-        new_avg = round(worth / capacity, 10)
-        logging.debug(f'New average charged price: {new_avg:.4f} €/kWh.')
+        old_capacity_units = to_fixed(old_capacity, CAPACITY_SCALE)
+        avg_charged_price = to_fixed(app_state.data.avg_charged_price.value, PRICE_SCALE)
+        # scale: CAPACITY_SCALE * PRICE_SCALE * _SHARE_SCALE
+        worth = (old_capacity_units * avg_charged_price * _SHARE_SCALE) + (to_fixed(delta, CAPACITY_SCALE) * effective_price)
+        new_avg = to_decimal(div_half_even(worth, to_fixed(capacity, CAPACITY_SCALE) * _SHARE_SCALE), PRICE_SCALE)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'New average charged price: {new_avg:.4f} €/kWh.')
         app_state.data.avg_charged_price.set(new_avg)
         app_state.save()
 
-    def __on_charger_energy(self, args: EventPayload[int]):
-        self.__charger_energy = (self.__charger_energy or 0) + args.data
+    def __on_charger_energy(self, args: EventPayload[Aggregate[int]]):
+        self.__charger_energy = (self.__charger_energy or 0) + args.data.value
 
-    def __on_solar_energy(self, args: EventPayload[int]):
-        self.__solar_energy = (self.__solar_energy or 0) + args.data
+    def __on_solar_energy(self, args: EventPayload[Aggregate[int]]):
+        self.__solar_energy = (self.__solar_energy or 0) + args.data.value
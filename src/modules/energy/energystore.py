@@ -0,0 +1,265 @@
+import csv, sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, TextIO
+
+from ..core import Triggers
+from ..core.fixedpoint import MONEY_SCALE, to_decimal, to_fixed
+
+_CSV_HEADER = ("timestamp", "charger energy", "inverter energy", "solar energy", "cost", "revenue")
+_CSV_IMPORTED_META_KEY = 'csv_imported'
+
+@dataclass(frozen=True)
+class _Tier:
+    table: str
+    key: str
+    get_bucket: Callable[[int], int]
+    get_start: Callable[[int], int] # first slot of a bucket
+    bucket_sql: str # get_bucket as SQL expression of the column slot
+
+def _get_month(slot: int):
+    timestamp = Triggers.get_slot_timestamp(slot)
+    return timestamp.year * 12 + timestamp.month - 1
+
+def _get_month_start(month: int):
+    return Triggers.get_slot(datetime(month // 12, month % 12 + 1, 1))
+
+# coarsest first
+_RAW_TIER = _Tier('energy', 'slot', lambda x: x, lambda x: x, 'slot')
+_ROLLUP_TIERS = {
+    'month': _Tier('energy_month', 'bucket', _get_month, _get_month_start,
+                   "CAST(strftime('%Y', slot * 900, 'unixepoch') AS INTEGER) * 12 + CAST(strftime('%m', slot * 900, 'unixepoch') AS INTEGER) - 1"),
+    'day': _Tier('energy_day', 'bucket', lambda x: x // (24 * 4), lambda x: x * (24 * 4), 'slot / 96'),
+    'hour': _Tier('energy_hour', 'bucket', lambda x: x // 4, lambda x: x * 4, 'slot / 4')}
+_ROLLUPS_META_KEY = 'rollups'
+
+@dataclass(frozen=True)
+class EnergyTotals:
+    charger_energy: int
+    inverter_energy: int
+    solar_energy: int
+    cost: Decimal
+    revenue: Decimal
+    quarters: int
+
+# records of the same quarter are summed up
+_UPSERT_SQL = '''
+    INSERT INTO energy (slot, charger_energy, inverter_energy, solar_energy, price, cost, revenue)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (slot) DO UPDATE SET
+        charger_energy = charger_energy + excluded.charger_energy,
+        inverter_energy = inverter_energy + excluded.inverter_energy,
+        solar_energy = solar_energy + excluded.solar_energy,
+        price = coalesce(excluded.price, price),
+        cost = cost + excluded.cost,
+        revenue = revenue + excluded.revenue'''
+
+@dataclass(frozen=True)
+class EnergyRecord:
+    slot: int
+    charger_energy: int
+    inverter_energy: int
+    solar_energy: int
+    price: Decimal | None
+    cost: Decimal
+    revenue: Decimal
+
+    @property
+    def timestamp(self):
+        return Triggers.get_slot_timestamp(self.slot)
+
+class EnergyStore:
+    # Quarter hour energy records in a SQLite database (WAL mode), indexed by slot.
+    # Not thread safe; all calls have to come from the same thread.
+    def __init__(self, file: str):
+        self.__file = file
+        self.__connection: sqlite3.Connection | None = None
+
+    def close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def add(self, record: EnergyRecord):
+        with self.__connect() as connection:
+            self.__add(connection, [record])
+
+    def get_totals(self, start: int, end: int):
+        # totals of the slots [start, end); every part of the range is read from the coarsest available rollup,
+        # so the cost depends on the number of buckets, not on the number of quarters
+        connection = self.__connect()
+        sums = [0, 0, 0, 0, 0, 0]
+        for tier, first, last in self.__split(start, end, list(_ROLLUP_TIERS.values())):
+            quarters = 'count(*)' if tier is _RAW_TIER else 'total(quarters)'
+            row = connection.execute(f'''
+                SELECT total(charger_energy), total(inverter_energy), total(solar_energy), total(cost), total(revenue), {quarters}
+                FROM {tier.table} WHERE {tier.key} >= ? AND {tier.key} < ?''', (first, last)).fetchone()
+            for i, value in enumerate(row):
+                sums[i] += int(value)
+        return EnergyTotals(sums[0], sums[1], sums[2], from_money_units(sums[3]), from_money_units(sums[4]), sums[5])
+
+    def get_rollups(self, resolution: str, start: int, end: int) -> list[tuple[int, EnergyTotals]]:
+        # (first slot of the bucket, totals) for all buckets starting within the slots [start, end)
+        tier = _ROLLUP_TIERS[resolution]
+        first = tier.get_bucket(start)
+        if tier.get_start(first) < start:
+            first += 1
+        rows = self.__connect().execute(f'''
+            SELECT bucket, charger_energy, inverter_energy, solar_energy, cost, revenue, quarters
+            FROM {tier.table} WHERE bucket >= ? AND bucket < ? ORDER BY bucket''', (first, tier.get_bucket(end - 1) + 1))
+        return [(tier.get_start(bucket), EnergyTotals(charger, inverter, solar, from_money_units(cost), from_money_units(revenue), quarters))
+                for bucket, charger, inverter, solar, cost, revenue, quarters in rows if tier.get_start(bucket) < end]
+
+    def compact(self, now: int, raw_retention: int | None, hourly_retention: int | None):
+        # drops quarters and hourly rollups older than their retention (in slots); the coarser rollups keep their totals
+        deleted = 0
+        with self.__connect() as connection:
+            if raw_retention is not None:
+                deleted += connection.execute('DELETE FROM energy WHERE slot < ?', (now - raw_retention,)).rowcount
+            if hourly_retention is not None:
+                hour_tier = _ROLLUP_TIERS['hour']
+                deleted += connection.execute(f'DELETE FROM {hour_tier.table} WHERE bucket < ?',
+                                              (hour_tier.get_bucket(now - hourly_retention),)).rowcount
+        return deleted
+
+    def get_range(self, start: int, end: int) -> list[EnergyRecord]:
+        # records of the slots [start, end)
+        rows = self.__connect().execute('''
+            SELECT slot, charger_energy, inverter_energy, solar_energy, price, cost, revenue
+            FROM energy WHERE slot >= ? AND slot < ? ORDER BY slot''', (start, end))
+        return [self.__from_row(x) for x in rows]
+
+    def get_bounds(self) -> tuple[int, int] | None:
+        # first slot, last slot
+        first, last = self.__connect().execute('SELECT min(slot), max(slot) FROM energy').fetchone()
+        return None if first is None else (first, last)
+
+    def import_csv(self, file: str):
+        # one time import of csv files written by former versions; returns the number of imported records or None if
+        # the file was already imported
+        connection = self.__connect()
+        if connection.execute('SELECT value FROM meta WHERE key = ?', (_CSV_IMPORTED_META_KEY,)).fetchone():
+            return None
+        with open(file, 'r', newline='') as stream:
+            records = list(read_csv(stream))
+        with connection:
+            self.__add(connection, records)
+            connection.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (_CSV_IMPORTED_META_KEY, datetime.now().isoformat()))
+        return len(records)
+
+    def export_csv(self, stream: TextIO, start: int, end: int):
+        writer = csv.writer(stream)
+        writer.writerow(_CSV_HEADER)
+        count = 0
+        for record in self.get_range(start, end):
+            # like the csv files written by EnergyTracker, the timestamp is the end of the quarter
+            writer.writerow((Triggers.get_slot_timestamp(record.slot + 1), record.charger_energy, record.inverter_energy, record.solar_energy,
+                             f'{record.cost:.8f}', f'{record.revenue:.8f}'))
+            count += 1
+        return count
+
+    def __connect(self):
+        if self.__connection is None:
+            connection = sqlite3.connect(self.__file, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS energy (
+                        slot INTEGER PRIMARY KEY,
+                        charger_energy INTEGER NOT NULL,
+                        inverter_energy INTEGER NOT NULL,
+                        solar_energy INTEGER NOT NULL,
+                        price INTEGER,
+                        cost INTEGER NOT NULL,
+                        revenue INTEGER NOT NULL)''')
+                for tier in _ROLLUP_TIERS.values():
+                    connection.execute(f'''
+                        CREATE TABLE IF NOT EXISTS {tier.table} (
+                            bucket INTEGER PRIMARY KEY,
+                            charger_energy INTEGER NOT NULL,
+                            inverter_energy INTEGER NOT NULL,
+                            solar_energy INTEGER NOT NULL,
+                            cost INTEGER NOT NULL,
+                            revenue INTEGER NOT NULL,
+                            quarters INTEGER NOT NULL)''')
+                connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                if not connection.execute('SELECT value FROM meta WHERE key = ?', (_ROLLUPS_META_KEY,)).fetchone():
+                    # databases of former versions have quarters only
+                    for tier in _ROLLUP_TIERS.values():
+                        connection.execute(f'''
+                            INSERT INTO {tier.table} (bucket, charger_energy, inverter_energy, solar_energy, cost, revenue, quarters)
+                            SELECT {tier.bucket_sql} AS b, sum(charger_energy), sum(inverter_energy), sum(solar_energy), sum(cost), sum(revenue), count(*)
+                            FROM energy GROUP BY b''')
+                    connection.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (_ROLLUPS_META_KEY, datetime.now().isoformat()))
+            self.__connection = connection
+        return self.__connection
+
+    def __add(self, connection: sqlite3.Connection, records: list[EnergyRecord]):
+        rows = [self.__to_row(x) for x in records]
+        is_new = []
+        for row in rows:
+            is_new.append(connection.execute('SELECT 1 FROM energy WHERE slot = ?', (row[0],)).fetchone() is None)
+            connection.execute(_UPSERT_SQL, row)
+        # the rollups get the same deltas as the quarters
+        for tier in _ROLLUP_TIERS.values():
+            connection.executemany(f'''
+                INSERT INTO {tier.table} (bucket, charger_energy, inverter_energy, solar_energy, cost, revenue, quarters)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (bucket) DO UPDATE SET
+                    charger_energy = charger_energy + excluded.charger_energy,
+                    inverter_energy = inverter_energy + excluded.inverter_energy,
+                    solar_energy = solar_energy + excluded.solar_energy,
+                    cost = cost + excluded.cost,
+                    revenue = revenue + excluded.revenue,
+                    quarters = quarters + excluded.quarters''',
+                ((tier.get_bucket(x[0]), x[1], x[2], x[3], x[5], x[6], int(y)) for x, y in zip(rows, is_new)))
+
+    @staticmethod
+    def __split(start: int, end: int, tiers: list[_Tier]) -> list[tuple[_Tier, int, int]]:
+        # splits the slots [start, end) into ranges of full buckets, using the coarsest tier possible
+        if start >= end:
+            return []
+        if not tiers:
+            return [(_RAW_TIER, start, end)]
+        tier = tiers[0]
+        first = tier.get_bucket(start)
+        if tier.get_start(first) < start:
+            first += 1
+        last = tier.get_bucket(end)
+        if first >= last:
+            return EnergyStore.__split(start, end, tiers[1:])
+        return EnergyStore.__split(start, tier.get_start(first), tiers[1:]) \
+            + [(tier, first, last)] \
+            + EnergyStore.__split(tier.get_start(last), end, tiers[1:])
+
+    @staticmethod
+    def __to_row(record: EnergyRecord):
+        return (record.slot, record.charger_energy, record.inverter_energy, record.solar_energy,
+                to_money_units(record.price) if record.price is not None else None,
+                to_money_units(record.cost), to_money_units(record.revenue))
+
+    @staticmethod
+    def __from_row(row: tuple):
+        slot, charger_energy, inverter_energy, solar_energy, price, cost, revenue = row
+        return EnergyRecord(slot, charger_energy, inverter_energy, solar_energy,
+                            from_money_units(price) if price is not None else None,
+                            from_money_units(cost), from_money_units(revenue))
+
+# money values are stored as integers in units of 1 / MONEY_SCALE €
+def to_money_units(value: Decimal):
+    return to_fixed(value, MONEY_SCALE)
+
+def from_money_units(value: int):
+    return to_decimal(value, MONEY_SCALE)
+
+def read_csv(stream: TextIO):
+    reader = csv.reader(stream)
+    for row in reader:
+        if not row or row[0] == _CSV_HEADER[0]:
+            continue
+        timestamp, charger_energy, inverter_energy, solar_energy, cost, revenue = row
+        # rows were written shortly after the end of the quarter they belong to
+        slot = Triggers.get_slot(datetime.fromisoformat(timestamp) - timedelta(minutes=2))
+        yield EnergyRecord(slot, int(charger_energy), int(inverter_energy), int(solar_energy), None, Decimal(cost), Decimal(revenue))
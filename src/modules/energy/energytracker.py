@@ -1,16 +1,29 @@
-import csv, os, datetime, logging
+import asyncio, csv, os, datetime, logging
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from ..core import get_optional_config_key, ENERGY_CONFIG_KEY, EventPayload
+from ..core import get_optional_config_key, ENERGY_CONFIG_KEY, EventPayload, Triggers
+from ..core.fixedpoint import MONEY_SCALE, PRICE_SCALE, div_half_even, to_decimal
 from ..core.triggers import triggers
-from ..uplink.virtualcontroller import VirtualController
+from ..uplink.virtualcontroller import VirtualController, Aggregate
 from ..price import PriceSource
+from .energystore import EnergyRecord, EnergyStore, from_money_units
 
 _CSV_FILE_CONFIG_KEY = 'csv_file'
+_DATABASE_FILE_CONFIG_KEY = 'database_file'
+_RAW_RETENTION_CONFIG_KEY = 'raw_retention'
+_HOURLY_RETENTION_CONFIG_KEY = 'hourly_retention'
+
+# price in units of 1 / PRICE_SCALE €/kWh times energy in Wh to money units
+_MONEY_DIVISOR = PRICE_SCALE * 1000 // MONEY_SCALE
 
 class EnergyTracker:
     def __init__(self, config : dict, uplink: VirtualController, prices: PriceSource):
         self.__csv_file = get_optional_config_key(config, str, None, None, ENERGY_CONFIG_KEY, _CSV_FILE_CONFIG_KEY)
-        if not self.__csv_file:
+        database_file = get_optional_config_key(config, str, None, None, ENERGY_CONFIG_KEY, _DATABASE_FILE_CONFIG_KEY)
+        # the store is only accessed from its own thread
+        self.__store = EnergyStore(database_file) if database_file else None
+        self.__store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='energy store') if database_file else None
+        if not (self.__csv_file or database_file):
             return
 
         self.__prices = prices
@@ -25,33 +38,88 @@ class EnergyTracker:
 
         triggers.add('energy', '1/15 * * * *', self.__handle_energy)
 
-    def __on_charger_energy(self, args: EventPayload[int]):
-        self.__charger_energy += args.data
+        if self.__store is not None:
+            # retention in days
+            self.__raw_retention = get_optional_config_key(config, int, None, None, ENERGY_CONFIG_KEY, _RAW_RETENTION_CONFIG_KEY)
+            self.__hourly_retention = get_optional_config_key(config, int, None, None, ENERGY_CONFIG_KEY, _HOURLY_RETENTION_CONFIG_KEY)
+            # totals of ranges shorter than a day are read from the hourly rollups, so they must outlive the quarters
+            if self.__hourly_retention is not None and (self.__raw_retention is None or self.__hourly_retention < self.__raw_retention):
+                raise ValueError('energy -> hourly_retention must be set to at least energy -> raw_retention.')
+            if self.__raw_retention is not None or self.__hourly_retention is not None:
+                triggers.add('energy compaction', '5 0 * * *', self.__compact)
+
+    @property
+    def store(self):
+        return self.__store
+
+    async def run_in_store(self, function, *args):
+        assert self.__store_executor is not None
+        return await asyncio.get_running_loop().run_in_executor(self.__store_executor, function, *args)
+
+    def start(self):
+        if self.__store is not None and self.__csv_file and os.path.exists(self.__csv_file):
+            asyncio.create_task(self.__import_csv())
+
+    async def __compact(self):
+        to_slots = lambda x: (x * 24 * 4) if (x is not None) else None
+        try:
+            deleted = await self.run_in_store(self.__store.compact,
+                Triggers.get_current_slot(), to_slots(self.__raw_retention), to_slots(self.__hourly_retention))
+        except Exception as e:
+            logging.error(f'Can not compact energy statistics: {e}')
+            return
+        logging.debug(f'Compacted energy statistics, {deleted} entries removed.')
+
+    async def __import_csv(self):
+        try:
+            count = await self.run_in_store(self.__store.import_csv, self.__csv_file)
+        except Exception as e:
+            logging.error(f'Can not import energy statistics from {self.__csv_file}: {e}')
+            return
+        if count is not None:
+            logging.info(f'Imported {count} energy records from {self.__csv_file}.')
 
-    def __on_inverter_energy(self, args: EventPayload[int]):
-        self.__inverter_energy += args.data
+    def __on_charger_energy(self, args: EventPayload[Aggregate[int]]):
+        self.__charger_energy += args.data.value
 
-    def __on_solar_energy(self, args: EventPayload[int]):
-        self.__solar_energy += args.data
+    def __on_inverter_energy(self, args: EventPayload[Aggregate[int]]):
+        self.__inverter_energy += args.data.value
 
-    def __handle_energy(self):
+    def __on_solar_energy(self, args: EventPayload[Aggregate[int]]):
+        self.__solar_energy += args.data.value
+
+    async def __handle_energy(self):
         now = datetime.datetime.now()
         price = self.__prices.get_previous()
         if price is None:
             logging.warning(f'Can not write energy statistics to file: no price data.')
             return
-        cost = (price.discharge * Decimal(self.__charger_energy)) / Decimal(-1000)
-        revenue = (price.discharge * Decimal(self.__inverter_energy)) / Decimal(1000)
+        # price * energy / 1000 is exact in units of 1e-8 € as long as the price has up to 5 decimal places
+        cost = from_money_units(div_half_even(-price.discharge * self.__charger_energy, _MONEY_DIVISOR))
+        revenue = from_money_units(div_half_even(price.discharge * self.__inverter_energy, _MONEY_DIVISOR))
 
         logging.debug(f'Energy from charger: {self.__charger_energy} Wh, cost={cost:.8f} €')
         logging.debug(f'Energy from inverter: {self.__inverter_energy} Wh, revenue={abs(revenue):.8f} €.')
         logging.debug(f'Energy from solar: {self.__solar_energy} Wh')
 
-        if self.__charger_energy or self.__inverter_energy or self.__solar_energy:
-            self.__write_to_csv(now, self.__charger_energy, self.__inverter_energy, self.__solar_energy, cost, revenue)
+        charger_energy, inverter_energy, solar_energy = self.__charger_energy, self.__inverter_energy, self.__solar_energy
         self.__charger_energy = 0
         self.__inverter_energy = 0
         self.__solar_energy = 0
+        if not (charger_energy or inverter_energy or solar_energy):
+            return
+        # file I/O must not block the event loop
+        if self.__store is not None:
+            # the energy was measured in the previous quarter
+            slot = Triggers.get_slot(now - datetime.timedelta(minutes=2))
+            record = EnergyRecord(slot, charger_energy, inverter_energy, solar_energy, to_decimal(price.discharge, PRICE_SCALE), cost, revenue)
+            try:
+                await self.run_in_store(self.__store.add, record)
+            except Exception as e:
+                logging.error(f'Can not write energy statistics to database: {e}')
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.__write_to_csv,
+                now, charger_energy, inverter_energy, solar_energy, cost, revenue)
 
     def __write_to_csv(self, timestamp: datetime.datetime, charger_energy: int, inverter_energy: int, solar_energy: int, cost: Decimal, revenue:Decimal):
         assert self.__csv_file is not None
@@ -1,7 +1,8 @@
+import json
 from nicegui import ui
 from nicegui.binding import BindableProperty
-from nicegui.events import Handler, ValueChangeEventArguments
-from typing import Optional, cast
+from nicegui.events import GenericEventArguments, Handler, ValueChangeEventArguments
+from typing import Callable, Optional, cast
 from typing_extensions import Self
 
 class colorful_toggle(ui.toggle):
@@ -14,3 +15,33 @@ class colorful_toggle(ui.toggle):
 
     def _handle_background_change(self, rgb_code: str):
         self.style(f'background-color: {rgb_code}')
+
+class mode_table(ui.table):
+    # All rows are sent as one payload; the browser renders only the visible rows.
+    # The column named "mode" is rendered as toggle, changes are reported as (row key, mode).
+    def __init__(self, columns: list[dict], row_key: str, modes: dict[str | None, str],
+                 on_mode_change: Callable[[int, str | None], None], colored: bool = False):
+        super().__init__(columns=columns, rows=[], row_key=row_key)
+        self.props('virtual-scroll dense flat bordered hide-bottom :virtual-scroll-item-size="48"')
+        self.classes('h-[75vh]')
+        options = json.dumps([{'label': y, 'value': x} for x, y in modes.items()])
+        background = ''' :style="{'background-color': props.row.color}"''' if colored else ''
+        self.add_slot('body-cell-mode', f'''
+            <q-td key="mode" :props="props">
+                <q-btn-toggle :model-value="props.row.mode" :options='{options}'{background} no-caps unelevated
+                    @update:model-value="value => $parent.$emit('mode_change', {{key: props.key, mode: value}})" />
+            </q-td>''')
+        self.__row_key = row_key
+        self.__modes = modes
+        self.__on_mode_change = on_mode_change
+        self.on('mode_change', self.__mode_change_handler)
+
+    def __mode_change_handler(self, args: GenericEventArguments):
+        # the event comes from the browser, so only rows shown and modes offered are accepted
+        key = args.args.get('key')
+        mode = args.args.get('mode')
+        if not (mode is None or isinstance(mode, str)) or mode not in self.__modes:
+            return
+        if type(key) is not int or not any(x[self.__row_key] == key for x in self.rows):
+            return
+        self.__on_mode_change(key, mode)
@@ -1,15 +1,20 @@
-import logging
+import logging, time, tracemalloc
 from fastapi import Request
 from functools import partial
 from nicegui import app, ui, Client
 from typing import Any
 
-from ..core import get_config_key, WEB_CONFIG_KEY, app_state
+from ..core import get_config_key, get_optional_config_key, WEB_CONFIG_KEY, app_state
+from ..core.metrics import DurationStats
 from .login import create_login_page, logout, HOME_PATH, LOGIN_PATH, get_session_id, get_current_user
+from .models.backtestmodel import BacktestModel
 from .models.homemodel import HomeModel
+from .models.modeltypes import UpdateLimiter
 from .models.schedulemodel import ScheduleModel
+from .models.scheduleview import schedule_view
 from .models.settingsmodel import SettingsModel
 from .models.templatemodel import TemplateModel
+from .tabs.backtesttab import create_backtest_tab
 from .tabs.hometab import create_home_tab
 from .tabs.scheduletab import create_schedule_tab
 from .tabs.settingstab import create_settings_tab
@@ -17,6 +22,8 @@ from .tabs.templatetab import create_template_tab
 
 _LISTEN_CONFIG_KEY = 'listen'
 _PORT_CONFIG_KEY = 'port'
+_VIRTUAL_TABLES_CONFIG_KEY = 'virtual_tables'
+_UPDATE_RATE_CONFIG_KEY = 'update_rate'
 
 _LISTEN_ENV_NAME = 'HBRE_WEB_LISTEN'
 _PORT_ENV_NAME = 'HBRE_WEB_PORT'
@@ -25,11 +32,13 @@ _HOME_NAME = 'Home'
 _SCHEDULE_NAME = 'Schedule'
 _TEMPLATE_NAME = 'Template'
 _SETTINGS_NAME = 'Settings'
+_BACKTEST_NAME = 'Backtest'
 _LOGOUT_NAME = 'Logout'
 
 _SCHEDULE_PATH = '/schedule'
 _TEMPLATE_PATH = '/template'
 _SETTINGS_PATH = '/settings'
+_BACKTEST_PATH = '/backtest'
 
 # used for login pages, since they do not have a real model
 class FakeModel:
@@ -37,11 +46,16 @@ class FakeModel:
         pass
 
 models_by_instance_id: dict[str, Any] = {}
+page_build_stats: dict[str, DurationStats] = {}
 
 class Gui:
     def __init__(self, config: dict):
         self.__host = get_config_key(config, str, _LISTEN_ENV_NAME, WEB_CONFIG_KEY, _LISTEN_CONFIG_KEY)
         self.__port = get_config_key(config, int, _PORT_ENV_NAME, WEB_CONFIG_KEY, _PORT_CONFIG_KEY)
+        virtual_tables = get_optional_config_key(config, bool, False, None, WEB_CONFIG_KEY, _VIRTUAL_TABLES_CONFIG_KEY)
+        update_rate = get_optional_config_key(config, float, 5.0, None, WEB_CONFIG_KEY, _UPDATE_RATE_CONFIG_KEY)
+
+        schedule_view.start()
 
         @ui.page(LOGIN_PATH)
         def login_page(request: Request):
@@ -52,22 +66,27 @@ class Gui:
         
         @ui.page(HOME_PATH)
         def home_page(request: Request):
-            create_page(_HOME_NAME, request)
+            create_page(_HOME_NAME, request, virtual_tables, update_rate)
 
         @ui.page(_SCHEDULE_PATH)
         def schedule_page(request: Request):
-            create_page(_SCHEDULE_NAME, request)
+            create_page(_SCHEDULE_NAME, request, virtual_tables, update_rate)
 
         @ui.page(_TEMPLATE_PATH)
         def template_page(request: Request):
-            create_page(_TEMPLATE_NAME, request)
+            create_page(_TEMPLATE_NAME, request, virtual_tables, update_rate)
 
         @ui.page(_SETTINGS_PATH)
         def settings_page(request: Request):
-            create_page(_SETTINGS_NAME, request)
+            create_page(_SETTINGS_NAME, request, virtual_tables, update_rate)
+
+        @ui.page(_BACKTEST_PATH)
+        def backtest_page(request: Request):
+            create_page(_BACKTEST_NAME, request, virtual_tables, update_rate)
 
-    def run(self, storage_secret: str, startup_callback):
+    def run(self, storage_secret: str, startup_callback, shutdown_callback):
         app.on_startup(startup_callback)
+        app.on_shutdown(shutdown_callback)
         app.on_delete(destroy_cliend)
         app.on_exception(on_exception)
         ui.run(
@@ -80,7 +99,7 @@ class Gui:
             binding_refresh_interval=None,
             show=False)
         
-def create_page(tab_name: str, request: Request):
+def create_page(tab_name: str, request: Request, virtual_tables: bool, update_rate: float):
     user_name = get_current_user(request)
     if not user_name:
         ui.navigate.to(LOGIN_PATH)
@@ -95,6 +114,8 @@ def create_page(tab_name: str, request: Request):
         logging.warning(f'instance_id={instance_id} was reused.')
         old_model.destroy()
     logging.debug(f'Create page "{tab_name}" for instance_id={instance_id}')
+    start_time = time.perf_counter()
+    start_memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
 
     with ui.header().classes(replace='row items-center justify-center gap-2'):
         create_navigation_button(_HOME_NAME, HOME_PATH, tab_name)
@@ -102,27 +123,41 @@ def create_page(tab_name: str, request: Request):
         create_navigation_button(_TEMPLATE_NAME, _TEMPLATE_PATH, tab_name)
         if is_admin:
             create_navigation_button(_SETTINGS_NAME, _SETTINGS_PATH, tab_name)
+            create_navigation_button(_BACKTEST_NAME, _BACKTEST_PATH, tab_name)
         ui.button(_LOGOUT_NAME, on_click=partial(logout, get_session_id(request))).props('flat').classes('text-white')
 
     # Route to the appropriate content based on the tab_name
     with ui.column().classes('w-full p-4'):
         if tab_name == _HOME_NAME:
-            model = HomeModel(instance_id)
+            model = HomeModel(instance_id, UpdateLimiter(update_rate))
             create_home_tab(model)
         elif tab_name == _SCHEDULE_NAME:
-            model = ScheduleModel(instance_id)
-            create_schedule_tab(model)
+            model = ScheduleModel(instance_id, UpdateLimiter(update_rate), virtual_tables)
+            create_schedule_tab(model, virtual_tables)
         elif tab_name == _TEMPLATE_NAME:
-            model = TemplateModel(instance_id)
-            create_template_tab(model)
+            model = TemplateModel(instance_id, UpdateLimiter(update_rate), virtual_tables)
+            create_template_tab(model, virtual_tables)
         elif tab_name == _SETTINGS_NAME and is_admin:
             model = SettingsModel(instance_id)
             create_settings_tab(model)
+        elif tab_name == _BACKTEST_NAME and is_admin:
+            model = BacktestModel(instance_id)
+            create_backtest_tab(model)
         else:
             model = FakeModel()
             ui.label('Access denied or invalid page.')
     models_by_instance_id[instance_id] = model
 
+    build_time = time.perf_counter() - start_time
+    if (stats := page_build_stats.get(tab_name)) is None:
+        stats = DurationStats()
+        page_build_stats[tab_name] = stats
+    stats.add(build_time)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        # memory is only known if tracing was enabled, e.g. with PYTHONTRACEMALLOC=1
+        memory = f'{(tracemalloc.get_traced_memory()[0] - start_memory) / 1024:.0f} KiB' if start_memory is not None else 'unknown'
+        logging.debug(f'Page "{tab_name}" built in {build_time * 1000:.1f} ms; elements: {len(ui.context.client.elements)}; memory: {memory}; {stats}')
+
 def destroy_cliend(client: Client):
     instance_id = client.id
     old_model = models_by_instance_id.pop(instance_id, None)
@@ -130,7 +165,7 @@ def destroy_cliend(client: Client):
         logging.warning(f'instance_id={instance_id} was double deleted.')
         return
     old_model.destroy()
-    logging.debug(f'instance_id={instance_id} deleted.')
+    logging.debug(f'instance_id={instance_id} deleted; app state subscribers: {sum(app_state.get_subscriber_counts().values())}')
 
 def on_exception(e: Exception):
     logging.error(f'Exception from gui: {e}')
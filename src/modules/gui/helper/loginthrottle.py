@@ -0,0 +1,50 @@
+import time
+
+_FREE_FAILURES = 3
+_BASE_DELAY = 2.0
+_MAX_DELAY = 300.0
+_FORGET_AFTER = 3600.0
+_PRUNE_SIZE = 1024
+
+class _Record:
+    def __init__(self):
+        self.failures = 0
+        self.blocked_until = 0.0
+        self.last_failure = 0.0
+
+class LoginThrottle:
+    def __init__(self):
+        self.__records: dict[str, _Record] = {}
+
+    def get_wait_time(self, *keys: str):
+        now = time.monotonic()
+        wait = 0.0
+        for key in keys:
+            if (record := self.__records.get(key)) is not None:
+                wait = max(wait, record.blocked_until - now)
+        return wait
+
+    def add_failure(self, *keys: str):
+        now = time.monotonic()
+        for key in keys:
+            if (record := self.__records.get(key)) is None:
+                record = _Record()
+                self.__records[key] = record
+            record.failures += 1
+            record.last_failure = now
+            if record.failures > _FREE_FAILURES:
+                delay = min(_BASE_DELAY * (2 ** (record.failures - _FREE_FAILURES - 1)), _MAX_DELAY)
+                record.blocked_until = now + delay
+        if len(self.__records) > _PRUNE_SIZE:
+            self.__prune(now)
+
+    def add_success(self, *keys: str):
+        for key in keys:
+            self.__records.pop(key, None)
+
+    def __prune(self, now: float):
+        stale = [x for x, y in self.__records.items() if (now - y.last_failure) > _FORGET_AFTER]
+        for key in stale:
+            del self.__records[key]
+
+login_throttle = LoginThrottle()
@@ -1,11 +1,12 @@
-import logging, secrets
+import logging, math, secrets
 from argon2.exceptions import VerifyMismatchError
 from fastapi import Request
 from fastapi.responses import RedirectResponse
 
 from nicegui import app, ui
 
-from ..core import app_state, password_hasher
+from ..core import app_state, password_service, PasswordServiceBusyError
+from .helper.loginthrottle import login_throttle
 
 HOME_PATH = '/'
 LOGIN_PATH = '/login'
@@ -40,7 +41,12 @@ def do_login(token: str):
     return response
 
 def create_login_page(request: Request):
-    def try_login() -> None:  # local function to avoid passing username and password as arguments
+    async def try_login() -> None:  # local function to avoid passing username and password as arguments
+        throttle_keys = (f'user:{username.value}', f'ip:{client_host}')
+        if (wait_time := login_throttle.get_wait_time(*throttle_keys)) > 0:
+            logging.warning(f'Throttled login attempt for user {username.value} from {client_host}.')
+            ui.notify(f'Too many failed login attempts, try again in {math.ceil(wait_time)} s.', color='negative')
+            return
         try:
             if username.value == app_state.data.admin_user.value:
                 hash = app_state.data.admin_pass.value
@@ -50,16 +56,22 @@ def create_login_page(request: Request):
                 raise VerifyMismatchError()
         
             if hash:
-                password_hasher.verify(hash, password.value)
+                await password_service.verify(hash, password.value)
         except VerifyMismatchError:
             logging.warning(f'Failed login attempt for user {username.value}.')
+            login_throttle.add_failure(*throttle_keys)
             ui.notify('Wrong username or password.', color='negative')
             return
+        except PasswordServiceBusyError:
+            logging.warning(f'Rejected login attempt for user {username.value}: too many pending logins.')
+            ui.notify('Server busy, please try again.', color='negative')
+            return
         except Exception as e:
             logging.error(f'Login failed for user {username.value}: {e}')
             ui.notify('Internal error.', color='negative')
             return
 
+        login_throttle.add_success(*throttle_keys)
         otp = secrets.token_urlsafe(24)
         new_session_id = secrets.token_urlsafe(32)
         logins_by_session_id[new_session_id] = username.value
@@ -70,6 +82,8 @@ def create_login_page(request: Request):
     if get_current_user(request):
         return RedirectResponse(HOME_PATH)
 
+    client_host = request.client.host if request.client else 'unknown'
+
     with ui.card().classes('absolute-center'):
         ui.label(app_state.data.instance_name.value)
         username = ui.input('Username').on('keydown.enter', try_login)
@@ -0,0 +1,61 @@
+import asyncio
+from ...core import Triggers, app_state
+from ...schedule import Battery, BacktestResult, BacktestTotals, load_history, get_template_modes, run_backtest
+from ..singletons import singletons
+from .modeltypes import BindableValue
+
+class BacktestModel:
+    def __init__(self, id: str):
+        battery = singletons.battery or Battery(0, 0, 0)
+        self.is_available = singletons.energy_tracker.store is not None
+        self.days = BindableValue(30)
+        self.capacity = BindableValue(battery.capacity)
+        self.charge_power = BindableValue(battery.charge_power)
+        self.discharge_power = BindableValue(battery.discharge_power)
+        self.respect_margin = BindableValue(False)
+        self.is_running = BindableValue(False)
+        self.summary = BindableValue('')
+        self.result_rows = BindableValue([])
+
+    def destroy(self):
+        pass
+
+    async def run(self):
+        battery = Battery(int(self.capacity.value or 0), int(self.charge_power.value or 0), int(self.discharge_power.value or 0))
+        if battery.capacity <= 0:
+            raise ValueError('Battery capacity must be set.')
+        end = Triggers.get_current_slot()
+        start = end - int(self.days.value or 0) * 24 * 4
+        template = app_state.data.template.value
+        charger_eta = app_state.data.charger_efficiency.value
+        inverter_eta = app_state.data.inverter_efficiency.value
+        minimum_margin = app_state.data.minimum_margin.value
+
+        tracker = singletons.energy_tracker
+        self.is_running.set(True)
+        try:
+            history = await tracker.run_in_store(load_history, tracker.store, start, end)
+            result = await asyncio.get_running_loop().run_in_executor(None, run_backtest,
+                history, get_template_modes(template, start, end), battery,
+                charger_eta, inverter_eta, minimum_margin, self.respect_margin.value)
+        finally:
+            self.is_running.set(False)
+        self.__show(result)
+
+    def __show(self, result: BacktestResult):
+        self.summary.set(f'Charge quarters: {result.charge_quarters}; discharge quarters: {result.discharge_quarters}; '
+                         f'below minimum margin: {result.below_margin_quarters}; without price: {result.unpriced_quarters}')
+        self.result_rows.set([
+            self.__to_row('Template', result.simulated),
+            self.__to_row('Recorded', result.recorded)])
+
+    @staticmethod
+    def __to_row(name: str, totals: BacktestTotals):
+        return {
+            'name': name,
+            'charger_energy': f'{totals.charger_energy / 1000:.1f}',
+            'inverter_energy': f'{totals.inverter_energy / 1000:.1f}',
+            'solar_energy': f'{totals.solar_energy / 1000:.1f}',
+            'cost': f'{totals.cost:.2f}',
+            'revenue': f'{totals.revenue:.2f}',
+            'profit': f'{totals.profit:.2f}'}
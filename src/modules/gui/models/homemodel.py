@@ -1,24 +1,25 @@
-from ...core import OperationMode, app_state
+from ...core import EventPayload, KeyedChange, OperationMode, app_state
 from ..singletons import singletons
-from .modeltypes import BindableValue, BridgedValue
+from .modeltypes import BindableValue, BridgedValue, UpdateLimiter
 
 
 class HomeControllerState:
-    def __init__(self, mode_actual: str = '', mode_control_type: str = '', locks: str = ''):
-        self.mode_actual = BindableValue(mode_actual)
-        self.mode_control_type = BindableValue(mode_control_type)
-        self.locks = BindableValue(locks)
+    def __init__(self, limiter: UpdateLimiter | None = None):
+        self.mode_actual = BindableValue('', limiter)
+        self.mode_control_type = BindableValue('', limiter)
+        self.locks = BindableValue('', limiter)
 
 class HomeModel:
-    def __init__(self, id: str):
+    def __init__(self, id: str, limiter: UpdateLimiter):
         self.__id = id
+        self.__limiter = limiter
 
         system = singletons.virtual_controller
 
-        self.requested_mode = BridgedValue(id, app_state.data.requested_mode, lambda x: x.value)
-        self.manual_mode = BridgedValue(id, app_state.data.manual_mode, lambda x: x)
+        self.requested_mode = BridgedValue(id, app_state.data.requested_mode, lambda x: x.value, limiter)
+        self.manual_mode = BridgedValue(id, app_state.data.manual_mode, lambda x: x, limiter)
 
-        self.controller_states = {name: HomeControllerState() for name in system.controllers}
+        self.controller_states = {name: HomeControllerState(limiter) for name in system.controllers}
 
         self.__mode_actual_change_handler()
         app_state.data.actual_mode.on_change.subscribe(self.__mode_actual_change_handler, id=id)
@@ -29,16 +30,22 @@ class HomeModel:
         self.__locks_change_handler()
         app_state.data.locks.on_change.subscribe(self.__locks_change_handler, id=id)
 
+        # the page is built with the initial values, not with a later update
+        limiter.flush()
+
     def destroy(self):
         self.requested_mode.destroy()
         self.manual_mode.destroy()
         app_state.data.actual_mode.on_change.unsubscribe_by_id(self.__id)
         app_state.data.manual_mode.on_change.unsubscribe_by_id(self.__id)
         app_state.data.locks.on_change.unsubscribe_by_id(self.__id)
+        self.__limiter.destroy()
 
-    def __mode_actual_change_handler(self, _ = None):
-        for name, mode in app_state.data.actual_mode.value.items():
-            self.controller_states[name].mode_actual.set(self.__print_mode(mode))
+    def __mode_actual_change_handler(self, args: EventPayload[KeyedChange[str, OperationMode | None]] | None = None):
+        names = (args.data.key,) if args else self.controller_states.keys()
+        for name in names:
+            if (state := self.controller_states.get(name)) is not None:
+                state.mode_actual.set(self.__print_mode(app_state.data.actual_mode.get(name)))
 
     def __manual_mode_change_handler(self, _ = None):
         mode = app_state.data.manual_mode.value
@@ -50,16 +57,17 @@ class HomeModel:
                 type_ = 'manual' if bool(mode) else 'schedule'
             self.controller_states[name].mode_control_type.set(type_)
 
-    def __locks_change_handler(self, _ = None):
-        all_locks = app_state.data.locks.value
-        system = singletons.virtual_controller
-        for name in system.controllers:
-            locks = all_locks.get(name)
+    def __locks_change_handler(self, args: EventPayload[KeyedChange[str, tuple[str, ...]]] | None = None):
+        names = (args.data.key,) if args else self.controller_states.keys()
+        for name in names:
+            if (state := self.controller_states.get(name)) is None:
+                continue
+            locks = app_state.data.locks.get(name)
             if locks is None:
                 locks_str = '(unknown)'
             else:
                 locks_str = '\n'.join(sorted(locks)) or '(none)'
-            self.controller_states[name].locks.set(locks_str)
+            state.locks.set(locks_str)
 
     @staticmethod
     def __print_mode(value: OperationMode | None):
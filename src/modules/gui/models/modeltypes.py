@@ -1,28 +1,85 @@
+import asyncio, math, time
 from nicegui import binding
-from typing import Generic, TypeVar, Callable
+from typing import Any, Generic, TypeVar, Callable
 from ...core import AppStateValue, EventPayload
 
 T = TypeVar('T')
 TIn = TypeVar('TIn')
 TOut= TypeVar('TOut')
 
+class UpdateLimiter:
+    # Delivers the changes of the bindable values of one client in batches, at most max_rate batches per second.
+    # Changes arriving within the minimum interval are delivered at its end; only the last value of a bindable is sent.
+    def __init__(self, max_rate: float):
+        self.__interval = (1 / max_rate) if max_rate > 0 else 0.0
+        self.__pending: dict[Any, Any] = {}
+        self.__handle: asyncio.TimerHandle | None = None
+        self.__last_flush = -math.inf
+        self.batches = 0
+        self.changes = 0
+
+    def set(self, target: 'BindableValue | BridgedValue', value: Any):
+        if target in self.__pending:
+            self.__pending[target] = value
+            return
+        if value == target.value:
+            return
+        self.__pending[target] = value
+        if self.__handle is None:
+            self.__schedule()
+
+    def flush(self):
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+        pending = self.__pending
+        self.__pending = {}
+        self.__last_flush = time.monotonic()
+        if not pending:
+            return
+        self.batches += 1
+        self.changes += len(pending)
+        for target, value in pending.items():
+            target.value = value
+
+    def destroy(self):
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+        self.__pending.clear()
+
+    def __schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        # even without delay, all changes of the current callback end up in the same batch
+        delay = max(0.0, self.__last_flush + self.__interval - time.monotonic())
+        self.__handle = loop.call_later(delay, self.flush)
+
 class BindableValue(Generic[T]):
     value = binding.BindableProperty()
 
-    def __init__(self, value: T):
+    def __init__(self, value: T, limiter: UpdateLimiter | None = None):
         self.value = value
+        self.__limiter = limiter
 
     def set(self, value):
-        self.value = value
+        if self.__limiter is not None:
+            self.__limiter.set(self, value)
+        elif value != self.value:
+            self.value = value
 
 class BridgedValue(Generic[TIn, TOut]):
     value = binding.BindableProperty()
 
-    def __init__(self, id: str, source: AppStateValue[TIn], cast: Callable[[TIn], TOut]):
+    def __init__(self, id: str, source: AppStateValue[TIn], cast: Callable[[TIn], TOut], limiter: UpdateLimiter | None = None):
         self.__id = id
         self.value = cast(source.value)
         self.__cast = cast
         self.__source = source
+        self.__limiter = limiter
         source.on_change.subscribe(self.__source_value_change_handler, id=id)
 
     def destroy(self):
@@ -30,4 +87,8 @@ class BridgedValue(Generic[TIn, TOut]):
         self.__source = None
 
     def __source_value_change_handler(self, args: EventPayload[TIn]):
-        self.value = self.__cast(args.data)
+        value = self.__cast(args.data)
+        if self.__limiter is not None:
+            self.__limiter.set(self, value)
+        elif value != self.value:
+            self.value = value
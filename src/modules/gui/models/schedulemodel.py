@@ -1,125 +1,149 @@
 from datetime import datetime
 from decimal import Decimal
-from statistics import mean
 
-from ...core import OperationMode, app_state, SCHEDULE_LENGTH
+from ...core import OperationMode, Schedule, app_state, SCHEDULE_LENGTH
+from .modeltypes import BindableValue, BridgedValue, UpdateLimiter
 from ..singletons import singletons
-from .modeltypes import BindableValue, BridgedValue
-
-_DATE_FORMAT_DMY_HM = "%d.%m.%y %H:%M"
+from .scheduleview import ScheduleViewRow, schedule_view
 
 class ScheduleRow:
-    def __init__(self):
+    def __init__(self, limiter: UpdateLimiter | None = None):
+        self.slot = -1
         self.raw_timestamp = datetime.min
-        self.timestamp = BindableValue('')
-        self.mode = BindableValue('')
-        self.color = BindableValue('')
-        self.charge_price = BindableValue('')
-        self.discharge_price = BindableValue('')
-        self.charge_margin = BindableValue('')
-        self.battery_margin = BindableValue('')
+        self.timestamp = BindableValue('', limiter)
+        self.mode = BindableValue('', limiter)
+        self.color = BindableValue('', limiter)
+        self.charge_price = BindableValue('', limiter)
+        self.discharge_price = BindableValue('', limiter)
+        self.charge_margin = BindableValue('', limiter)
+        self.battery_margin = BindableValue('', limiter)
+        self.projected_capacity = BindableValue('', limiter)
+        self.projected_price = BindableValue('', limiter)
+
+    def show(self, view_row: ScheduleViewRow, mode: str | None):
+        self.slot = view_row.slot
+        self.raw_timestamp = view_row.raw_timestamp
+        self.timestamp.set(view_row.timestamp)
+        self.mode.set(mode)
+        self.color.set(view_row.color)
+        self.charge_price.set(view_row.charge_price)
+        self.discharge_price.set(view_row.discharge_price)
+        self.charge_margin.set(view_row.charge_margin)
+        self.battery_margin.set(view_row.battery_margin)
+        self.projected_capacity.set(view_row.projected_capacity)
+        self.projected_price.set(view_row.projected_price)
 
 class ScheduleModel:
-    def __init__(self, id: str):
+    def __init__(self, id: str, limiter: UpdateLimiter, virtual: bool = False):
         self.__id = id
+        self.__limiter = limiter
+        self.__virtual = virtual
 
         self.is_dirty = BindableValue(False)
+        # modes edited by the user, but not saved yet; by slot
+        self.__edits: dict[int, str | None] = {}
+        self.__view_rows: tuple[ScheduleViewRow, ...] = ()
 
-        self.capacity = BridgedValue(id, app_state.data.remaining_capacity, self.__print_capacity)
-        self.avg_price = BridgedValue(id, app_state.data.avg_charged_price, self.__print_avg_price)
+        self.capacity = BridgedValue(id, app_state.data.remaining_capacity, self.__print_capacity, limiter)
+        self.avg_price = BridgedValue(id, app_state.data.avg_charged_price, self.__print_avg_price, limiter)
+        # slots are only pinned for the schedule optimizer
+        self.pins_slots = singletons.optimizer.is_enabled
+        self.has_pinned_slots = BridgedValue(id, app_state.data.pinned_slots, bool, limiter)
 
-        self.schedule = [ScheduleRow() for _ in range(SCHEDULE_LENGTH)]
+        # virtual tables get all rows as a single payload, the others bind every cell
+        self.schedule = [] if virtual else [ScheduleRow(limiter) for _ in range(SCHEDULE_LENGTH)]
+        self.table_rows: BindableValue[list[dict]] = BindableValue([], limiter)
 
-        app_state.data.avg_charged_price.on_change.subscribe(self.refresh, id=id)
-        app_state.data.minimum_margin.on_change.subscribe(self.refresh, id=id)
-        app_state.data.charger_efficiency.on_change.subscribe(self.refresh, id=id)
-        app_state.data.inverter_efficiency.on_change.subscribe(self.refresh, id=id)
-        app_state.data.prices_revision.on_change.subscribe(self.refresh, id=id)
-        app_state.data.schedule.on_change.subscribe(self.refresh, id=id)
+        schedule_view.on_change.subscribe(self.refresh, id=id)
         self.refresh()
 
+        # the page is built with the initial values, not with a later update
+        limiter.flush()
+
     def destroy(self):
         self.capacity.destroy()
         self.avg_price.destroy()
-        app_state.data.avg_charged_price.on_change.unsubscribe_by_id(self.__id)
-        app_state.data.minimum_margin.on_change.unsubscribe_by_id(self.__id)
-        app_state.data.charger_efficiency.on_change.unsubscribe_by_id(self.__id)
-        app_state.data.inverter_efficiency.on_change.unsubscribe_by_id(self.__id)
-        app_state.data.prices_revision.on_change.unsubscribe_by_id(self.__id)
-        app_state.data.schedule.on_change.unsubscribe_by_id(self.__id)
+        self.has_pinned_slots.destroy()
+        schedule_view.on_change.unsubscribe_by_id(self.__id)
+        self.__limiter.destroy()
 
     def refresh(self, _ = None):
-        if self.is_dirty.value:
-            # changes to capacity and avg price happen quite often,
-            # we want the user not loose their input
-            return
-
-        price_source = singletons.price
-        schedule: dict[datetime, OperationMode] = app_state.data.schedule.value
-        assert len(schedule) == SCHEDULE_LENGTH
-        min_margin: Decimal = app_state.data.minimum_margin.value
-        avg_charged_price: Decimal = app_state.data.avg_charged_price.value
-
-        prices = {ts: prices for ts in schedule.keys() if (prices := price_source.get_at(ts))}
-        
-        price_values = prices.values()
-        charge_minimum = min((x.charge for x in price_values), default=Decimal(0))
-        charge_maximum = max((x.charge for x in price_values), default=Decimal(0))
-        charge_avg = mean(x.charge for x in price_values) if price_values else Decimal(0)
-        discharge_maximum = max((x.discharge for x in price_values), default=Decimal(0))
-
-        previous_mode = None
-
-        for i, timestamp in enumerate(sorted(schedule.keys())):
-            row = self.schedule[i]
-            row.raw_timestamp = timestamp
-            row.timestamp.set(timestamp.strftime(_DATE_FORMAT_DMY_HM))
-            mode = schedule[timestamp].value
-            row.mode.set(None if (mode == previous_mode) else mode)
-            previous_mode = mode  
-
-            if (prices_at := prices.get(timestamp)):
-                row.color.set(self.__get__color(charge_avg, charge_minimum, charge_maximum, prices_at.charge))
-
-                row.charge_price.set(f'{(prices_at.charge * Decimal(100)):.2f}')
-
-                row.discharge_price.set(f'{(prices_at.discharge * Decimal(100)):.2f}')
-
-                if (battery_margin := (prices_at.discharge - avg_charged_price)) >= min_margin:
-                    row.battery_margin.set(f'{(battery_margin * 100):.2f}')
-                else:
-                    row.battery_margin.set('')
-
-                if (discharge_margin := (prices_at.discharge - charge_minimum)) >= min_margin:
-                    row.charge_margin.set(f'{(discharge_margin * 100):.2f}')
-                elif (discharge_maximum - prices_at.charge) >= min_margin:
-                    charge_penalty = charge_minimum - prices_at.charge
-                    row.charge_margin.set(f'{(charge_penalty * 100):.2f}')
-                else:
-                    row.charge_margin.set('')
-            else:
-                row.color.set("#A0A0A0")
-                row.charge_price.set('')
-                row.discharge_price.set('')
-                row.charge_margin.set('')
-                row.battery_margin.set('')
+        # edits survive the refresh, so changes to capacity and avg price do not make the user loose their input
+        rows = schedule_view.rows
+        assert len(rows) == SCHEDULE_LENGTH
+        self.__view_rows = rows
+        if self.__edits:
+            first_slot = rows[0].slot
+            self.__edits = {x: y for x, y in self.__edits.items() if x >= first_slot}
+            self.is_dirty.set(bool(self.__edits))
+        if self.__virtual:
+            self.__update_table_rows()
+        else:
+            for row, view_row in zip(self.schedule, rows):
+                row.show(view_row, self.__edits.get(view_row.slot, view_row.mode))
+
+    def get_mode(self, slot: int):
+        # the mode as edited by the user; the bound rows lag behind because of the update limiter
+        if slot in self.__edits:
+            return self.__edits[slot]
+        index = slot - self.__view_rows[0].slot if self.__view_rows else -1
+        return self.__view_rows[index].mode if 0 <= index < len(self.__view_rows) else None
+
+    def set_mode(self, slot: int, mode: str | None):
+        self.__edits[slot] = mode
+        self.is_dirty.set(True)
+        if self.__virtual:
+            self.__update_table_rows()
+        elif (row := next((x for x in self.schedule if x.slot == slot), None)):
+            row.mode.set(mode)
+
+    def discard_edits(self):
+        self.__edits.clear()
+        self.is_dirty.set(False)
+        self.refresh()
 
     def write_schedule(self):
-        schedule: dict[datetime, OperationMode] = {}
+        edits: list[tuple[datetime, OperationMode]] = []
 
         previous_mode = None
-        for row in sorted(self.schedule, key=lambda x: x.raw_timestamp):
-            timestamp = row.raw_timestamp
-            mode = OperationMode(row.mode.value or previous_mode or OperationMode.IDLE.value)
+        for view_row in self.__view_rows:
+            mode = OperationMode(self.__edits.get(view_row.slot, view_row.mode) or previous_mode or OperationMode.IDLE.value)
             previous_mode = mode.value
-            schedule[timestamp] = mode
+            edits.append((view_row.raw_timestamp, mode))
 
-        app_state.data.schedule.set(schedule)
-        app_state.save()
+        # modes set by the user are kept by the schedule optimizer
+        first_slot = self.__view_rows[0].slot
+        pinned_slots = frozenset(x for x in app_state.data.pinned_slots.value if x >= first_slot) \
+            | frozenset(x for x, y in self.__edits.items() if y is not None)
+
+        schedule: Schedule = app_state.data.schedule.value
+        self.__edits.clear()
         self.is_dirty.set(False)
+        with app_state.transaction():
+            app_state.data.schedule.set(schedule.updated(edits))
+            if self.pins_slots:
+                app_state.data.pinned_slots.set(pinned_slots)
+            app_state.save()
         # a manual refresh call sanitizes the toggles
         self.refresh()
 
+    def release_pinned_slots(self):
+        app_state.data.pinned_slots.set(frozenset())
+        app_state.save()
+
+    def __update_table_rows(self):
+        self.table_rows.set([{
+            'slot': x.slot,
+            'timestamp': x.timestamp,
+            'mode': self.__edits.get(x.slot, x.mode),
+            'color': x.color,
+            'charge_price': x.charge_price,
+            'discharge_price': x.discharge_price,
+            'charge_margin': x.charge_margin,
+            'battery_margin': x.battery_margin,
+            'projected_capacity': x.projected_capacity,
+            'projected_price': x.projected_price} for x in self.__view_rows])
+
     @staticmethod
     def __print_capacity(capacity: Decimal | None):
         return f'{capacity:.1f} Ah' if (capacity >= 0) else '(unknown) Ah'
@@ -127,21 +151,3 @@ class ScheduleModel:
     @staticmethod
     def __print_avg_price(price: Decimal | None):
         return f'{(price * Decimal(100)):.2f} ct/kWh' if (price is not None) else '(unknown) ct/kWh'
-    
-    @staticmethod
-    def __get__color(avg_val, min_val, max_val, value):
-        value = min(max_val, max(min_val, value))
-        if value > avg_val:
-            norm_base = max_val - avg_val
-            norm_value = value - avg_val
-        else:
-            norm_base = avg_val - min_val
-            norm_value = norm_base - (value - min_val)
-        other_channel = 255 - round(255 * norm_value / norm_base)
-        other_hex = hex(other_channel)[2:].upper()
-        other_hex = f'0{other_hex}' if len(other_hex) < 2 else other_hex
-        if value > avg_val:
-            return f'#FF{other_hex}{other_hex}'
-        else:
-            return f'#{other_hex}FF{other_hex}'
-    
\ No newline at end of file
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from ...core import EventBox, EventPayload, Schedule, app_state
+from ...core.fixedpoint import PRICE_SCALE, div_half_even, fixed_formatter, to_fixed
+from ...price import PriceSnapshot
+from ...schedule.projection import EMPTY, FULL, Projection, ProjectionCache
+from ..singletons import singletons
+
+_DATE_FORMAT_DMY_HM = "%d.%m.%y %H:%M"
+_NO_PRICE_COLOR = '#A0A0A0'
+_format_cents = fixed_formatter(PRICE_SCALE // 100, 2)
+_LIMIT_NAMES = {EMPTY: ' (empty)', FULL: ' (full)'}
+
+@dataclass(frozen=True)
+class ScheduleViewRow:
+    slot: int
+    raw_timestamp: datetime
+    timestamp: str
+    mode: str | None # None if the mode does not change compared to the previous row
+    color: str
+    charge_price: str
+    discharge_price: str
+    charge_margin: str
+    battery_margin: str
+    projected_capacity: str
+    projected_price: str
+
+class ScheduleView:
+    # Formatted schedule rows shared by all browser sessions; they are rendered at most once per change of the
+    # underlying data, no matter how many schedule pages are open.
+    def __init__(self):
+        self.__rows: tuple[ScheduleViewRow, ...] | None = None
+        self.__renders = 0
+        self.__on_change: EventBox[None] = EventBox()
+        self.__projections = ProjectionCache()
+        self.__shown_capacity: Decimal | None = None
+
+    @property
+    def on_change(self):
+        return self.__on_change
+
+    @property
+    def renders(self):
+        return self.__renders
+
+    @property
+    def rows(self):
+        if self.__rows is None:
+            schedule = app_state.data.schedule.value
+            snapshot = singletons.price.get_snapshot()
+            avg_charged_price = app_state.data.avg_charged_price.value
+            remaining_capacity = app_state.data.remaining_capacity.value
+            self.__shown_capacity = round(remaining_capacity, 1)
+            battery = singletons.battery
+            if battery is not None and battery.voltage is not None and remaining_capacity >= 0:
+                projection = self.__projections.get(schedule, snapshot, self.__shown_capacity, avg_charged_price, battery,
+                    app_state.data.charger_efficiency.value, app_state.data.inverter_efficiency.value)
+            else:
+                projection = None
+            self.__rows = render_schedule_rows(schedule, snapshot, avg_charged_price, app_state.data.minimum_margin.value, projection)
+            self.__renders += 1
+        return self.__rows
+
+    def start(self):
+        app_state.data.avg_charged_price.on_change.subscribe(self.__invalidate)
+        app_state.data.minimum_margin.on_change.subscribe(self.__invalidate)
+        app_state.data.charger_efficiency.on_change.subscribe(self.__invalidate)
+        app_state.data.inverter_efficiency.on_change.subscribe(self.__invalidate)
+        app_state.data.prices_revision.on_change.subscribe(self.__invalidate)
+        app_state.data.schedule.on_change.subscribe(self.__invalidate)
+        app_state.data.remaining_capacity.on_change.subscribe(self.__remaining_capacity_changed)
+
+    def __remaining_capacity_changed(self, args: EventPayload[Decimal]):
+        # the projection is rendered with a precision of 0.1 Ah, smaller changes are not worth a refresh of all clients
+        if self.__rows is not None and round(args.data, 1) != self.__shown_capacity:
+            self.__invalidate()
+
+    def __invalidate(self, _ = None):
+        self.__rows = None
+        self.__on_change.fire(self, None)
+
+def render_schedule_rows(schedule: Schedule, snapshot: PriceSnapshot, avg_charged_price: Decimal, min_margin: Decimal,
+                         projection: Projection | None = None):
+    # prices and margins are fixed point numbers here, they are only converted for display
+    avg_charged_price = to_fixed(avg_charged_price, PRICE_SCALE)
+    min_margin = to_fixed(min_margin, PRICE_SCALE)
+    charge_minimum = snapshot.charge_stats.minimum
+    charge_maximum = snapshot.charge_stats.maximum
+    charge_avg = snapshot.charge_stats.mean
+    discharge_maximum = snapshot.discharge_stats.maximum
+
+    rows: list[ScheduleViewRow] = []
+    previous_mode = None
+
+    for i, (timestamp, mode) in enumerate(schedule.items()):
+        slot = schedule.start + i
+        mode = mode.value
+        display_mode = None if (mode == previous_mode) else mode
+        previous_mode = mode
+
+        if (prices_at := snapshot.get(slot)):
+            color = _get_color(charge_avg, charge_minimum, charge_maximum, prices_at.charge)
+            charge_price = _format_cents(prices_at.charge)
+            discharge_price = _format_cents(prices_at.discharge)
+
+            if (battery_margin := (prices_at.discharge - avg_charged_price)) >= min_margin:
+                battery_margin = _format_cents(battery_margin)
+            else:
+                battery_margin = ''
+
+            if (discharge_margin := (prices_at.discharge - charge_minimum)) >= min_margin:
+                charge_margin = _format_cents(discharge_margin)
+            elif (discharge_maximum - prices_at.charge) >= min_margin:
+                charge_penalty = charge_minimum - prices_at.charge
+                charge_margin = _format_cents(charge_penalty)
+            else:
+                charge_margin = ''
+        else:
+            color = _NO_PRICE_COLOR
+            charge_price = ''
+            discharge_price = ''
+            charge_margin = ''
+            battery_margin = ''
+
+        if projection is not None and (projected := projection.get(slot)):
+            capacity, price, limit = projected
+            projected_capacity = f'{capacity:.1f}' + _LIMIT_NAMES.get(limit, '')
+            projected_price = f'{(price * 100):.2f}'
+        else:
+            projected_capacity = ''
+            projected_price = ''
+
+        rows.append(ScheduleViewRow(
+            slot=slot,
+            raw_timestamp=timestamp,
+            timestamp=timestamp.strftime(_DATE_FORMAT_DMY_HM),
+            mode=display_mode,
+            color=color,
+            charge_price=charge_price,
+            discharge_price=discharge_price,
+            charge_margin=charge_margin,
+            battery_margin=battery_margin,
+            projected_capacity=projected_capacity,
+            projected_price=projected_price))
+    return tuple(rows)
+
+def _get_color(avg_val: int, min_val: int, max_val: int, value: int):
+    value = min(max_val, max(min_val, value))
+    if value > avg_val:
+        norm_base = max_val - avg_val
+        norm_value = value - avg_val
+    else:
+        norm_base = avg_val - min_val
+        norm_value = norm_base - (value - min_val)
+    # all prices equal
+    if not norm_base:
+        return '#FFFFFF'
+    other_channel = 255 - div_half_even(255 * norm_value, norm_base)
+    other_hex = hex(other_channel)[2:].upper()
+    other_hex = f'0{other_hex}' if len(other_hex) < 2 else other_hex
+    if value > avg_val:
+        return f'#FF{other_hex}{other_hex}'
+    else:
+        return f'#{other_hex}FF{other_hex}'
+
+schedule_view = ScheduleView()
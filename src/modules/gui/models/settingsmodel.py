@@ -1,6 +1,6 @@
 from argon2.exceptions import VerifyMismatchError
 from decimal import Decimal
-from ...core import app_state, password_hasher
+from ...core import app_state, password_service
 from .modeltypes import BridgedValue
 
 _TIBBER_TOKEN_REPLACEMENTS = ('<No token set>', '<Token set>')
@@ -52,9 +52,10 @@ class SettingsModel:
         self.admin_pass.destroy()
 
     def write_eta(self):
-        app_state.data.charger_efficiency.set(round(Decimal(self.charger_eta.value / 100), 3))
-        app_state.data.inverter_efficiency.set(round(Decimal(self.inverter_eta.value / 100), 3))
-        app_state.save()
+        with app_state.transaction():
+            app_state.data.charger_efficiency.set(round(Decimal(self.charger_eta.value / 100), 3))
+            app_state.data.inverter_efficiency.set(round(Decimal(self.inverter_eta.value / 100), 3))
+            app_state.save()
 
     def write_financials(self):
         app_state.data.minimum_margin.set(round(Decimal(self.min_margin.value / 100), 4))
@@ -71,40 +72,49 @@ class SettingsModel:
         app_state.data.tibber_token.set(value or None)
         app_state.save()
 
-    def write_user_credentials(self):
+    async def write_user_credentials(self):
         user = self.user_user.value
         if user == self.admin_user.value:
             raise ValueError('Admin and non-admin user must not have the same user name.')
 
-        app_state.data.user_user.set(self.user_user.value)
+        hash = None
         if (password := self.user_pass.value) != _PASS_REPLACEMENT:
             if len(password) < 8:
                 raise ValueError('Password must have at least 8 characters.')
             if password != self.user_pass_confirm.value:
                 raise ValueError('Password confirmation does not match.')
-            hash = password_hasher.hash(password)
-            app_state.data.user_pass.set(hash)
-        app_state.save()
+            hash = await password_service.hash(password)
+
+        # no awaits within the transaction, it would defer changes of other tasks, too
+        with app_state.transaction():
+            app_state.data.user_user.set(user)
+            if hash:
+                app_state.data.user_pass.set(hash)
+            app_state.save()
 
-    def write_admin_credentials(self):
+    async def write_admin_credentials(self):
         user = self.admin_user.value
         if user == self.user_user.value:
             raise ValueError('Admin and non-admin user must not have the same user name.')
 
-        app_state.data.admin_user.set(self.admin_user.value)
+        hash = None
         if (password := self.admin_pass.value) != _PASS_REPLACEMENT:
             if len(password) < 8:
                 raise ValueError('Password must have at least 8 characters.')
             if (old_hash := app_state.data.admin_pass.value):
                 try:
-                    password_hasher.verify(old_hash, self.admin_pass_old.value)
+                    await password_service.verify(old_hash, self.admin_pass_old.value)
                 except VerifyMismatchError:
                     raise ValueError('Invalid old password.')
             if password != self.admin_pass_confirm.value:
                 raise ValueError('Password confirmation does not match.')
-            hash = password_hasher.hash(password)
-            app_state.data.admin_pass.set(hash)
-        app_state.save()
+            hash = await password_service.hash(password)
+
+        with app_state.transaction():
+            app_state.data.admin_user.set(user)
+            if hash:
+                app_state.data.admin_pass.set(hash)
+            app_state.save()
     
     @staticmethod
     def __print_eta(value: Decimal):
@@ -1,25 +1,36 @@
 from collections.abc import Collection
 from ...core import OperationMode, app_state, SCHEDULE_TEMPLATE_LENGTH
-from .modeltypes import BindableValue
+from .modeltypes import BindableValue, UpdateLimiter
 
 class TemplateRow:
-    def __init__(self):
-        self.hour = BindableValue('')
-        self.mode = BindableValue('')
+    def __init__(self, limiter: UpdateLimiter | None = None):
+        self.hour = BindableValue('', limiter)
+        self.mode = BindableValue('', limiter)
 
 class TemplateModel:
-    def __init__(self, id: str):
+    def __init__(self, id: str, limiter: UpdateLimiter, virtual: bool = False):
         self.__id = id
+        self.__limiter = limiter
+        self.__virtual = virtual
 
         self.is_dirty = BindableValue(False)
 
-        self.template = [TemplateRow() for _ in range(SCHEDULE_TEMPLATE_LENGTH)]
+        # None if the mode does not change compared to the previous row
+        self.__modes: list[str | None] = [None] * SCHEDULE_TEMPLATE_LENGTH
+
+        # virtual tables get all rows as a single payload, the others bind every cell
+        self.template = [] if virtual else [TemplateRow(limiter) for _ in range(SCHEDULE_TEMPLATE_LENGTH)]
+        self.table_rows: BindableValue[list[dict]] = BindableValue([], limiter)
 
         app_state.data.template.on_change.subscribe(self.refresh, id=id)
         self.refresh()
 
+        # the page is built with the initial values, not with a later update
+        limiter.flush()
+
     def destroy(self):
         app_state.data.template.on_change.unsubscribe_by_id(self.__id)
+        self.__limiter.destroy()
 
     def refresh(self, _ = None):
         if self.is_dirty.value:
@@ -30,18 +41,35 @@ class TemplateModel:
         previous_mode = None
 
         for i in range(SCHEDULE_TEMPLATE_LENGTH):
-            self.template[i].hour.set(f'{(i / 4):.2f}')
-
             mode = raw_template[i].value
-            self.template[i].mode.set(None if (mode == previous_mode) else mode)
+            self.__modes[i] = None if (mode == previous_mode) else mode
             previous_mode = mode
 
+        if self.__virtual:
+            self.__update_table_rows()
+        else:
+            for i, row in enumerate(self.template):
+                row.hour.set(self.__get_hour(i))
+                row.mode.set(self.__modes[i])
+
+    def get_mode(self, index: int):
+        # the mode as edited by the user; the bound rows lag behind because of the update limiter
+        return self.__modes[index]
+
+    def set_mode(self, index: int, mode: str | None):
+        self.__modes[index] = mode
+        self.is_dirty.set(True)
+        if self.__virtual:
+            self.__update_table_rows()
+        else:
+            self.template[index].mode.set(mode)
+
     def write_template(self):
         template: list[OperationMode] = []
 
         previous_mode = None
-        for row in self.template:
-            mode = OperationMode(row.mode.value or previous_mode or OperationMode.IDLE.value)
+        for raw_mode in self.__modes:
+            mode = OperationMode(raw_mode or previous_mode or OperationMode.IDLE.value)
             previous_mode = mode.value
             template.append(mode)
 
@@ -50,3 +78,10 @@ class TemplateModel:
         self.is_dirty.set(False)
         # a manual refresh call sanitizes the toggles
         self.refresh()
+
+    def __update_table_rows(self):
+        self.table_rows.set([{'index': i, 'hour': self.__get_hour(i), 'mode': x} for i, x in enumerate(self.__modes)])
+
+    @staticmethod
+    def __get_hour(index: int):
+        return f'{(index / 4):.2f}'
@@ -1,10 +1,15 @@
+from ..energy import EnergyTracker
 from ..uplink import VirtualController
 from ..price import PriceSource
+from ..schedule import Battery, ScheduleOptimizer
 
 class Singletons:
     def __init__(self):
         self.__price: PriceSource = None
         self.__virtual_controller: VirtualController = None
+        self.__energy_tracker: EnergyTracker = None
+        self.__battery: Battery | None = None
+        self.__optimizer: ScheduleOptimizer = None
     
     @property
     def price(self):
@@ -13,9 +18,25 @@ class Singletons:
     @property
     def virtual_controller(self):
         return self.__virtual_controller
+
+    @property
+    def energy_tracker(self):
+        return self.__energy_tracker
+
+    @property
+    def battery(self):
+        return self.__battery
+
+    @property
+    def optimizer(self):
+        return self.__optimizer
     
-    def set(self, controller: VirtualController, price: PriceSource):
+    def set(self, controller: VirtualController, price: PriceSource, energy_tracker: EnergyTracker, battery: Battery | None,
+            optimizer: ScheduleOptimizer):
         self.__price = price
         self.__virtual_controller = controller
+        self.__energy_tracker = energy_tracker
+        self.__battery = battery
+        self.__optimizer = optimizer
 
 singletons = Singletons()
@@ -0,0 +1,45 @@
+import logging
+from functools import partial
+from nicegui import ui
+from nicegui.binding import bind_from
+from ..helper.cardwidth import SYNC_WIDTH_CARD_CLASS, sync_card_widths
+from ..models.backtestmodel import BacktestModel
+
+_TABLE_COLUMNS = [
+    {'name': 'name', 'label': '', 'field': 'name', 'align': 'left'},
+    {'name': 'charger_energy', 'label': 'Charger [kWh]', 'field': 'charger_energy', 'align': 'right'},
+    {'name': 'inverter_energy', 'label': 'Inverter [kWh]', 'field': 'inverter_energy', 'align': 'right'},
+    {'name': 'solar_energy', 'label': 'Solar [kWh]', 'field': 'solar_energy', 'align': 'right'},
+    {'name': 'cost', 'label': 'Cost [€]', 'field': 'cost', 'align': 'right'},
+    {'name': 'revenue', 'label': 'Revenue [€]', 'field': 'revenue', 'align': 'right'},
+    {'name': 'profit', 'label': 'Profit [€]', 'field': 'profit', 'align': 'right'}]
+
+def create_backtest_tab(data: BacktestModel):
+    with ui.column().classes('items-center w-full gap-4'):
+        if not data.is_available:
+            ui.label('Backtesting needs energy statistics in a database, see energy -> database_file.')
+            return
+
+        with ui.card().classes(SYNC_WIDTH_CARD_CLASS):
+            ui.label('Replay the schedule template')
+            ui.number(label='Days', min=1, max=3660, precision=0, step=1).bind_value(data.days, 'value')
+            ui.number(label='Battery capacity', min=0, precision=0, step=100, suffix='Wh').bind_value(data.capacity, 'value')
+            ui.number(label='Charge power', min=0, precision=0, step=100, suffix='W').bind_value(data.charge_power, 'value')
+            ui.number(label='Discharge power', min=0, precision=0, step=100, suffix='W').bind_value(data.discharge_power, 'value')
+            ui.checkbox('Skip discharging below minimum margin').bind_value(data.respect_margin, 'value')
+            ui.button('Run', on_click=partial(run_handler, data)).bind_enabled_from(data.is_running, 'value', backward=lambda x: not x)
+
+        with ui.card().classes(SYNC_WIDTH_CARD_CLASS):
+            ui.label('Result')
+            table = ui.table(columns=_TABLE_COLUMNS, rows=[], row_key='name')
+            bind_from(self_obj=table, self_name='rows', other_obj=data.result_rows, other_name='value')
+            ui.label().bind_text_from(data.summary, 'value')
+
+    sync_card_widths()
+
+async def run_handler(data: BacktestModel):
+    try:
+        await data.run()
+    except Exception as e:
+        logging.warning(f'Backtest failed: {e}')
+        ui.notify(f'Backtest failed: {e}', position='top')
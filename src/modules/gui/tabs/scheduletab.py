@@ -4,7 +4,7 @@ from nicegui.binding import bind_from
 
 from ...core import OperationMode
 from ..models.schedulemodel import ScheduleModel, ScheduleRow
-from ..customelements import colorful_toggle
+from ..customelements import colorful_toggle, mode_table
 
 _TABLE_HEADER_CELL_CLASS = 'place-content-center text-center px-2 font-bold'
 _TABLE_CELL_CLASS = 'place-content-center text-center px-1'
@@ -15,7 +15,17 @@ _AVAILABLE_MODES = {
     OperationMode.IDLE.value: 'idle',
     OperationMode.DISCHARGE.value: 'discharge'}
 
-def create_schedule_tab(data: ScheduleModel):
+_TABLE_COLUMNS = [
+    {'name': 'timestamp', 'label': 'Timestamp', 'field': 'timestamp', 'align': 'center'},
+    {'name': 'mode', 'label': 'Mode', 'field': 'mode', 'align': 'center'},
+    {'name': 'charge_price', 'label': 'Charge Price', 'field': 'charge_price', 'align': 'center', 'style': 'font-weight: bold'},
+    {'name': 'discharge_price', 'label': 'Discharge Price', 'field': 'discharge_price', 'align': 'center', 'style': 'font-weight: bold'},
+    {'name': 'charge_margin', 'label': 'Charge Margin', 'field': 'charge_margin', 'align': 'center'},
+    {'name': 'battery_margin', 'label': 'Battery Margin', 'field': 'battery_margin', 'align': 'center'},
+    {'name': 'projected_capacity', 'label': 'Capacity [Ah]', 'field': 'projected_capacity', 'align': 'center'},
+    {'name': 'projected_price', 'label': 'Avg. Price', 'field': 'projected_price', 'align': 'center'}]
+
+def create_schedule_tab(data: ScheduleModel, virtual: bool):
     with ui.column().classes('items-center w-full gap-4'):
         with ui.card():
             with ui.grid(columns=2):
@@ -28,39 +38,52 @@ def create_schedule_tab(data: ScheduleModel):
         with ui.row():
             ui.button('Save', on_click=partial(save_click_handler, data)).bind_enabled_from(data.is_dirty, 'value')
             ui.button('Cancel', on_click=partial(cancel_click_handler, data)).bind_enabled_from(data.is_dirty, 'value').classes('ml-10')
+            if data.pins_slots:
+                ui.button('Unpin', on_click=partial(unpin_click_handler, data)).bind_enabled_from(data.has_pinned_slots, 'value').classes('ml-10') \
+                    .tooltip('Let the schedule optimizer change the slots set manually, too.')
 
-        with ui.grid(columns='auto auto auto auto auto auto').classes('gap-0'):
+        if virtual:
+            table = mode_table(_TABLE_COLUMNS, 'slot', _AVAILABLE_MODES, data.set_mode, colored=True)
+            bind_from(self_obj=table, self_name='rows', other_obj=data.table_rows, other_name='value')
+        else:
+            create_schedule_grid(data)
 
-            ui.label('Timestamp').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Mode').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Charge Price').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Discharge Price').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Charge Margin').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Battery Margin').classes(_TABLE_HEADER_CELL_CLASS)
+        with ui.row():
+            ui.button('Save', on_click=partial(save_click_handler, data)).bind_enabled_from(data.is_dirty, 'value')
+            ui.button('Cancel', on_click=partial(cancel_click_handler, data)).bind_enabled_from(data.is_dirty, 'value').classes('ml-10')
 
-            for row in data.schedule:
-                ui.label().bind_text_from(row.timestamp, 'value').classes(_TABLE_CELL_CLASS)
+def create_schedule_grid(data: ScheduleModel):
+    with ui.grid(columns='auto auto auto auto auto auto auto auto').classes('gap-0'):
 
-                toggle = colorful_toggle(_AVAILABLE_MODES, on_change=partial(mode_changed_handler, data, row)) \
-                    .bind_value_from(row.mode, 'value')
-                bind_from(self_obj=toggle, self_name='background', other_obj=row.color, other_name='value')
+        ui.label('Timestamp').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Mode').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Charge Price').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Discharge Price').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Charge Margin').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Battery Margin').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Capacity [Ah]').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Avg. Price').classes(_TABLE_HEADER_CELL_CLASS)
 
-                ui.label().bind_text_from(row.charge_price, 'value').classes(_TABLE_CELL_CLASS).style('font-weight: bold')
-                ui.label().bind_text_from(row.discharge_price, 'value').classes(_TABLE_CELL_CLASS).style('font-weight: bold')
-                ui.label().bind_text_from(row.charge_margin, 'value').classes(_TABLE_CELL_CLASS)
-                ui.label().bind_text_from(row.battery_margin, 'value').classes(_TABLE_CELL_CLASS)
+        for row in data.schedule:
+            ui.label().bind_text_from(row.timestamp, 'value').classes(_TABLE_CELL_CLASS)
 
-        with ui.row():
-            ui.button('Save', on_click=partial(save_click_handler, data)).bind_enabled_from(data.is_dirty, 'value')
-            ui.button('Cancel', on_click=partial(cancel_click_handler, data)).bind_enabled_from(data.is_dirty, 'value').classes('ml-10')
+            toggle = colorful_toggle(_AVAILABLE_MODES, on_change=partial(mode_changed_handler, data, row)) \
+                .bind_value_from(row.mode, 'value')
+            bind_from(self_obj=toggle, self_name='background', other_obj=row.color, other_name='value')
+
+            ui.label().bind_text_from(row.charge_price, 'value').classes(_TABLE_CELL_CLASS).style('font-weight: bold')
+            ui.label().bind_text_from(row.discharge_price, 'value').classes(_TABLE_CELL_CLASS).style('font-weight: bold')
+            ui.label().bind_text_from(row.charge_margin, 'value').classes(_TABLE_CELL_CLASS)
+            ui.label().bind_text_from(row.battery_margin, 'value').classes(_TABLE_CELL_CLASS)
+            ui.label().bind_text_from(row.projected_capacity, 'value').classes(_TABLE_CELL_CLASS)
+            ui.label().bind_text_from(row.projected_price, 'value').classes(_TABLE_CELL_CLASS)
 
 def mode_changed_handler(data: ScheduleModel, row: ScheduleRow, args: events.ValueChangeEventArguments):
     value = args.value
-    if value == row.mode.value:
+    if value == data.get_mode(row.slot):
         # this should trigger server side writes, too
         return
-    data.is_dirty.set(True)
-    row.mode.set(value)
+    data.set_mode(row.slot, value)
 
 def color_changed_handler(toggle: ui.toggle, value: str):
     toggle.style(f'background-color: {value}')
@@ -70,6 +93,8 @@ def save_click_handler(data: ScheduleModel):
     ui.notify('Schedule saved.', position='top')
 
 def cancel_click_handler(data: ScheduleModel):
-    # reset dirty flag first; otherwise, refresh would not run
-    data.is_dirty.set(False)
-    data.refresh()
+    data.discard_edits()
+
+def unpin_click_handler(data: ScheduleModel):
+    data.release_pinned_slots()
+    ui.notify('Pinned slots released.', position='top')
@@ -80,17 +80,17 @@ def save_tibber_token_handler(data: SettingsModel):
         logging.warning(f'Saving tibber token failed: {e}')
         ui.notify('Invalid value.', color='negative', position='top')
 
-def save_user_credentials(data: SettingsModel):
+async def save_user_credentials(data: SettingsModel):
     try:
-        data.write_user_credentials()
+        await data.write_user_credentials()
         logout_all()
     except Exception as e:
         logging.warning(f'Saving user credentials failed: {e}')
         ui.notify(f'{e}', color='negative', position='top')
 
-def save_admin_credentials(data: SettingsModel):
+async def save_admin_credentials(data: SettingsModel):
     try:
-        data.write_admin_credentials()
+        await data.write_admin_credentials()
         logout_all()
     except Exception as e:
         logging.warning(f'Saving admin credentials failed: {e}')
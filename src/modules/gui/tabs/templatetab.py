@@ -1,7 +1,9 @@
 from functools import partial
 from nicegui import ui, events
+from nicegui.binding import bind_from
 
 from ...core import OperationMode
+from ..customelements import mode_table
 from ..models.templatemodel import TemplateModel, TemplateRow
 
 _TABLE_HEADER_CELL_CLASS = 'place-content-center text-center px-2 font-bold'
@@ -13,34 +15,44 @@ _AVAILABLE_MODES = {
     OperationMode.IDLE.value: 'idle',
     OperationMode.DISCHARGE.value: 'discharge'}
 
-def create_template_tab(data: TemplateModel):
+_TABLE_COLUMNS = [
+    {'name': 'hour', 'label': 'Hour', 'field': 'hour', 'align': 'center'},
+    {'name': 'mode', 'label': 'Mode', 'field': 'mode', 'align': 'center'}]
+
+def create_template_tab(data: TemplateModel, virtual: bool):
     with ui.column().classes('items-center w-full gap-4'):
         with ui.row():
             ui.button('Save', on_click=partial(save_click_handler, data)).bind_enabled_from(data.is_dirty, 'value')
             ui.button('Cancel', on_click=partial(cancel_click_handler, data)).bind_enabled_from(data.is_dirty, 'value').classes('ml-10')
 
-        with ui.grid(columns='auto auto').classes('gap-0'):
-
-            ui.label('Hour').classes(_TABLE_HEADER_CELL_CLASS)
-            ui.label('Mode').classes(_TABLE_HEADER_CELL_CLASS)
-
-            for row in data.template:
-                ui.label().bind_text_from(row.hour, 'value').classes(_TABLE_CELL_CLASS)
-
-                ui.toggle(_AVAILABLE_MODES, on_change=partial(mode_changed_handler, data, row)) \
-                    .bind_value_from(row.mode, 'value')
+        if virtual:
+            table = mode_table(_TABLE_COLUMNS, 'index', _AVAILABLE_MODES, data.set_mode)
+            bind_from(self_obj=table, self_name='rows', other_obj=data.table_rows, other_name='value')
+        else:
+            create_template_grid(data)
 
         with ui.row():
             ui.button('Save', on_click=partial(save_click_handler, data)).bind_enabled_from(data.is_dirty, 'value')
             ui.button('Cancel', on_click=partial(cancel_click_handler, data)).bind_enabled_from(data.is_dirty, 'value').classes('ml-10')
 
-def mode_changed_handler(data: TemplateModel, row: TemplateRow, args: events.ValueChangeEventArguments):
+def create_template_grid(data: TemplateModel):
+    with ui.grid(columns='auto auto').classes('gap-0'):
+
+        ui.label('Hour').classes(_TABLE_HEADER_CELL_CLASS)
+        ui.label('Mode').classes(_TABLE_HEADER_CELL_CLASS)
+
+        for i, row in enumerate(data.template):
+            ui.label().bind_text_from(row.hour, 'value').classes(_TABLE_CELL_CLASS)
+
+            ui.toggle(_AVAILABLE_MODES, on_change=partial(mode_changed_handler, data, i, row)) \
+                .bind_value_from(row.mode, 'value')
+
+def mode_changed_handler(data: TemplateModel, index: int, row: TemplateRow, args: events.ValueChangeEventArguments):
     value = args.value
-    if value == row.mode.value:
+    if value == data.get_mode(index):
         # this should trigger server side writes, too
         return
-    data.is_dirty.set(True)
-    row.mode.set(value)
+    data.set_mode(index, value)
 
 def save_click_handler(data: TemplateModel):
     data.write_template()
@@ -1 +1 @@
-from .price import PriceSource
\ No newline at end of file
+from .price import PriceSource, PriceSnapshot, PriceStats, Prices, PERCENTILES
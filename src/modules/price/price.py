@@ -1,39 +1,125 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from decimal import Decimal
 
-from ..core import app_state
+from ..core import Triggers, app_state, get_optional_config_key
+from ..core.fixedpoint import EFFICIENCY_SCALE, PRICE_SCALE, div_half_even, to_fixed
 from .tibber import Tibber
 
-@dataclass
+_TIBBER_CONFIG_KEY = 'tibber'
+_RETENTION_CONFIG_KEY = 'retention'
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# prices derived from the tibber prices have 4 decimal places
+_MEAN_STEP = PRICE_SCALE // 10 ** 4
+_CHARGE_STEP = PRICE_SCALE // 10 ** 4
+
+# all prices are fixed point numbers in units of 1 / PRICE_SCALE €/kWh
+
+@dataclass(frozen=True)
 class Prices:
-    charge: Decimal
-    discharge: Decimal
+    charge: int
+    discharge: int
+
+@dataclass(frozen=True)
+class PriceStats:
+    minimum: int
+    maximum: int
+    mean: int # rounded to 4 decimal places
+    percentiles: tuple[int, ...] # in the order of PERCENTILES
+
+    @staticmethod
+    def from_values(values: list[int]):
+        if not values:
+            return PriceStats(0, 0, 0, tuple(0 for _ in PERCENTILES))
+        values = sorted(values)
+        count = len(values)
+        return PriceStats(
+            minimum=values[0],
+            maximum=values[-1],
+            mean=div_half_even(sum(values), count * _MEAN_STEP) * _MEAN_STEP,
+            percentiles=tuple(values[min(count - 1, (x * count) // 100)] for x in PERCENTILES))
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    # all known prices from the quarter the snapshot was created in
+    start: int
+    prices: tuple[Prices | None, ...]
+    charge: tuple[int | None, ...]
+    discharge: tuple[int | None, ...]
+    charge_stats: PriceStats
+    discharge_stats: PriceStats
+
+    @property
+    def end(self):
+        return self.start + len(self.prices)
+
+    def get(self, slot: int) -> Prices | None:
+        index = slot - self.start
+        return self.prices[index] if 0 <= index < len(self.prices) else None
 
 class PriceSource:
-    def __init__(self):
-        self.__tibber = Tibber()
+    def __init__(self, config: dict, cache_file: str | None = None):
+        retention = get_optional_config_key(config, float, 24.0, None, _TIBBER_CONFIG_KEY, _RETENTION_CONFIG_KEY)
+        self.__tibber = Tibber(cache_file, timedelta(hours=retention))
 
-        self.__efficiency_factor = Decimal(1)
+        self.__efficiency_factor = EFFICIENCY_SCALE * EFFICIENCY_SCALE
+        self.__snapshot: PriceSnapshot | None = None
         self.__get_efficiency_factor()
 
         app_state.data.charger_efficiency.on_change.subscribe(self.__get_efficiency_factor)
         app_state.data.inverter_efficiency.on_change.subscribe(self.__get_efficiency_factor)
+        app_state.data.prices_revision.on_change.subscribe(self.__invalidate_snapshot)
 
     def start(self):
         self.__tibber.start()
 
+    async def stop(self):
+        await self.__tibber.stop()
+
     def get_at(self, timestamp):
-        if (not self.__tibber.is_active) or (not (price := self.__tibber.get_price(timestamp))):
+        slot = Triggers.get_slot(timestamp)
+        snapshot = self.get_snapshot()
+        if snapshot.start <= slot < snapshot.end:
+            return snapshot.get(slot)
+        if (not self.__tibber.is_active) or ((price := self.__tibber.get_price_at_slot(slot)) is None):
             return None
+        return self.__to_prices(price)
 
-        charge_price = round(price / self.__efficiency_factor, 4)
-        return Prices(charge=charge_price, discharge=price)
-    
     def get_previous(self):
         # Shortly after quarter change, the correct price would still be the one from the previous quarter.
         # So a bit of time needs to be substracted to get the price from the correct quarter.
         return self.get_at((datetime.now() - timedelta(minutes=2)))
-    
+
+    def get_snapshot(self) -> PriceSnapshot:
+        start = Triggers.get_current_slot()
+        if (self.__snapshot is None) or (self.__snapshot.start != start):
+            self.__snapshot = self.__create_snapshot(start)
+        return self.__snapshot
+
+    def __create_snapshot(self, start: int):
+        last_slot = self.__tibber.get_last_slot() if self.__tibber.is_active else None
+        raw_prices = self.__tibber.get_prices(start, last_slot + 1) if (last_slot is not None and last_slot >= start) else []
+        prices = tuple(self.__to_prices(x) if x is not None else None for x in raw_prices)
+        charge = tuple(x.charge if x else None for x in prices)
+        discharge = tuple(x.discharge if x else None for x in prices)
+        return PriceSnapshot(
+            start=start,
+            prices=prices,
+            charge=charge,
+            discharge=discharge,
+            charge_stats=PriceStats.from_values([x for x in charge if x is not None]),
+            discharge_stats=PriceStats.from_values([x for x in discharge if x is not None]))
+
+    def __to_prices(self, price: int):
+        # round(price / efficiency factor, 4): with the efficiency factor scaled by 10^6, the quotient is in units of 10^-4
+        charge_price = div_half_even(price, self.__efficiency_factor) * _CHARGE_STEP
+        return Prices(charge=charge_price, discharge=price)
+
+    def __invalidate_snapshot(self, _ = None):
+        self.__snapshot = None
+
     def __get_efficiency_factor(self, _ = None):
-        self.__efficiency_factor = app_state.data.charger_efficiency.value * app_state.data.inverter_efficiency.value
+        self.__efficiency_factor = to_fixed(app_state.data.charger_efficiency.value, EFFICIENCY_SCALE) \
+            * to_fixed(app_state.data.inverter_efficiency.value, EFFICIENCY_SCALE)
+        self.__snapshot = None
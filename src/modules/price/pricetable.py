@@ -0,0 +1,59 @@
+from collections.abc import Iterable
+
+class PriceTable:
+    # Fixed capacity ring of prices indexed by quarter hour slot; the price of slot n is stored at index n % capacity.
+    # Prices are fixed point numbers, see PRICE_SCALE.
+    def __init__(self, capacity: int):
+        self.__capacity = capacity
+        self.__slots: list[int | None] = [None] * capacity
+        self.__prices: list[int | None] = [None] * capacity
+        self.__count = 0
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, slot: int):
+        return self.__slots[slot % self.__capacity] == slot
+
+    def get(self, slot: int) -> int | None:
+        index = slot % self.__capacity
+        return self.__prices[index] if (self.__slots[index] == slot) else None
+
+    def get_range(self, start: int, end: int) -> list[int | None]:
+        return [self.get(x) for x in range(start, end)]
+
+    def set(self, slot: int, price: int):
+        # returns whether the slot was unknown before
+        index = slot % self.__capacity
+        old_slot = self.__slots[index]
+        if old_slot is not None and old_slot > slot:
+            # never overwrite newer prices with older ones
+            return False
+        is_new = old_slot != slot
+        if old_slot is None:
+            self.__count += 1
+        self.__slots[index] = slot
+        self.__prices[index] = price
+        return is_new
+
+    def evict(self, oldest_slot: int):
+        for index, slot in enumerate(self.__slots):
+            if slot is not None and slot < oldest_slot:
+                self.__slots[index] = None
+                self.__prices[index] = None
+                self.__count -= 1
+
+    def clear(self):
+        self.__slots = [None] * self.__capacity
+        self.__prices = [None] * self.__capacity
+        self.__count = 0
+
+    def items(self) -> Iterable[tuple[int, int]]:
+        return sorted((x, y) for x, y in zip(self.__slots, self.__prices) if x is not None and y is not None)
+
+    def last_slot(self):
+        return max((x for x in self.__slots if x is not None), default=None)
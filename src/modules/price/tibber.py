@@ -1,18 +1,35 @@
-import aiohttp, asyncio, traceback, logging
+import aiohttp, asyncio, json, os, random, traceback, logging
 from datetime import datetime as dt
-from datetime import timedelta
+from datetime import time, timedelta
 from decimal import Decimal
 
 from ..core import Triggers, app_state
+from ..core.fixedpoint import PRICE_SCALE, to_decimal, to_fixed
+from ..core.persistence import write_atomic
+from .pricetable import PriceTable
 
 
 _PRICE_REQUEST = {"query": "{ viewer { homes { currentSubscription{ priceInfo(resolution: QUARTER_HOURLY) { today { total startsAt } tomorrow { total startsAt }}}}}}"}
+_URL = 'https://api.tibber.com/v1-beta/gql'
+
+# day-ahead prices for tomorrow are usually published in the early afternoon
+_PUBLICATION_TIME = time(hour=13)
+_RETRY_INTERVAL = 10 * 60
+_MIN_BACKOFF = 30
+_MAX_BACKOFF = 60 * 60
+_KEEPALIVE_TIMEOUT = 120
+_REQUEST_TIMEOUT = 30
+# today and tomorrow, plus some margin
+_FUTURE_SLOTS = 3 * 24 * 4
 
 class Tibber:
-    def __init__(self):
-        self.__prices: dict[dt, Decimal] = {}
+    def __init__(self, cache_file: str | None, retention: timedelta):
+        self.__retention_slots = int(retention.total_seconds()) // (15 * 60)
+        self.__prices = PriceTable(self.__retention_slots + _FUTURE_SLOTS)
         self.__token = app_state.data.tibber_token.value
+        self.__cache_file = cache_file
         self.__task = None
+        self.__session: aiohttp.ClientSession | None = None
 
     @property
     def is_active(self):
@@ -22,55 +39,108 @@ class Tibber:
         app_state.data.tibber_token.on_change.subscribe(self.__config_change_handler)
         self.__config_change_handler()
 
-    def get_price(self, timestamp: dt) -> Decimal | None:
-        timestamp = Triggers.truncate_timestamp(timestamp)
-        return self.__prices.get(timestamp, None)
+    async def stop(self):
+        if self.__task:
+            self.__task.cancel()
+            self.__task = None
+        if self.__session:
+            await self.__session.close()
+            self.__session = None
+
+    def get_price(self, timestamp: dt) -> int | None:
+        return self.__prices.get(Triggers.get_slot(timestamp))
+
+    def get_price_at_slot(self, slot: int) -> int | None:
+        return self.__prices.get(slot)
+
+    def get_last_slot(self) -> int | None:
+        return self.__prices.last_slot()
+
+    def get_prices(self, start: int, end: int) -> list[int | None]:
+        # prices for the slots [start, end)
+        return self.__prices.get_range(start, end)
     
     async def __update(self):
+        failures = 0
         while True:
             try:
-                now = Triggers.truncate_timestamp(dt.now())
-                if now + timedelta(hours=11) not in self.__prices:
-                    await self.__get_prices()
-        
+                if self.__is_update_necessary():
+                    if not await self.__get_prices():
+                        raise RuntimeError('no valid response')
+                failures = 0
+                delay = self.__get_next_update_delay()
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logging.error(f'Tibber price update failed: {e}\n{traceback.format_exc()}')
-            await asyncio.sleep(20 * 60)
-    
+                failures += 1
+                delay = min(_MAX_BACKOFF, _MIN_BACKOFF * (2 ** (failures - 1))) * random.uniform(0.5, 1.0)
+                logging.error(f'Tibber price update failed: {e}; retry in {delay:.0f} s.\n{traceback.format_exc()}')
+            await asyncio.sleep(delay)
+
+    def __is_update_necessary(self):
+        now = dt.now()
+        if Triggers.get_slot(now) not in self.__prices:
+            return True
+        last_quarter_today = now.replace(hour=23, minute=45, second=0, microsecond=0)
+        last_quarter = last_quarter_today + timedelta(days=1) if now.time() >= _PUBLICATION_TIME else last_quarter_today
+        return Triggers.get_slot(last_quarter) not in self.__prices
+
+    def __get_next_update_delay(self):
+        now = dt.now()
+        if self.__is_update_necessary():
+            # prices are not published yet
+            return _RETRY_INTERVAL
+        next_publication = dt.combine(now.date(), _PUBLICATION_TIME)
+        if next_publication <= now:
+            next_publication += timedelta(days=1)
+        # spread requests of many instances a bit
+        return (next_publication - now).total_seconds() + random.uniform(0, 60)
+
     async def __get_prices(self):
-        async with aiohttp.ClientSession() as session:
-            response_json = await self.__post(session, _PRICE_REQUEST)
-            if response_json is None:
-                return
+        response_json = await self.__post(_PRICE_REQUEST)
+        if response_json is None:
+            return False
 
         raw_price_data = response_json['data']['viewer']['homes'][0]['currentSubscription']['priceInfo']
         prices_today = raw_price_data['today']
         prices_tomorrow = raw_price_data['tomorrow']
-        last_hour = Triggers.truncate_timestamp(dt.now()) - timedelta(hours=1)
-        updated_prices = 0
-        for raw_price in prices_today + prices_tomorrow:
-            start = Triggers.truncate_timestamp(dt.fromisoformat(raw_price['startsAt'])).replace(tzinfo=None)
-            if start < last_hour:
-                continue
-            price = round(Decimal(raw_price['total']), 4)
-            if start not in self.__prices:
-                updated_prices += 1
-                logging.debug(f'Price at {start}: {price:.4f} €')
-            self.__prices[start] = price
+        updated_prices = self.__add_prices((raw_price['startsAt'], raw_price['total']) for raw_price in prices_today + prices_tomorrow)
                 
         logging.debug(f'Loaded {updated_prices} new price entries.')
         if updated_prices:
             app_state.data.prices_revision.set(dt.now())
+            await self.__save_cache()
+        return True
+
+    def __add_prices(self, raw_prices):
+        oldest_slot = Triggers.get_current_slot() - self.__retention_slots
+        self.__prices.evict(oldest_slot)
+        updated_prices = 0
+        for raw_start, raw_price in raw_prices:
+            start = dt.fromisoformat(raw_start).replace(tzinfo=None)
+            slot = Triggers.get_slot(start)
+            if slot < oldest_slot:
+                continue
+            price = round(Decimal(raw_price), 4)
+            if self.__prices.set(slot, to_fixed(price, PRICE_SCALE)):
+                updated_prices += 1
+                logging.debug(f'Price at {Triggers.get_slot_timestamp(slot)}: {price:.4f} €')
+        return updated_prices
 
-    async def __post(self, session, query):
+    async def __post(self, query):
         token = self.__token
         if not token:
             return None
+        if self.__session is None:
+            # one long living session, so the connection to the API is reused
+            self.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=1, keepalive_timeout=_KEEPALIVE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(total=_REQUEST_TIMEOUT))
         headers = {
             'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
-        async with session.post('https://api.tibber.com/v1-beta/gql', json=query, headers=headers) as response:
+        async with self.__session.post(_URL, json=query, headers=headers) as response:
             response_json = await response.json()
             status = response.status
         if not (status >= 200 and status <= 299):
@@ -78,14 +148,52 @@ class Tibber:
             return None
         return response_json
 
+    def __load_cache(self):
+        if not self.__cache_file or not os.path.exists(self.__cache_file):
+            return
+        try:
+            with open(self.__cache_file, 'r') as stream:
+                raw_prices = json.load(stream)
+            loaded_prices = self.__add_prices(raw_prices.items())
+        except Exception as e:
+            logging.warning(f'Can not load cached prices: {e}')
+            return
+        logging.debug(f'Loaded {loaded_prices} price entries from cache.')
+        if loaded_prices:
+            app_state.data.prices_revision.set(dt.now())
+
+    async def __save_cache(self):
+        if not self.__cache_file:
+            return
+        content = json.dumps({Triggers.get_slot_timestamp(x).isoformat(): str(to_decimal(y, PRICE_SCALE)) for x, y in self.__prices.items()})
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write_atomic, self.__cache_file, content)
+        except Exception as e:
+            logging.warning(f'Can not write price cache: {e}')
+
+    def __delete_cache(self):
+        if not self.__cache_file:
+            return
+        try:
+            os.remove(self.__cache_file)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f'Can not delete price cache: {e}')
+
     def __config_change_handler(self, _ = None):
         self.__token = app_state.data.tibber_token.value
         if self.__token:
             if self.__task is None:
+                self.__load_cache()
                 self.__task = asyncio.create_task(self.__update())
         else:
             self.__prices.clear()
+            self.__delete_cache()
             app_state.data.prices_revision.set(dt.now())
             if self.__task:
                 self.__task.cancel()
-                self.__task = None
\ No newline at end of file
+                self.__task = None
+            if self.__session:
+                asyncio.create_task(self.__session.close())
+                self.__session = None
@@ -1 +1,4 @@
-from .scheduler import Scheduler
\ No newline at end of file
+from .backtest import BacktestResult, BacktestTotals, History, load_history, get_template_modes, run_backtest
+from .battery import Battery
+from .optimizer import ScheduleOptimizer
+from .scheduler import Scheduler
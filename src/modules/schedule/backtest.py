@@ -0,0 +1,161 @@
+import numpy as np
+from collections.abc import Sequence
+from dataclasses import dataclass
+from decimal import Decimal
+from ..core import OperationMode, SCHEDULE_TEMPLATE_LENGTH
+from ..energy import EnergyStore
+from .battery import Battery
+
+_IDLE = 0
+_CHARGE = 1
+_DISCHARGE = 2
+_CODES = {OperationMode.CHARGE: _CHARGE, OperationMode.DISCHARGE: _DISCHARGE}
+
+@dataclass(frozen=True)
+class History:
+    # recorded data of the slots [start, start + len(prices)), one array element per quarter
+    start: int
+    prices: np.ndarray # €/kWh, nan if unknown
+    charger_energy: np.ndarray # Wh
+    inverter_energy: np.ndarray # Wh
+    solar_energy: np.ndarray # Wh
+    cost: np.ndarray # €, negative
+    revenue: np.ndarray # €
+
+    @property
+    def end(self):
+        return self.start + len(self.prices)
+
+@dataclass(frozen=True)
+class BacktestTotals:
+    charger_energy: float # Wh
+    inverter_energy: float # Wh
+    solar_energy: float # Wh
+    cost: float # €, negative
+    revenue: float # €
+
+    @property
+    def profit(self):
+        return self.cost + self.revenue
+
+@dataclass(frozen=True)
+class BacktestResult:
+    start: int
+    end: int
+    simulated: BacktestTotals
+    recorded: BacktestTotals
+    charge_quarters: int
+    discharge_quarters: int
+    below_margin_quarters: int # discharge quarters with a margin below the minimum margin
+    unpriced_quarters: int # charge or discharge quarters without known price, not included in cost and revenue
+    energy: float # stored energy at the end, Wh
+    avg_charged_price: float # at the end, €/kWh
+
+def load_history(store: EnergyStore, start: int, end: int):
+    count = end - start
+    records = store.get_range(start, end)
+    index = np.fromiter((x.slot - start for x in records), dtype=np.int64, count=len(records))
+
+    def scatter(values, fill=0.0):
+        array = np.full(count, fill)
+        array[index] = np.fromiter(values, dtype=np.float64, count=len(records))
+        return array
+
+    prices = scatter((float(x.price) if x.price is not None else np.nan for x in records), np.nan)
+    charger_energy = scatter(x.charger_energy for x in records)
+    inverter_energy = scatter(x.inverter_energy for x in records)
+    cost = scatter(float(x.cost) for x in records)
+    revenue = scatter(float(x.revenue) for x in records)
+
+    # records imported from csv files have no price, but it can be derived from cost or revenue
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prices = np.where(np.isnan(prices) & (inverter_energy > 0), revenue * 1000 / inverter_energy, prices)
+        prices = np.where(np.isnan(prices) & (charger_energy > 0), cost * -1000 / charger_energy, prices)
+
+    return History(start, prices, charger_energy, inverter_energy, scatter(x.solar_energy for x in records), cost, revenue)
+
+def get_template_modes(template: Sequence[OperationMode], start: int, end: int):
+    # like in the app, a short template is padded with idle to a full day, which is then repeated like in Schedule.expanded
+    codes = np.full(SCHEDULE_TEMPLATE_LENGTH, _IDLE, dtype=np.int8)
+    for index, mode in enumerate(template[:SCHEDULE_TEMPLATE_LENGTH]):
+        codes[index] = _CODES.get(mode, _IDLE)
+    return codes[np.arange(start, end) % len(codes)]
+
+def run_backtest(history: History, modes: np.ndarray, battery: Battery, charger_eta: Decimal, inverter_eta: Decimal,
+                 minimum_margin: Decimal, respect_margin = False, energy = 0.0, avg_charged_price = 0.0):
+    # Replays the modes (one per slot of the history) on a simulated battery. Like with the real controllers, the modes
+    # are executed no matter if a price is known; the average charged price is only updated if the price is known,
+    # like in CapacityTracker. If respect_margin is set, discharging is skipped if the margin is below the minimum margin.
+    prices = history.prices
+    known = ~np.isnan(prices)
+    charger_eta = float(charger_eta)
+    inverter_eta = float(inverter_eta)
+    # like PriceSource, the charge price includes the losses of charging and discharging
+    charge_prices = np.round(prices / (charger_eta * inverter_eta), 4)
+    charging = modes == _CHARGE
+    discharging = modes == _DISCHARGE
+    solar = history.solar_energy
+
+    # Only the battery energy depends on the previous quarter; everything else is computed on whole arrays and the
+    # loop below only visits quarters where the battery energy may change.
+    active = np.flatnonzero(charging | discharging | (solar > 0))
+    capacity = float(battery.capacity)
+    max_charge = battery.charge_energy
+    max_discharge = battery.discharge_energy
+    minimum_margin = float(minimum_margin)
+    drawn_energy: list[float] = []
+    delivered_energy: list[float] = []
+    stored_solar_energy: list[float] = []
+    below_margin = 0
+
+    for is_charging, is_discharging, price, charge_price, solar_energy in zip(
+            charging[active].tolist(), discharging[active].tolist(), prices[active].tolist(),
+            charge_prices[active].tolist(), solar[active].tolist()):
+        stored_solar = min(solar_energy, capacity - energy)
+        drawn = min(max_charge, (capacity - energy - stored_solar) / charger_eta) if is_charging else 0.0
+        stored_charger = drawn * charger_eta
+        if (delta := stored_solar + stored_charger) > 0:
+            if charge_price == charge_price: # not nan
+                effective_price = charge_price * stored_charger / delta
+                avg_charged_price = (energy * avg_charged_price + delta * effective_price) / (energy + delta)
+            energy += delta
+
+        delivered = 0.0
+        if is_discharging:
+            is_below_margin = (price == price) and (price - avg_charged_price < minimum_margin)
+            below_margin += is_below_margin
+            if not (is_below_margin and respect_margin):
+                delivered = min(max_discharge, energy * inverter_eta)
+                energy -= delivered / inverter_eta
+
+        drawn_energy.append(drawn)
+        delivered_energy.append(delivered)
+        stored_solar_energy.append(stored_solar)
+
+    valued_prices = np.where(known, prices, 0.0)[active]
+    drawn_array = np.array(drawn_energy)
+    delivered_array = np.array(delivered_energy)
+    simulated = BacktestTotals(
+        charger_energy=float(drawn_array.sum()),
+        inverter_energy=float(delivered_array.sum()),
+        solar_energy=float(np.sum(stored_solar_energy)),
+        cost=float(drawn_array @ valued_prices) / -1000,
+        revenue=float(delivered_array @ valued_prices) / 1000)
+    recorded = BacktestTotals(
+        charger_energy=float(history.charger_energy.sum()),
+        inverter_energy=float(history.inverter_energy.sum()),
+        solar_energy=float(solar.sum()),
+        cost=float(history.cost.sum()),
+        revenue=float(history.revenue.sum()))
+
+    return BacktestResult(
+        start=history.start,
+        end=history.end,
+        simulated=simulated,
+        recorded=recorded,
+        charge_quarters=int(np.count_nonzero(charging)),
+        discharge_quarters=int(np.count_nonzero(discharging)),
+        below_margin_quarters=below_margin,
+        unpriced_quarters=int(np.count_nonzero((charging | discharging) & ~known)),
+        energy=energy,
+        avg_charged_price=avg_charged_price)
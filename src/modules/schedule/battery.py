@@ -0,0 +1,41 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from ..core import get_optional_config_key
+
+_BATTERY_CONFIG_KEY = 'battery'
+_CAPACITY_CONFIG_KEY = 'capacity'
+_CHARGE_POWER_CONFIG_KEY = 'charge_power'
+_DISCHARGE_POWER_CONFIG_KEY = 'discharge_power'
+_VOLTAGE_CONFIG_KEY = 'voltage'
+
+@dataclass(frozen=True)
+class Battery:
+    capacity: int # Wh
+    charge_power: int # W drawn from the grid
+    discharge_power: int # W fed into the grid
+    voltage: float | None = None # nominal, V; converts the reported remaining capacity to energy
+
+    @property
+    def charge_energy(self):
+        # per quarter hour, Wh
+        return self.charge_power / 4
+
+    @property
+    def discharge_energy(self):
+        # per quarter hour, Wh
+        return self.discharge_power / 4
+
+    def get_energy(self, remaining_capacity: Decimal):
+        # Ah to Wh
+        assert self.voltage is not None
+        return float(remaining_capacity) * self.voltage
+
+    @staticmethod
+    def from_config(config: dict):
+        capacity = get_optional_config_key(config, int, None, None, _BATTERY_CONFIG_KEY, _CAPACITY_CONFIG_KEY)
+        if capacity is None:
+            return None
+        charge_power = get_optional_config_key(config, int, 0, None, _BATTERY_CONFIG_KEY, _CHARGE_POWER_CONFIG_KEY)
+        discharge_power = get_optional_config_key(config, int, 0, None, _BATTERY_CONFIG_KEY, _DISCHARGE_POWER_CONFIG_KEY)
+        voltage = get_optional_config_key(config, float, None, None, _BATTERY_CONFIG_KEY, _VOLTAGE_CONFIG_KEY)
+        return Battery(capacity, charge_power, discharge_power, voltage)
@@ -0,0 +1,151 @@
+import logging, math, time
+import numpy as np
+from collections.abc import Sequence
+from ..core import OperationMode, Schedule, Triggers, app_state, get_optional_config_key
+from ..core.triggers import triggers
+from ..core.fixedpoint import PRICE_SCALE
+from ..core.metrics import DurationStats
+from ..price import PriceSource
+from .battery import Battery
+
+_OPTIMIZER_CONFIG_KEY = 'optimizer'
+_ENABLED_CONFIG_KEY = 'enabled'
+
+_IDLE = 0
+_CHARGE = 1
+_DISCHARGE = 2
+_MODES = (OperationMode.IDLE, OperationMode.CHARGE, OperationMode.DISCHARGE)
+_CODES = {OperationMode.CHARGE: _CHARGE, OperationMode.DISCHARGE: _DISCHARGE}
+
+_MAX_LEVELS = 1000
+_LEVELS_PER_STEP = 4 # resolution of the battery energy per charge or discharge quarter
+
+def optimize_modes(prices: np.ndarray, forced: Sequence[OperationMode | None], energy: float, battery: Battery,
+                   charger_eta: float, inverter_eta: float, minimum_margin: float):
+    # Profit maximizing modes for the given prices (€/kWh, one per quarter) by dynamic programming over the stored energy.
+    # Quarters with a forced mode or without price keep their mode. Discharging has to earn the minimum margin per kWh,
+    # energy left at the end is worth the cheapest charge price of the horizon, so the battery is not emptied just because
+    # the horizon ends.
+    count = len(prices)
+    charge_step = battery.charge_energy * charger_eta # stored Wh per charge quarter
+    discharge_step = battery.discharge_energy / inverter_eta # stored Wh per discharge quarter
+    if count == 0 or battery.capacity <= 0 or charge_step <= 0 or discharge_step <= 0:
+        return [x or OperationMode.IDLE for x in forced]
+
+    resolution = min(charge_step, discharge_step) / _LEVELS_PER_STEP
+    levels = min(_MAX_LEVELS, math.ceil(battery.capacity / resolution))
+    resolution = battery.capacity / levels
+    level = np.arange(levels + 1)
+    charged = np.minimum(level + max(1, round(charge_step / resolution)), levels)
+    discharged = np.maximum(level - max(1, round(discharge_step / resolution)), 0)
+    # grid energy in kWh per quarter, by start level
+    drawn = (charged - level) * (resolution / charger_eta / 1000)
+    delivered = (level - discharged) * (resolution * inverter_eta / 1000)
+
+    known = ~np.isnan(prices)
+    codes = np.array([_CODES.get(x, _IDLE) if x is not None else -1 for x in forced], dtype=np.int8)
+    codes[(codes < 0) & ~known] = _IDLE
+    if known.any():
+        value = level * (resolution / 1000) * float(np.min(prices[known]) / charger_eta)
+    else:
+        value = np.zeros(levels + 1)
+
+    # backward pass; ties prefer idle, then charge
+    choices = np.empty((count, levels + 1), dtype=np.int8)
+    candidates = np.empty((3, levels + 1))
+    for index in range(count - 1, -1, -1):
+        price = prices[index] if known[index] else 0.0
+        candidates[_IDLE] = value
+        candidates[_CHARGE] = value[charged] - drawn * price
+        candidates[_DISCHARGE] = value[discharged] + delivered * (price - minimum_margin)
+        if (code := codes[index]) >= 0:
+            choices[index] = code
+            value = candidates[code].copy()
+        else:
+            choices[index] = np.argmax(candidates, axis=0)
+            value = candidates[choices[index], level]
+
+    # forward pass from the current energy
+    current = min(levels, max(0, round(energy / resolution)))
+    modes: list[OperationMode] = []
+    for index in range(count):
+        choice = choices[index, current]
+        modes.append(forced[index] or _MODES[choice])
+        if choice == _CHARGE:
+            current = charged[current]
+        elif choice == _DISCHARGE:
+            current = discharged[current]
+    return modes
+
+class ScheduleOptimizer:
+    # Writes profit maximizing modes into the schedule whenever new prices arrive; slots pinned by the user are kept.
+    def __init__(self, config: dict, prices: PriceSource):
+        self.__prices = prices
+        self.__battery = Battery.from_config(config)
+        self.__is_enabled = get_optional_config_key(config, bool, False, None, _OPTIMIZER_CONFIG_KEY, _ENABLED_CONFIG_KEY)
+        self.__last_inputs = None
+        self.__duration = DurationStats()
+        if not self.__is_enabled:
+            return
+        if self.__battery is None or self.__battery.voltage is None:
+            raise KeyError('The schedule optimizer needs battery -> capacity and battery -> voltage.')
+
+        app_state.data.prices_revision.on_change.subscribe(self.optimize)
+        app_state.data.pinned_slots.on_change.subscribe(self.optimize)
+        app_state.data.minimum_margin.on_change.subscribe(self.optimize)
+        # the plan starts from the measured energy again once the capacity of the last quarter is known
+        triggers.add('schedule optimizer', '2/15 * * * *', self.optimize)
+
+    @property
+    def is_enabled(self):
+        return self.__is_enabled
+
+    @property
+    def duration(self):
+        return self.__duration
+
+    def start(self):
+        if self.__is_enabled:
+            self.optimize()
+
+    def optimize(self, _ = None):
+        battery = self.__battery
+        assert battery is not None
+        remaining_capacity = app_state.data.remaining_capacity.value
+        if remaining_capacity < 0:
+            logging.debug('Schedule optimization skipped: remaining capacity unknown.')
+            return
+        snapshot = self.__prices.get_snapshot()
+        schedule: Schedule = app_state.data.schedule.value
+        start = max(snapshot.start, schedule.start)
+        end = min(snapshot.end, schedule.end)
+        if start >= end:
+            return
+
+        prices = np.array([x / PRICE_SCALE if x is not None else np.nan for x in snapshot.discharge[start - snapshot.start:end - snapshot.start]])
+        pinned_slots: frozenset[int] = app_state.data.pinned_slots.value
+        # the current quarter is already running, so its mode is kept like the pinned ones
+        current_slot = Triggers.get_current_slot()
+        forced = [schedule.get_slot(x) if (x in pinned_slots or x <= current_slot or np.isnan(y)) else None
+                  for x, y in zip(range(start, end), prices.tolist())]
+        energy = battery.get_energy(remaining_capacity)
+        charger_eta = float(app_state.data.charger_efficiency.value)
+        inverter_eta = float(app_state.data.inverter_efficiency.value)
+        minimum_margin = float(app_state.data.minimum_margin.value)
+
+        inputs = (snapshot, schedule, tuple(forced), energy, charger_eta, inverter_eta, minimum_margin)
+        if inputs == self.__last_inputs:
+            return
+        self.__last_inputs = inputs
+
+        start_time = time.perf_counter()
+        modes = optimize_modes(prices, forced, energy, battery, charger_eta, inverter_eta, minimum_margin)
+        self.__duration.add(time.perf_counter() - start_time)
+
+        items = ((Triggers.get_slot_timestamp(x), y) for x, y in zip(range(start, end), modes) if y != schedule.get_slot(x))
+        new_schedule = schedule.updated(items)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'Schedule optimized, {len(new_schedule.changed_slots)} slots changed; {self.__duration}.')
+        if new_schedule.changed_slots:
+            app_state.data.schedule.set(new_schedule)
+            app_state.save()
@@ -0,0 +1,75 @@
+import numpy as np
+from dataclasses import dataclass
+from decimal import Decimal
+from ..core import OperationMode, Schedule
+from ..core.fixedpoint import PRICE_SCALE
+from ..price import PriceSnapshot
+from .battery import Battery
+
+EMPTY = -1
+FULL = 1
+
+@dataclass(frozen=True)
+class Projection:
+    # expected state at the end of each slot of the schedule
+    start: int
+    capacity: np.ndarray # Ah
+    avg_charged_price: np.ndarray # €/kWh
+    limits: np.ndarray # EMPTY or FULL if the mode of the slot could not be executed completely, else 0
+
+    def get(self, slot: int) -> tuple[float, float, int] | None:
+        index = slot - self.start
+        if not (0 <= index < len(self.capacity)):
+            return None
+        return float(self.capacity[index]), float(self.avg_charged_price[index]), int(self.limits[index])
+
+def project(schedule: Schedule, snapshot: PriceSnapshot, remaining_capacity: Decimal, avg_charged_price: Decimal,
+            battery: Battery, charger_eta: Decimal, inverter_eta: Decimal):
+    assert battery.voltage is not None
+    start = schedule.start
+    count = schedule.end - start
+    modes = [schedule.get_slot(x) for x in range(start, schedule.end)]
+    charging = np.fromiter((x == OperationMode.CHARGE for x in modes), dtype=bool, count=count)
+    discharging = np.fromiter((x == OperationMode.DISCHARGE for x in modes), dtype=bool, count=count)
+    charge_prices = np.fromiter(((x.charge / PRICE_SCALE if (x := snapshot.get(y)) else np.nan) for y in range(start, schedule.end)),
+                                dtype=np.float64, count=count)
+
+    # change of the stored energy per slot if the battery was never full or empty, Wh
+    deltas = np.where(charging, battery.charge_energy * float(charger_eta), 0.0) \
+        - np.where(discharging, battery.discharge_energy / float(inverter_eta), 0.0)
+    # The battery only stops at its limits, so the energy is a clipped running sum; it is computed in a single pass,
+    # which also updates the average charged price like CapacityTracker does.
+    maximum = float(battery.capacity)
+    energy = min(maximum, max(0.0, battery.get_energy(remaining_capacity)))
+    price = float(avg_charged_price)
+    energies: list[float] = []
+    prices: list[float] = []
+    for delta, charge_price in zip(deltas.tolist(), charge_prices.tolist()):
+        new_energy = min(maximum, max(0.0, energy + delta))
+        if new_energy > energy and charge_price == charge_price: # not nan
+            price = (energy * price + (new_energy - energy) * charge_price) / new_energy
+        energy = new_energy
+        energies.append(energy)
+        prices.append(price)
+
+    energy_array = np.array(energies)
+    limits = np.zeros(count, dtype=np.int8)
+    limits[charging & (energy_array >= maximum)] = FULL
+    limits[discharging & (energy_array <= 0.0)] = EMPTY
+    return Projection(start, energy_array / battery.voltage, np.array(prices), limits)
+
+class ProjectionCache:
+    # the projection is only computed again if one of its inputs changed
+    def __init__(self):
+        self.__inputs: tuple | None = None
+        self.__projection: Projection | None = None
+        self.computations = 0
+
+    def get(self, schedule: Schedule, snapshot: PriceSnapshot, remaining_capacity: Decimal, avg_charged_price: Decimal,
+            battery: Battery, charger_eta: Decimal, inverter_eta: Decimal):
+        inputs = (schedule, snapshot, remaining_capacity, avg_charged_price, battery, charger_eta, inverter_eta)
+        if self.__inputs is None or any(x is not y and x != y for x, y in zip(inputs, self.__inputs)):
+            self.__projection = project(*inputs)
+            self.__inputs = inputs
+            self.computations += 1
+        return self.__projection
@@ -1,8 +1,12 @@
-import logging
+import asyncio, logging, traceback
 from collections import namedtuple
-from ..core import Triggers, OperationMode, app_state, EventPayload, triggers
+from datetime import datetime
+from ..core import Triggers, OperationMode, Schedule, app_state, EventPayload, KeyedChange
+from ..core.metrics import Histogram
 from ..uplink.virtualcontroller import VirtualController
 
+_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
 class Scheduler:
     ScheduleEntry = namedtuple('ScheduleEntry', 'timestamp mode')
 
@@ -10,16 +14,40 @@ class Scheduler:
         self.__uplink = uplink
 
         self.__mode_sent_count = 0
+        self.__mode_settable_controllers = uplink.mode_settable_controllers
         self.__controllers_in_startup: set[str] = set()
 
+        # the mode for the next quarter is known in advance and sent by a timer exactly at the quarter change
+        self.__timer: asyncio.TimerHandle | None = None
+        self.__next_slot = 0
+        self.__next_mode = OperationMode.IDLE
+        self.__boundary: datetime | None = None # set while the mode for a new quarter is being sent
+        self.__last_schedule: Schedule | None = None
+
+        self.__publish_latency = Histogram(_LATENCY_BUCKETS)
+        self.__confirm_latency = {x: Histogram(_LATENCY_BUCKETS) for x in self.__mode_settable_controllers}
+        self.__pending_confirmations: dict[str, tuple[OperationMode, datetime]] = {}
+
         app_state.data.locks.on_change.subscribe(self.__locks_handler)
-        app_state.data.schedule.on_change.subscribe(self.__get_requested_mode)
+        app_state.data.actual_mode.on_change.subscribe(self.__actual_mode_handler)
+        app_state.data.schedule.on_change.subscribe(self.__schedule_handler)
         app_state.data.manual_mode.on_change.subscribe(self.__get_requested_mode)
+        app_state.data.manual_mode.on_change.subscribe(self.__get_next_mode)
         app_state.data.requested_mode.on_change.subscribe(self.__send_mode)
 
+    @property
+    def publish_latency(self):
+        # time from the quarter change until the mode command is published
+        return self.__publish_latency
+
+    @property
+    def confirm_latency(self):
+        # time from the quarter change until each controller reports the new mode
+        return self.__confirm_latency
+
     def start(self):
         self.__expand_and_send()
-        triggers.add('update_schedule', '0/15 * * * *', self.__expand_and_send)
+        self.__arm_timer()
 
     def __expand_and_send(self):
         old_counter = self.__mode_sent_count
@@ -32,34 +60,105 @@ class Scheduler:
             # no mode was sent since requested mode did not change, so send manually
             self.__send_mode()
 
-    def __locks_handler(self, args: EventPayload[dict[str, tuple[str, ...]]]):
-        for name, locks in args.data.items():
-            if name not in self.__uplink.mode_settable_controllers:
-                continue
-            if 'startup' not in locks:
-                self.__controllers_in_startup.discard(name)
-                continue
-            if name in self.__controllers_in_startup:
-                continue
-        
-            self.__controllers_in_startup.add(name)
-            requested_mode: OperationMode = app_state.data.requested_mode.value
-            logging.info(f'Statup of controller {name} detected, sending mode {requested_mode.value} command again.')
-            self.__uplink.send_mode(requested_mode, name)
+    def __arm_timer(self):
+        now = datetime.now()
+        self.__next_slot = Triggers.get_slot(now) + 1
+        self.__get_next_mode()
+        delay = (Triggers.get_slot_timestamp(self.__next_slot) - now).total_seconds()
+        self.__timer = asyncio.get_running_loop().call_later(delay, self.__timer_handler)
+
+    def __timer_handler(self):
+        boundary = Triggers.get_slot_timestamp(self.__next_slot)
+        if (remaining := (boundary - datetime.now()).total_seconds()) > 0:
+            # loop time and wall clock time drifted apart
+            self.__timer = asyncio.get_running_loop().call_later(remaining, self.__timer_handler)
+            return
+
+        # the timer has to be armed again no matter what failed, otherwise the mode would never be switched again
+        try:
+            old_counter = self.__mode_sent_count
+            self.__boundary = boundary
+            try:
+                app_state.data.requested_mode.set(self.__next_mode)
+                if self.__mode_sent_count == old_counter:
+                    self.__send_mode()
+            except Exception as e:
+                logging.error(f'Sending mode for quarter {boundary} failed:\n{repr(e)}\n{traceback.format_exc()}')
+            finally:
+                self.__boundary = None
+            # expanding is not time critical, so it is done after sending
+            try:
+                app_state.expand_schedule()
+            except Exception as e:
+                logging.error(f'Expanding schedule failed:\n{repr(e)}\n{traceback.format_exc()}')
+        finally:
+            self.__arm_timer()
+
+    def __schedule_handler(self, args: EventPayload[Schedule]):
+        # only changes of the current or the next quarter matter; edits and expansions usually touch neither
+        changed_slots = args.data.get_changed_slots(self.__last_schedule)
+        self.__last_schedule = args.data
+        if changed_slots is None or Triggers.get_current_slot() in changed_slots:
+            self.__get_requested_mode()
+            # the requested mode is the fallback for the next quarter
+            self.__get_next_mode()
+        elif self.__next_slot in changed_slots:
+            self.__get_next_mode()
+
+    def __get_next_mode(self, _ = None):
+        manual_mode = app_state.data.manual_mode.value
+        if manual_mode:
+            self.__next_mode = manual_mode
+        else:
+            schedule: Schedule = app_state.data.schedule.value
+            self.__next_mode = schedule.get_slot(self.__next_slot, app_state.data.requested_mode.value)
+
+    def __actual_mode_handler(self, args: EventPayload[KeyedChange[str, OperationMode | None]]):
+        name = args.data.key
+        if (pending := self.__pending_confirmations.get(name)) is None or pending[0] != args.data.new:
+            return
+        del self.__pending_confirmations[name]
+        histogram = self.__confirm_latency[name]
+        histogram.add((datetime.now() - pending[1]).total_seconds())
+        logging.debug(f'Mode switch latency of controller {name}: {histogram}.')
+
+    def __locks_handler(self, args: EventPayload[KeyedChange[str, tuple[str, ...]]]):
+        name = args.data.key
+        if name not in self.__mode_settable_controllers:
+            return
+        if 'startup' not in args.data.new:
+            self.__controllers_in_startup.discard(name)
+            return
+        if name in self.__controllers_in_startup:
+            return
+
+        self.__controllers_in_startup.add(name)
+        requested_mode: OperationMode = app_state.data.requested_mode.value
+        logging.info(f'Statup of controller {name} detected, sending mode {requested_mode.value} command again.')
+        self.__uplink.send_mode(requested_mode, name)
 
     def __get_requested_mode(self, _ = None):
         manual_mode = app_state.data.manual_mode.value
         if manual_mode:
             requested_mode = manual_mode
         else:
-            schedule = app_state.data.schedule.value
+            schedule: Schedule = app_state.data.schedule.value
             # it is not always quaranteed that the schedule is already expanded; so if not, assume that the last requested
             # mode is still valid
-            requested_mode = schedule.get(Triggers.get_current_quarter_hour(), app_state.data.requested_mode.value)
+            requested_mode = schedule.get_slot(Triggers.get_current_slot(), app_state.data.requested_mode.value)
         app_state.data.requested_mode.set(requested_mode)
 
     def __send_mode(self, _ = None):
         mode = app_state.data.requested_mode.value
         self.__uplink.send_mode(mode)
+        if (boundary := self.__boundary) is not None:
+            self.__publish_latency.add((datetime.now() - boundary).total_seconds())
+            actual_modes = app_state.data.actual_mode.value
+            for name in self.__mode_settable_controllers:
+                if actual_modes.get(name) != mode:
+                    self.__pending_confirmations[name] = (mode, boundary)
+                else:
+                    self.__pending_confirmations.pop(name, None)
+            logging.debug(f'Mode publish latency: {self.__publish_latency}.')
         logging.info(f'Next mode: {mode.value}.')
         self.__mode_sent_count = (self.__mode_sent_count + 1) & 0xFFFF
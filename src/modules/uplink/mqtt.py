@@ -1,60 +1,202 @@
-import logging
+import asyncio, logging, random, traceback
 import paho.mqtt.client as mqtt
+from collections import deque
 from ssl import CERT_NONE
+from typing import Any, Callable
 
-from ..core import get_config_key, get_optional_config_key
+from ..core import get_config_key, get_optional_config_key, EventBox
+from .topictrie import TopicTrie
 
-_MQTT_CONFIG_KEY = 'mqtt'
+MQTT_CONFIG_KEY = 'mqtt'
 _HOST_CONFIG_KEY = 'host'
 _CA_CONFIG_KEY = 'ca'
 _TLS_INSECURE_CONFIG_KEY = 'tls_insecure'
 _USER_CONFIG_KEY = 'user'
 _PASSWORD_CONFIG_KEY = 'password'
+_WILDCARD_SUBSCRIPTIONS_CONFIG_KEY = 'wildcard_subscriptions'
 
 _HOST_ENV_NAME = 'HBRE_MQTT_HOST'
 _USER_ENV_NAME = 'HBRE_MQTT_USER'
 _PASS_ENV_NAME = 'HBRE_MQTT_PASS'
 
+# upper limit of messages handled in one go, so a flood of messages can not starve the event loop
+_MAX_BATCH_SIZE = 1000
+
+_KEEPALIVE = 60
+_MISC_INTERVAL = 1.0
+_MIN_RECONNECT_DELAY = 1.0
+_MAX_RECONNECT_DELAY = 60.0
+
 class Mqtt():
     def __init__(self, config: dict):
         self.__mqtt = mqtt.Client()
         self.__mqtt.on_connect = self.__on_mqtt_connect
+        self.__mqtt.on_disconnect = self.__on_mqtt_disconnect
         self.__mqtt.on_message = self.__on_message
+        self.__mqtt.on_socket_open = self.__on_socket_open
+        self.__mqtt.on_socket_close = self.__on_socket_close
+        self.__mqtt.on_socket_register_write = self.__on_socket_register_write
+        self.__mqtt.on_socket_unregister_write = self.__on_socket_unregister_write
 
-        self.__host, self.__port = get_config_key(config, lambda x: str(x).split(':'), _HOST_ENV_NAME, _MQTT_CONFIG_KEY, _HOST_CONFIG_KEY)
+        self.__host, self.__port = get_config_key(config, lambda x: str(x).split(':'), _HOST_ENV_NAME, MQTT_CONFIG_KEY, _HOST_CONFIG_KEY)
 
-        ca_path = get_optional_config_key(config, str, None, None, _MQTT_CONFIG_KEY, _CA_CONFIG_KEY)
-        is_tls_insecure = get_optional_config_key(config, bool, False, None, _MQTT_CONFIG_KEY, _TLS_INSECURE_CONFIG_KEY)
+        ca_path = get_optional_config_key(config, str, None, None, MQTT_CONFIG_KEY, _CA_CONFIG_KEY)
+        is_tls_insecure = get_optional_config_key(config, bool, False, None, MQTT_CONFIG_KEY, _TLS_INSECURE_CONFIG_KEY)
         if ca_path or is_tls_insecure:
             self.__mqtt.tls_set(ca_certs=ca_path, cert_reqs=CERT_NONE if is_tls_insecure else None)
 
-        user = get_optional_config_key(config, str, None, _USER_ENV_NAME, _MQTT_CONFIG_KEY, _USER_CONFIG_KEY)
-        password = get_optional_config_key(config, str, None, _PASS_ENV_NAME, _MQTT_CONFIG_KEY, _PASSWORD_CONFIG_KEY)
+        user = get_optional_config_key(config, str, None, _USER_ENV_NAME, MQTT_CONFIG_KEY, _USER_CONFIG_KEY)
+        password = get_optional_config_key(config, str, None, _PASS_ENV_NAME, MQTT_CONFIG_KEY, _PASSWORD_CONFIG_KEY)
         if user or password:
             self.__mqtt.username_pw_set(user, password)
 
+        self.__use_wildcard_subscriptions = get_optional_config_key(config, bool, False, None, MQTT_CONFIG_KEY, _WILDCARD_SUBSCRIPTIONS_CONFIG_KEY)
+
         self.__subscriptions = {}
+        self.__routes: TopicTrie[Callable[[Any], None]] = TopicTrie()
+
+        # the client socket is driven by the event loop, no extra network thread is involved
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__task: asyncio.Task | None = None
+        self.__disconnected = asyncio.Event()
+        self.__reconnect_attempt = 0
+
+        self.__inbox: deque[tuple[Callable[[Any], None], Any]] = deque()
+        self.__is_drain_scheduled = False
+        self.__on_batch_end: EventBox[int] = EventBox()
+
+    @property
+    def on_batch_end(self):
+        return self.__on_batch_end
 
-    def __del__(self):
-        self.__mqtt.loop_stop()
+    @property
+    def use_wildcard_subscriptions(self):
+        return self.__use_wildcard_subscriptions
 
     def start(self):
-        self.__mqtt.connect(self.__host, int(self.__port), 60)
-        self.__mqtt.loop_start()
+        self.__loop = asyncio.get_running_loop()
+        self.__mqtt.connect_async(self.__host, int(self.__port), _KEEPALIVE)
+        self.__task = asyncio.create_task(self.__run())
 
     def subscribe(self, topic, qos, callback):
+        self.add_subscription(topic, qos)
+        self.add_route(topic, callback)
+
+    def add_subscription(self, topic: str, qos: int):
+        # subscribes at the broker only; messages are dispatched by the routes
         assert topic not in self.__subscriptions
         self.__subscriptions[topic] = qos
-        self.__mqtt.message_callback_add(topic, lambda client, userdata, msg: callback(msg))
+
+    def add_route(self, topic: str, callback: Callable[[Any], None]):
+        # dispatches messages of an existing subscription, e.g. one of many topics matched by a wildcard subscription
+        self.__routes.add(topic, callback)
 
     def publish(self, topic: str, payload, qos: int, retain=False):
         self.__mqtt.publish(topic, payload, qos=qos, retain=retain)
 
+    async def __run(self):
+        assert self.__loop is not None
+        while True:
+            self.__disconnected.clear()
+            try:
+                # name resolution, TCP connect and TLS handshake are blocking, so keep them away from the loop
+                await self.__loop.run_in_executor(None, self.__mqtt.reconnect)
+            except Exception as e:
+                delay = self.__get_reconnect_delay()
+                logging.warning(f'MQTT connection to {self.__host}:{self.__port} failed: {e}; retry in {delay:.1f} s.')
+                await asyncio.sleep(delay)
+                continue
+
+            misc_task = asyncio.create_task(self.__misc_loop())
+            await self.__disconnected.wait()
+            misc_task.cancel()
+
+            delay = self.__get_reconnect_delay()
+            logging.warning(f'MQTT connection lost; reconnect in {delay:.1f} s.')
+            await asyncio.sleep(delay)
+
+    async def __misc_loop(self):
+        while True:
+            await asyncio.sleep(_MISC_INTERVAL)
+            if self.__mqtt.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                self.__disconnected.set()
+                return
+
+    def __get_reconnect_delay(self):
+        delay = min(_MAX_RECONNECT_DELAY, _MIN_RECONNECT_DELAY * (2 ** self.__reconnect_attempt))
+        self.__reconnect_attempt = min(self.__reconnect_attempt + 1, 16)
+        return delay * random.uniform(0.5, 1.0)
+
     def __on_mqtt_connect(self, client, userdata, flags, rc):
         logging.debug(f'MQTT connected with code {rc}.')
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            return
+        self.__reconnect_attempt = 0
         for topic, qos in self.__subscriptions.items():
             self.__mqtt.subscribe(topic, qos=qos)
 
-    def __on_message(self, client, userdata, msg):
-        logging.error(f'Unknown MQTT message at topic {msg.topic}: {msg.payload}.')
+    def __on_mqtt_disconnect(self, client, userdata, rc):
+        logging.debug(f'MQTT disconnected with code {rc}.')
+        self.__call_in_loop(self.__disconnected.set)
+
+    def __on_socket_open(self, client, userdata, sock):
+        self.__call_in_loop(self.__loop.add_reader, sock, self.__on_readable)
+
+    def __on_socket_close(self, client, userdata, sock):
+        self.__call_in_loop(self.__loop.remove_reader, sock)
+        self.__call_in_loop(self.__loop.remove_writer, sock)
+
+    def __on_socket_register_write(self, client, userdata, sock):
+        self.__call_in_loop(self.__loop.add_writer, sock, self.__on_writable)
+
+    def __on_socket_unregister_write(self, client, userdata, sock):
+        self.__call_in_loop(self.__loop.remove_writer, sock)
 
+    def __on_readable(self):
+        self.__mqtt.loop_read()
+
+    def __on_writable(self):
+        self.__mqtt.loop_write()
+
+    def __call_in_loop(self, func: Callable, *args):
+        # socket callbacks may also come from the executor thread used for connecting
+        assert self.__loop is not None
+        self.__loop.call_soon_threadsafe(func, *args)
+
+    def __enqueue(self, callback: Callable[[Any], None], msg):
+        assert self.__loop is not None
+        self.__inbox.append((callback, msg))
+        if self.__is_drain_scheduled:
+            return
+        self.__is_drain_scheduled = True
+        self.__loop.call_soon(self.__drain)
+
+    def __drain(self):
+        assert self.__loop is not None
+        self.__is_drain_scheduled = False
+        count = 0
+        while self.__inbox and count < _MAX_BATCH_SIZE:
+            callback, msg = self.__inbox.popleft()
+            count += 1
+            try:
+                callback(msg)
+            except Exception as e:
+                logging.error(f'Handling MQTT message at topic {msg.topic} failed: {repr(e)}\n{traceback.format_exc()}')
+        if self.__inbox and not self.__is_drain_scheduled:
+            self.__is_drain_scheduled = True
+            self.__loop.call_soon(self.__drain)
+        if count:
+            self.__on_batch_end.fire(self, count)
+
+    def __on_message(self, client, userdata, msg):
+        callbacks = self.__routes.match(msg.topic)
+        for callback in callbacks:
+            self.__enqueue(callback, msg)
+        if callbacks:
+            return
+        if self.__use_wildcard_subscriptions:
+            # wildcard subscriptions may also match topics of devices not configured here
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug(f'Ignored MQTT message at topic {msg.topic}.')
+        else:
+            logging.error(f'Unknown MQTT message at topic {msg.topic}: {msg.payload}.')
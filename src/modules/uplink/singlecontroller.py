@@ -9,6 +9,15 @@ _ROOT_CONFIG_KEY = 'root'
 _IS_MODE_SETTABLE_CONFIG_KEY = 'is_mode_settable'
 _IS_RESETTABLE_CONFIG_KEY = 'is_resettable'
 
+# topic suffix, qos
+SUBSCRIBED_TOPICS = (
+    ('mode/actual', 1),
+    ('locked', 1),
+    ('cha/sum', 2),
+    ('inv/sum', 2),
+    ('sol/sum', 2),
+    ('bat/sum', 2))
+
 class SingleController:
     def __init__(self, config: dict, mqtt: Mqtt, name: str):
         self.__mqtt = mqtt
@@ -20,12 +29,20 @@ class SingleController:
         self.__mode_set_topic = f'{self.__root}/mode/set'
         self.__reset_topic = f'{self.__root}/reset'
 
-        mqtt.subscribe(f'{self.__root}/mode/actual', 1, self.__on_mode_actual)
-        mqtt.subscribe(f'{self.__root}/locked', 1, self.__on_locked)
-        mqtt.subscribe(f'{self.__root}/cha/sum', 2, self.__on_charger)
-        mqtt.subscribe(f'{self.__root}/inv/sum', 2, self.__on_inverter)
-        mqtt.subscribe(f'{self.__root}/sol/sum', 2, self.__on_solar)
-        mqtt.subscribe(f'{self.__root}/bat/sum', 2, self.__on_battery)
+        handlers = {
+            'mode/actual': self.__on_mode_actual,
+            'locked': self.__on_locked,
+            'cha/sum': self.__on_charger,
+            'inv/sum': self.__on_inverter,
+            'sol/sum': self.__on_solar,
+            'bat/sum': self.__on_battery}
+        for suffix, qos in SUBSCRIBED_TOPICS:
+            topic = f'{self.__root}/{suffix}'
+            if mqtt.use_wildcard_subscriptions:
+                # the virtual controller subscribes one wildcard topic for all controllers
+                mqtt.add_route(topic, handlers[suffix])
+            else:
+                mqtt.subscribe(topic, qos, handlers[suffix])
 
         self.__mode_callback = None
         self.__locked_callback = None
@@ -38,6 +55,10 @@ class SingleController:
     @property
     def name(self):
         return self.__name
+
+    @property
+    def root(self):
+        return self.__root
     
     @property
     def is_mode_settable(self):
@@ -81,13 +102,15 @@ class SingleController:
             mode = OperationMode(string)
         except:
             mode = None
-        logging.debug(f'MQTT {self.__root}: Operation mode: {string}.')
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'MQTT {self.__root}: Operation mode: {string}.')
         if self.__mode_callback:
             self.__mode_callback(self, mode)
 
     def __on_locked(self, msg):
         locks = sorted(json.loads(msg.payload.decode('utf-8'))) or []
-        logging.debug(f'MQTT {self.__root}: Locks: {", ".join(locks or ("<none>",))}.')
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'MQTT {self.__root}: Locks: {", ".join(locks or ("<none>",))}.')
         if self.__locked_callback:
             self.__locked_callback(self, locks)
 
@@ -98,7 +121,8 @@ class SingleController:
         except:
             logging.warning(f'MQTT {self.__root}: Can not parse battery message.')
             return
-        logging.debug(f'MQTT {self.__root}: Combined battery capacity: {capacity} Ah.')
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'MQTT {self.__root}: Combined battery capacity: {capacity} Ah.')
         if self.__battery_callback:
             self.__battery_callback(self, capacity)
 
@@ -121,6 +145,7 @@ class SingleController:
             return
         if (energy is None):
             return
-        logging.debug(f'MQTT {self.__root}: {sender} data: energy={energy} Wh.')
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f'MQTT {self.__root}: {sender} data: energy={energy} Wh.')
         if callback:
             callback(self, energy)
@@ -0,0 +1,58 @@
+from typing import Generic, TypeVar
+
+T = TypeVar('T')
+
+class _Node(Generic[T]):
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children: dict[str, _Node[T]] = {}
+        self.values: list[T] = []
+
+class TopicTrie(Generic[T]):
+    # Maps MQTT topic filters (including + and # wildcards) to values; matching a topic costs O(topic depth)
+    # as long as the filters are mostly exact.
+    def __init__(self):
+        self.__root: _Node[T] = _Node()
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def add(self, filter: str, value: T):
+        node = self.__root
+        for level in filter.split('/'):
+            if (child := node.children.get(level)) is None:
+                child = _Node()
+                node.children[level] = child
+            node = child
+        node.values.append(value)
+        self.__count += 1
+
+    def match(self, topic: str) -> list[T]:
+        result: list[T] = []
+        self.__match(self.__root, topic.split('/'), 0, result)
+        return result
+
+    def __match(self, node: _Node[T], levels: list[str], index: int, result: list[T]):
+        if (any_child := node.children.get('#')) is not None:
+            result.extend(any_child.values)
+        if index == len(levels):
+            result.extend(node.values)
+            return
+        if (child := node.children.get(levels[index])) is not None:
+            self.__match(child, levels, index + 1, result)
+        if (single_child := node.children.get('+')) is not None:
+            self.__match(single_child, levels, index + 1, result)
+
+def topic_matches(filter: str, topic: str):
+    filter_levels = filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
@@ -1,12 +1,22 @@
+import asyncio, logging
 from collections.abc import Iterable
-from copy import copy
+from dataclasses import dataclass
+from datetime import datetime
 from decimal import Decimal
-from ..core import get_config_key, OperationMode, app_state, EventBox
+from typing import Callable, Generic, TypeVar
+from ..core import get_config_key, get_optional_config_key, OperationMode, app_state, EventBox
 
-from .mqtt import Mqtt
-from .singlecontroller import SingleController, HOMEBATTERY_CONFIG_KEY
+from .mqtt import Mqtt, MQTT_CONFIG_KEY
+from .singlecontroller import SingleController, HOMEBATTERY_CONFIG_KEY, SUBSCRIBED_TOPICS
 
+_AGGREGATION_TIMEOUT_CONFIG_KEY = 'aggregation_timeout'
 
+T = TypeVar('T', int, Decimal)
+
+@dataclass
+class Aggregate(Generic[T]):
+    value: T
+    missing: tuple[str, ...] # senders without data; only set if emitted because of the aggregation timeout
 
 class VirtualController:
     def __init__(self, config, mqtt: Mqtt):
@@ -23,19 +33,35 @@ class VirtualController:
             controller.subscribe_solar(self.__solar_data_handler)
             self.__controllers.append(controller)
 
-        self.__modes_actual: dict[str, OperationMode | None] = {x.name: None for x in self.__controllers}
-        app_state.data.actual_mode.set(copy(self.__modes_actual))
-        self.__locks: dict[str, tuple[str, ...]] = {x.name: tuple() for x in self.__controllers}
-
-        self.__capacities = AggregatedMessage(x.name for x in self.__controllers)
-        self.__charger_energies = AggregatedMessage(x.name for x in self.__controllers)
-        self.__inverter_energies = AggregatedMessage(x.name for x in self.__controllers)
-        self.__solar_energies = AggregatedMessage(x.name for x in self.__controllers)
+        if mqtt.use_wildcard_subscriptions:
+            for topic, qos in self.get_wildcard_subscriptions(x.root for x in self.__controllers):
+                mqtt.add_subscription(topic, qos)
 
-        self.__on_battery_capacity: EventBox[Decimal] = EventBox()
-        self.__charger_energy_callback: EventBox[int] = EventBox()
-        self.__inverter_energy_callback: EventBox[int] = EventBox()
-        self.__solar_energy_callback: EventBox[int] = EventBox()
+        self.__modes_actual: dict[str, OperationMode | None] = {x.name: None for x in self.__controllers}
+        # locks stay unknown until the first lock message of a controller, so they are not published before
+        self.__locks: dict[str, tuple[str, ...] | None] = {x.name: None for x in self.__controllers}
+        for name in self.__modes_actual:
+            app_state.data.actual_mode.set_item(name, None)
+        # mode and lock changes are published to the app state once per batch of MQTT messages, only for changed controllers
+        self.__dirty_modes: set[str] = set()
+        self.__dirty_locks: set[str] = set()
+        mqtt.on_batch_end.subscribe(self.__batch_end_handler)
+
+        self.__on_battery_capacity: EventBox[Aggregate[Decimal]] = EventBox()
+        self.__charger_energy_callback: EventBox[Aggregate[int]] = EventBox()
+        self.__inverter_energy_callback: EventBox[Aggregate[int]] = EventBox()
+        self.__solar_energy_callback: EventBox[Aggregate[int]] = EventBox()
+
+        timeout = get_optional_config_key(config, float, None, None, MQTT_CONFIG_KEY, _AGGREGATION_TIMEOUT_CONFIG_KEY)
+        names = tuple(x.name for x in self.__controllers)
+        self.__capacities = AggregatedMessage('battery capacity', names, timeout,
+            lambda x: self.__on_battery_capacity.fire(self, x))
+        self.__charger_energies = AggregatedMessage('charger energy', names, timeout,
+            lambda x: self.__charger_energy_callback.fire(self, x))
+        self.__inverter_energies = AggregatedMessage('inverter energy', names, timeout,
+            lambda x: self.__inverter_energy_callback.fire(self, x))
+        self.__solar_energies = AggregatedMessage('solar energy', names, timeout,
+            lambda x: self.__solar_energy_callback.fire(self, x))
 
     @property
     def controllers(self):
@@ -57,6 +83,16 @@ class VirtualController:
     def locks(self):
         return self.__locks
     
+    @property
+    def last_seen(self):
+        # latest battery or energy message per controller
+        result: dict[str, datetime | None] = {x.name: None for x in self.__controllers}
+        for aggregation in (self.__capacities, self.__charger_energies, self.__inverter_energies, self.__solar_energies):
+            for name, timestamp in aggregation.last_seen.items():
+                if timestamp is not None and (result[name] is None or timestamp > result[name]):
+                    result[name] = timestamp
+        return result
+
     @property
     def on_battery_capacity(self):
         return self.__on_battery_capacity
@@ -83,60 +119,95 @@ class VirtualController:
         for controller in controllers:
             controller.send_reset()
 
+    @staticmethod
+    def get_wildcard_subscriptions(roots: Iterable[str]):
+        # one subscription per topic suffix and parent topic, e.g. homebattery/+/cha/sum for all controllers below homebattery
+        parents = sorted(set(x.rpartition('/')[0] for x in roots))
+        for parent in parents:
+            prefix = f'{parent}/+' if parent else '+'
+            for suffix, qos in SUBSCRIBED_TOPICS:
+                yield f'{prefix}/{suffix}', qos
+
     def __mode_handler(self, sender: SingleController, mode: OperationMode):
         last_mode = self.__modes_actual.get(sender.name)
         if last_mode == mode:
             return
         self.__modes_actual[sender.name] = mode
-        app_state.data.actual_mode.set(copy(self.__modes_actual))
+        self.__dirty_modes.add(sender.name)
 
     def __locked_handler(self, sender: SingleController, locks: list[str]):
-        last_locks = self.__locks.get(sender.name)
-        if last_locks == locks:
+        new_locks = tuple(locks)
+        if self.__locks.get(sender.name) == new_locks:
             return
-        self.__locks[sender.name] = tuple(locks)
-        app_state.data.locks.set(copy(self.__locks))
+        self.__locks[sender.name] = new_locks
+        self.__dirty_locks.add(sender.name)
+
+    def __batch_end_handler(self, _ = None):
+        if self.__dirty_modes:
+            for name in self.__dirty_modes:
+                app_state.data.actual_mode.set_item(name, self.__modes_actual[name])
+            self.__dirty_modes.clear()
+        if self.__dirty_locks:
+            for name in self.__dirty_locks:
+                app_state.data.locks.set_item(name, self.__locks[name])
+            self.__dirty_locks.clear()
     
     def __battery_data_handler(self, sender: SingleController, capacity: Decimal):
         self.__capacities.add(sender.name, capacity)
-        if (total_capacity := self.__capacities.try_get()) is not None:
-            self.__on_battery_capacity.fire(self, total_capacity)
 
     def __charger_data_handler(self, sender: SingleController, energy: int | None):
-        if energy is not None:
-            self.__charger_energies.add(sender.name, energy)
-            if (total_energy := self.__charger_energies.try_get()) is not None:
-                self.__charger_energy_callback.fire(self, total_energy)
+        self.__charger_energies.add(sender.name, energy)
 
     def __inverter_data_handler(self, sender: SingleController, energy: int | None):
-        if energy is not None:
-            self.__inverter_energies.add(sender.name, energy)
-            if (total_energy := self.__inverter_energies.try_get()) is not None:
-                self.__inverter_energy_callback.fire(self, total_energy)
+        self.__inverter_energies.add(sender.name, energy)
 
     def __solar_data_handler(self, sender: SingleController, energy: int | None):
-        if energy is not None:
-            self.__solar_energies.add(sender.name, energy)
-            if (total_energy := self.__solar_energies.try_get()) is not None:
-                self.__solar_energy_callback.fire(self, total_energy)
-
-class AggregatedMessage:
-    def __init__(self, senders: Iterable[str]):
-        self.__senders = set(senders)
-        self.__messages: dict[str, int | Decimal] = {} # key: sender; value: value
+        self.__solar_energies.add(sender.name, energy)
+
+class AggregatedMessage(Generic[T]):
+    def __init__(self, name: str, senders: Iterable[str], timeout: float | None, callback: Callable[[Aggregate[T]], None]):
+        self.__name = name
+        self.__senders = tuple(senders)
+        self.__indices = {x: i for i, x in enumerate(self.__senders)}
+        self.__values: list[T | None] = [None] * len(self.__senders)
+        self.__count = 0
+        self.__last_seen: list[datetime | None] = [None] * len(self.__senders)
+        self.__timeout = timeout
+        self.__deadline: asyncio.TimerHandle | None = None
+        self.__callback = callback
 
     @property
     def is_ready(self):
-        return  not self.__senders.difference(self.__messages.keys())
+        return self.__count == len(self.__senders)
+
+    @property
+    def last_seen(self):
+        return dict(zip(self.__senders, self.__last_seen))
 
-    def add(self, sender: str, value: Decimal | int | None):
+    def add(self, sender: str, value: T | None):
         if value is None:
             return
-        self.__messages[sender] = value
-
-    def try_get(self):
-        if not self.is_ready:
-            return None
-        result = sum(self.__messages.values())
-        self.__messages.clear()
-        return result
+        index = self.__indices[sender]
+        self.__last_seen[index] = datetime.now()
+        if self.__values[index] is None:
+            self.__count += 1
+        self.__values[index] = value
+        if self.is_ready:
+            self.__emit()
+        elif self.__count == 1 and self.__timeout:
+            self.__deadline = asyncio.get_running_loop().call_later(self.__timeout, self.__deadline_handler)
+
+    def __deadline_handler(self):
+        self.__deadline = None
+        missing = tuple(x for x, y in zip(self.__senders, self.__values) if y is None)
+        logging.warning(f'Aggregation of {self.__name} timed out, missing data from: {", ".join(missing)}.')
+        self.__emit(missing)
+
+    def __emit(self, missing: tuple[str, ...] = tuple()):
+        if self.__deadline is not None:
+            self.__deadline.cancel()
+            self.__deadline = None
+        result = sum(x for x in self.__values if x is not None)
+        self.__values = [None] * len(self.__senders)
+        self.__count = 0
+        self.__callback(Aggregate(result, missing))